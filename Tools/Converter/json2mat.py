@@ -1,38 +1,44 @@
+import os
+import sys
 import scipy.io as sio
-import json
-import gzip
 import numpy as np
 
+# Il reader condiviso vive nella root del progetto (due livelli sopra)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from hermes_pose_io import iter_pose_batches, FIELD_BOXES, FIELD_CONF, FIELD_KEYPOINTS  # noqa: E402
+
 def convert_json_gz_to_mat(json_gz_path, mat_output_path):
     """
     Reads the hermes JSON.GZ stream and saves it as a .mat file
     compatible with Matlab structs.
     """
     frames_data = []
-    
-    # 1. Read Stream
-    with gzip.open(json_gz_path, 'rt', encoding='utf-8') as f:
-        for line in f:
-            frame_dict = json.loads(line)
-            # Matlab prefers specific structures. 
-            # We must ensure lists are converted to something Matlab understands.
-            
+
+    # 1. Read Stream (NumPy batches from the shared pose reader)
+    for batch in iter_pose_batches(json_gz_path, fields=(FIELD_BOXES, FIELD_CONF, FIELD_KEYPOINTS)):
+        # Matlab numbers are doubles
+        track_ids = batch.track_id.astype(np.float64)
+        confs = batch.conf.astype(np.float64)
+        boxes = batch.boxes.astype(np.float64)
+        keypoints = batch.keypoints.astype(np.float64)
+
+        for i in range(len(batch)):
             # Reformat detections for Matlab struct array compatibility
             clean_dets = []
-            for det in frame_dict.get('det', []):
+            for n in range(batch.det_offsets[i], batch.det_offsets[i + 1]):
                 clean_dets.append({
-                    'track_id': float(det['track_id']), # Matlab numbers are doubles
-                    'conf': float(det['conf']),
-                    'box': [det['box']['x1'], det['box']['y1'], det['box']['x2'], det['box']['y2']],
-                    'keypoints': np.array(det['keypoints']) # Convert list to numpy array
+                    'track_id': track_ids[n],
+                    'conf': confs[n],
+                    'box': boxes[n],
+                    'keypoints': keypoints[n] if batch.has_keypoints[n] else np.empty((0, 3))
                 })
-            
+
             frames_data.append({
-                'f_idx': frame_dict['f_idx'],
-                'ts': frame_dict['ts'],
+                'f_idx': int(batch.f_idx[i]),
+                'ts': float(batch.ts[i]),
                 'detections': clean_dets
             })
 
     # 2. Save to .mat
     # 'yolo_data' will be the variable name inside Matlab
-    sio.savemat(mat_output_path, {'yolo_data': frames_data}, do_compression=True)
\ No newline at end of file
+    sio.savemat(mat_output_path, {'yolo_data': frames_data}, do_compression=True)
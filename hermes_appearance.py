@@ -0,0 +1,472 @@
+"""
+Appearance data for the tracks of a pose file: embeddings (Entity stitching
+aid) and crop thumbnails (Entity track list).
+
+Embeddings are computed once per pose file, on CPU, and cached next to it as
+``<name>_yolo.appearance.npz``. They are keyed by the raw tracker IDs of the
+pose file, so they stay valid whatever merges / splits are done in Entity:
+the embedding of an edited track is the mean of its original fragments
+(see ``IdentityLogic._track_embeddings``).
+
+The video is decoded once, front to back, and crops are taken at a few
+representative frames of every track; no per-track seeking is done.
+
+Thumbnails are a strip of a few crops per track, JPEG-encoded and cached per
+video as ``<video>.thumbs.npz`` (keyed by the same raw track IDs).
+
+The encoder is OSNet-AIN (``osnet_ain_x1_0_ready.pt`` in the models folder)
+when ``torch`` and ``torchreid`` are installed, otherwise an HSV colour
+histogram of the upper / lower body halves.
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from hermes_pose_io import iter_pose_batches, resolve_track_ids, FIELD_BOXES, SYNTHETIC_ID_BASE
+
+try:
+    import torch
+    import torchreid  # Optional: OSNet architecture for the shipped ReID weights
+except ImportError:
+    torch = None
+    torchreid = None
+
+
+# ═══════════════════════════════════════════════════════════════════
+# CONSTANTS
+# ═══════════════════════════════════════════════════════════════════
+
+REID_MODEL_NAME = "osnet_ain_x1_0_ready.pt"
+HISTOGRAM_MODEL_NAME = "hsv_histogram"
+
+CACHE_SUFFIX = ".appearance.npz"
+THUMB_SUFFIX = ".thumbs.npz"
+
+# Crops smaller than this (px) carry too little appearance to be useful
+MIN_CROP_W = 12
+MIN_CROP_H = 24
+
+_IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+# ═══════════════════════════════════════════════════════════════════
+# ENCODERS
+# ═══════════════════════════════════════════════════════════════════
+
+def _l2_normalise(x):
+    norm = np.linalg.norm(x, axis=1, keepdims=True)
+    norm[norm == 0] = 1.0
+    return (x / norm).astype(np.float32)
+
+
+class OSNetEmbedder:
+    """OSNet-AIN person ReID encoder (512-d), CPU inference."""
+
+    name = REID_MODEL_NAME
+    input_size = (128, 256)  # (w, h)
+
+    def __init__(self, weights_path):
+        model = torchreid.models.build_model('osnet_ain_x1_0', num_classes=1, pretrained=False)
+        ckpt = torch.load(weights_path, map_location='cpu', weights_only=True)
+        state = ckpt.get('model', ckpt) if isinstance(ckpt, dict) else ckpt
+        state = {k[7:] if k.startswith("module.") else k: v for k, v in state.items()}
+        # The classifier head of the ready file has the training-set shape: skip it
+        own = model.state_dict()
+        state = {k: v for k, v in state.items() if k in own and own[k].shape == v.shape}
+        model.load_state_dict(state, strict=False)
+        model.eval()
+        self.model = model
+
+    def __call__(self, crops):
+        w, h = self.input_size
+        batch = np.empty((len(crops), h, w, 3), dtype=np.float32)
+        for i, crop in enumerate(crops):
+            rgb = cv2.cvtColor(cv2.resize(crop, (w, h), interpolation=cv2.INTER_LINEAR), cv2.COLOR_BGR2RGB)
+            batch[i] = rgb
+        batch = (batch / 255.0 - _IMAGENET_MEAN) / _IMAGENET_STD
+        with torch.no_grad():
+            feats = self.model(torch.from_numpy(batch.transpose(0, 3, 1, 2).copy()))
+        return _l2_normalise(feats.cpu().numpy())
+
+
+class HistogramEmbedder:
+    """Colour descriptor: HSV histograms of the upper and lower box halves (256-d)."""
+
+    name = HISTOGRAM_MODEL_NAME
+    bins = (8, 4, 4)
+
+    def __call__(self, crops):
+        out = np.empty((len(crops), 2 * int(np.prod(self.bins))), dtype=np.float32)
+        for i, crop in enumerate(crops):
+            hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
+            mid = hsv.shape[0] // 2
+            halves = [cv2.calcHist([part], [0, 1, 2], None, list(self.bins), [0, 180, 0, 256, 0, 256]).ravel()
+                      for part in (hsv[:mid], hsv[mid:])]
+            # Square root (Hellinger) so that cosine similarity compares distributions
+            out[i] = np.sqrt(np.concatenate(halves) / max(1, crop.shape[0] * crop.shape[1]))
+        return _l2_normalise(out)
+
+
+def load_embedder(models_dir=None):
+    """OSNet-AIN when its weights and dependencies are available, else the histogram encoder."""
+    if torch is not None and models_dir:
+        weights = os.path.join(models_dir, REID_MODEL_NAME)
+        if os.path.exists(weights):
+            try:
+                return OSNetEmbedder(weights)
+            except Exception as e:
+                print(f"[Appearance] Unable to load {REID_MODEL_NAME}: {e}. Using colour histograms.")
+    return HistogramEmbedder()
+
+
+# ═══════════════════════════════════════════════════════════════════
+# SAMPLING / DECODING
+# ═══════════════════════════════════════════════════════════════════
+
+def sample_track_boxes(pose_path, samples_per_track=4):
+    """
+    Pick evenly spaced detections of every tracked ID in a pose file.
+
+    Untracked (synthetic) IDs and boxes below MIN_CROP_W x MIN_CROP_H are skipped.
+    Track ends are avoided, since that is where occlusions usually start.
+
+    Returns
+    -------
+    tids : ndarray[int64] (T,)
+        Sorted track IDs with at least one sample.
+    owner : ndarray[int64] (S,)
+        Index into ``tids`` of every sample.
+    frames : ndarray[int64] (S,)
+    boxes : ndarray[float32] (S, 4)
+        Samples are sorted by frame.
+    """
+    tid_chunks, frame_chunks, box_chunks = [], [], []
+    for batch in iter_pose_batches(pose_path, fields=(FIELD_BOXES,)):
+        if not batch.n_detections:
+            continue
+        tids = resolve_track_ids(batch)
+        b = batch.boxes
+        ok = (tids < SYNTHETIC_ID_BASE) & ((b[:, 2] - b[:, 0]) >= MIN_CROP_W) & ((b[:, 3] - b[:, 1]) >= MIN_CROP_H)
+        tid_chunks.append(tids[ok])
+        frame_chunks.append(batch.det_frame[ok])
+        box_chunks.append(b[ok])
+    if not tid_chunks:
+        return (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64),
+                np.empty((0, 4), np.float32))
+
+    all_tids = np.concatenate(tid_chunks)
+    all_frames = np.concatenate(frame_chunks)
+    all_boxes = np.concatenate(box_chunks)
+
+    order = np.lexsort((all_frames, all_tids))
+    tids, start, count = np.unique(all_tids[order], return_index=True, return_counts=True)
+    k = np.arange(samples_per_track)
+    pos = start[:, None] + ((k[None, :] + 0.5) * count[:, None] / samples_per_track).astype(np.int64)
+    owner = np.repeat(np.arange(len(tids)), samples_per_track)
+    pos, first = np.unique(pos.ravel(), return_index=True)  # short tracks: drop repeats
+    owner = owner[first]
+
+    rows = order[pos]
+    by_frame = np.argsort(all_frames[rows], kind='stable')
+    rows, owner = rows[by_frame], owner[by_frame]
+    return tids, owner, all_frames[rows].astype(np.int64), all_boxes[rows]
+
+
+def iter_video_frames(video_path, frames):
+    """
+    Decode a video front to back and yield ``(frame_index, image)`` for the
+    requested frames (sorted, unique). Frames in between are only grabbed.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Unable to open video: {video_path}")
+    try:
+        pos = 0
+        for f in frames:
+            while pos < f:
+                if not cap.grab():
+                    return
+                pos += 1
+            ok, image = cap.read()
+            if not ok:
+                return
+            pos += 1
+            yield f, image
+    finally:
+        cap.release()
+
+
+# ═══════════════════════════════════════════════════════════════════
+# CACHE
+# ═══════════════════════════════════════════════════════════════════
+
+def _pose_base(pose_path):
+    return pose_path[:-len(".json.gz")] if pose_path.endswith(".json.gz") else os.path.splitext(pose_path)[0]
+
+
+def appearance_cache_path(pose_path):
+    return _pose_base(pose_path) + CACHE_SUFFIX
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def load_appearance_cache(pose_path):
+    """
+    Return ``(tids, embeddings, model_name)`` from the cache of ``pose_path``,
+    or None when missing or written for a different version of the pose file.
+    """
+    path = appearance_cache_path(pose_path)
+    if not os.path.exists(path) or not os.path.exists(pose_path):
+        return None
+    try:
+        with np.load(path) as data:
+            if not np.array_equal(data['signature'], _file_signature(pose_path)):
+                return None
+            return data['tids'], data['embeddings'], str(data['model'])
+    except (OSError, KeyError, ValueError) as e:
+        print(f"[Appearance] Cache unusable: {e}")
+        return None
+
+
+def save_appearance_cache(pose_path, tids, embeddings, model_name):
+    """Write the cache atomically (temporary file + rename)."""
+    path = appearance_cache_path(pose_path)
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, tids=tids, embeddings=embeddings, model=np.array(model_name),
+                 signature=_file_signature(pose_path))
+    os.replace(tmp, path)
+
+
+# ═══════════════════════════════════════════════════════════════════
+# PUBLIC API
+# ═══════════════════════════════════════════════════════════════════
+
+def extract_appearance(pose_path, video_path, models_dir=None, samples_per_track=4, batch_size=64,
+                       progress=None, cancel=None, use_cache=True):
+    """
+    Compute (or load from cache) one appearance embedding per track.
+
+    Parameters
+    ----------
+    pose_path, video_path : str
+    models_dir : str | None
+        Folder holding ``osnet_ain_x1_0_ready.pt``.
+    samples_per_track : int
+        Crops averaged into each track embedding.
+    batch_size : int
+        Crops per encoder call.
+    progress : callable(float) | None
+        Called with the fraction of the video decoded so far.
+    cancel : threading.Event | None
+        Stops the extraction (returns None) when set.
+    use_cache : bool
+
+    Returns
+    -------
+    (tids, embeddings, model_name) | None
+        ``tids`` int64 (T,) sorted, ``embeddings`` float32 (T, D) L2-normalised.
+        Tracks without a usable crop are left out.
+    """
+    if use_cache:
+        cached = load_appearance_cache(pose_path)
+        if cached is not None:
+            return cached
+
+    embedder = load_embedder(models_dir)
+    tids, owner, frames, boxes = sample_track_boxes(pose_path, samples_per_track)
+    sums = None
+    counts = np.zeros(len(tids), dtype=np.int64)
+    crops, crop_owner = [], []
+
+    def flush():
+        nonlocal sums
+        if not crops:
+            return
+        feats = embedder(crops)
+        if sums is None:
+            sums = np.zeros((len(tids), feats.shape[1]), dtype=np.float64)
+        np.add.at(sums, np.asarray(crop_owner), feats)
+        np.add.at(counts, np.asarray(crop_owner), 1)
+        crops.clear()
+        crop_owner.clear()
+
+    uniq_frames, first = np.unique(frames, return_index=True)
+    bounds = np.append(first, len(frames))
+    last = max(1, int(uniq_frames[-1])) if len(uniq_frames) else 1
+    for i, (f, image) in enumerate(iter_video_frames(video_path, uniq_frames.tolist())):
+        if cancel is not None and cancel.is_set():
+            return None
+        h, w = image.shape[:2]
+        for r in range(bounds[i], bounds[i + 1]):
+            x1, y1, x2, y2 = np.round(boxes[r]).astype(int).tolist()
+            x1, y1, x2, y2 = max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+            if x2 - x1 >= MIN_CROP_W and y2 - y1 >= MIN_CROP_H:
+                crops.append(image[y1:y2, x1:x2])
+                crop_owner.append(int(owner[r]))
+        if len(crops) >= batch_size:
+            flush()
+            if progress is not None:
+                progress(f / last)
+    flush()
+
+    found = counts > 0
+    if sums is None or not found.any():
+        return np.empty(0, np.int64), np.empty((0, 0), np.float32), embedder.name
+    tids, embeddings = tids[found], _l2_normalise(sums[found])
+    if progress is not None:
+        progress(1.0)
+    try:
+        save_appearance_cache(pose_path, tids, embeddings, embedder.name)
+    except OSError as e:
+        print(f"[Appearance] Unable to write cache: {e}")
+    return tids, embeddings, embedder.name
+
+
+# ═══════════════════════════════════════════════════════════════════
+# THUMBNAILS
+# ═══════════════════════════════════════════════════════════════════
+
+def thumbnail_cache_path(video_path, pose_path):
+    """Next to the video, named after both files: several pose files of one
+    video keep their own cache."""
+    return f"{os.path.splitext(video_path)[0]}.{os.path.basename(_pose_base(pose_path))}{THUMB_SUFFIX}"
+
+
+def _fit(crop, w, h):
+    """Resize a crop into a w x h cell keeping its aspect ratio (grey padding)."""
+    ch, cw = crop.shape[:2]
+    scale = min(w / cw, h / ch)
+    nw, nh = max(1, int(round(cw * scale))), max(1, int(round(ch * scale)))
+    cell = np.full((h, w, 3), 128, dtype=np.uint8)
+    x0, y0 = (w - nw) // 2, (h - nh) // 2
+    cell[y0:y0 + nh, x0:x0 + nw] = cv2.resize(crop, (nw, nh), interpolation=cv2.INTER_AREA)
+    return cell
+
+
+def load_thumbnail_cache(video_path, pose_path):
+    """
+    Return ``{track_id: jpeg_bytes}`` from the thumbnail cache of ``video_path``
+    and ``pose_path``, or None when missing or built from different files.
+    """
+    path = thumbnail_cache_path(video_path, pose_path)
+    if not os.path.exists(path) or not os.path.exists(pose_path):
+        return None
+    try:
+        with np.load(path) as data:
+            if (not np.array_equal(data['video_signature'], _file_signature(video_path))
+                    or not np.array_equal(data['pose_signature'], _file_signature(pose_path))):
+                return None
+            blob = data['blob'].tobytes()
+            offsets = data['offsets'].tolist()
+            return {tid: blob[offsets[i]:offsets[i + 1]] for i, tid in enumerate(data['tids'].tolist())}
+    except (OSError, KeyError, ValueError) as e:
+        print(f"[Thumbnails] Cache unusable: {e}")
+        return None
+
+
+def save_thumbnail_cache(video_path, pose_path, thumbs):
+    """Write ``{track_id: jpeg_bytes}`` atomically as one blob + offsets."""
+    tids = sorted(thumbs)
+    sizes = np.array([len(thumbs[t]) for t in tids], dtype=np.int64)
+    offsets = np.zeros(len(tids) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    blob = np.frombuffer(b"".join(thumbs[t] for t in tids), dtype=np.uint8)
+    path = thumbnail_cache_path(video_path, pose_path)
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, tids=np.asarray(tids, dtype=np.int64), offsets=offsets, blob=blob,
+                 video_signature=_file_signature(video_path), pose_signature=_file_signature(pose_path))
+    os.replace(tmp, path)
+
+
+def extract_thumbnails(pose_path, video_path, per_track=3, cell_size=(24, 48), progress=None,
+                       cancel=None, use_cache=True):
+    """
+    Build (or load from cache) a thumbnail strip for every track.
+
+    Parameters
+    ----------
+    pose_path, video_path : str
+    per_track : int
+        Crops per strip (evenly spaced over the track).
+    cell_size : tuple(int, int)
+        (w, h) of each crop in the strip.
+    progress : callable(float) | None
+        Called with the fraction of the video decoded so far.
+    cancel : threading.Event | None
+        Stops the extraction (returns None) when set.
+    use_cache : bool
+
+    Returns
+    -------
+    dict[int, bytes] | None
+        JPEG-encoded strips (h x per_track*w) keyed by raw track ID.
+    """
+    if use_cache:
+        cached = load_thumbnail_cache(video_path, pose_path)
+        if cached is not None:
+            return cached
+
+    tids, owner, frames, boxes = sample_track_boxes(pose_path, per_track)
+    w, h = cell_size
+    # A strip is encoded as soon as its last sample is decoded
+    last_sample = np.zeros(len(tids), dtype=np.int64)
+    np.maximum.at(last_sample, owner, np.arange(len(owner)))
+    open_strips = {}
+    filled = {}
+    thumbs = {}
+
+    uniq_frames, first = np.unique(frames, return_index=True)
+    bounds = np.append(first, len(frames))
+    last = max(1, int(uniq_frames[-1])) if len(uniq_frames) else 1
+    step = max(1, len(uniq_frames) // 100)
+
+    def encode(o):
+        ok, buf = cv2.imencode(".jpg", open_strips.pop(o), [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if ok and filled.pop(o):
+            thumbs[int(tids[o])] = buf.tobytes()
+
+    decoded = 0
+    for i, (f, image) in enumerate(iter_video_frames(video_path, uniq_frames.tolist())):
+        if cancel is not None and cancel.is_set():
+            return None
+        decoded = i + 1
+        ih, iw = image.shape[:2]
+        for r in range(bounds[i], bounds[i + 1]):
+            o = int(owner[r])
+            strip = open_strips.get(o)
+            if strip is None:
+                strip = open_strips[o] = np.full((h, per_track * w, 3), 128, dtype=np.uint8)
+                filled[o] = 0
+            x1, y1, x2, y2 = np.round(boxes[r]).astype(int).tolist()
+            x1, y1, x2, y2 = max(0, x1), max(0, y1), min(iw, x2), min(ih, y2)
+            if x2 > x1 and y2 > y1:
+                k = filled[o]
+                strip[:, k * w:(k + 1) * w] = _fit(image[y1:y2, x1:x2], w, h)
+                filled[o] = k + 1
+            if r == last_sample[o]:
+                encode(o)
+        if progress is not None and i % step == 0:
+            progress(f / last)
+
+    # The video ended before the last sampled frames: keep the partial strips,
+    # but do not cache an incomplete result
+    for o in list(open_strips):
+        encode(o)
+    if progress is not None:
+        progress(1.0)
+    if decoded < len(uniq_frames):
+        print(f"[Thumbnails] Video ended at sample {decoded} of {len(uniq_frames)}: cache not written.")
+        return thumbs
+    try:
+        save_thumbnail_cache(video_path, pose_path, thumbs)
+    except OSError as e:
+        print(f"[Thumbnails] Unable to write cache: {e}")
+    return thumbs
@@ -2,114 +2,270 @@ import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, simpledialog, colorchooser
 import cv2
 import json
-import gzip
 import os
 import random
-import math
+import numpy as np
 from PIL import Image, ImageTk
-import pickle
-import tempfile
-import shutil
+from scipy.optimize import Bounds, LinearConstraint, linear_sum_assignment, milp
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 import time
 import threading
 import queue
+from collections import OrderedDict
 from typing import Optional, Dict, List, Tuple, Any, Set
 
+from hermes_pose_io import iter_pose_batches, resolve_track_ids, FIELD_BOXES, SYNTHETIC_ID_BASE
+from hermes_appearance import extract_appearance, load_appearance_cache, extract_thumbnails
+from hermes_role_rules import parse_rules, evaluate_rules, uses_frame_size
+
+
+# ------------------------------------------------------------------ #
+#  TRACK STORE                                                         #
+# ------------------------------------------------------------------ #
+# Each track is a dict {'frames', 'boxes', 'role', 'merged_from'} where
+# 'frames' is a sorted int32 array (N,) and 'boxes' a float32 array (N, 4).
+# Arrays are never modified in place: operations build new arrays, so
+# snapshots can share them safely.
+FRAME_DTYPE = np.int32
+BOX_DTYPE = np.float32
+
+# A track not seen for this long during a progressive load is final
+TRACK_CLOSE_GAP_S = 10.0
+
+
+def make_track(frames: Any, boxes: Any, role: str = 'Ignore', merged_from: Optional[List[int]] = None) -> dict:
+    return {
+        'frames': np.asarray(frames, dtype=FRAME_DTYPE).reshape(-1),
+        'boxes': np.asarray(boxes, dtype=BOX_DTYPE).reshape(-1, 4),
+        'role': role,
+        'merged_from': list(merged_from) if merged_from is not None else [],
+    }
+
+
+def track_box_at(track: dict, frame: int) -> Optional[np.ndarray]:
+    """Returns the box of `track` at `frame` (binary search), or None."""
+    frames = track['frames']
+    i = int(np.searchsorted(frames, frame))
+    if i < len(frames) and frames[i] == frame:
+        return track['boxes'][i]
+    return None
+
+
+def merge_sorted_tracks(frames_a: np.ndarray, boxes_a: np.ndarray,
+                        frames_b: np.ndarray, boxes_b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Linear merge of two frame-sorted tracks. On equal frames, rows of A come first."""
+    if len(frames_b) == 0:
+        return frames_a, boxes_a
+    if len(frames_a) == 0:
+        return frames_b, boxes_b
+    if frames_b[0] > frames_a[-1]:
+        return np.concatenate((frames_a, frames_b)), np.concatenate((boxes_a, boxes_b))
+    if frames_b[-1] < frames_a[0]:
+        return np.concatenate((frames_b, frames_a)), np.concatenate((boxes_b, boxes_a))
+
+    n = len(frames_a) + len(frames_b)
+    pos_b = np.searchsorted(frames_a, frames_b, side='right') + np.arange(len(frames_b))
+    from_a = np.ones(n, dtype=bool)
+    from_a[pos_b] = False
+    frames = np.empty(n, dtype=FRAME_DTYPE)
+    boxes = np.empty((n, 4), dtype=BOX_DTYPE)
+    frames[pos_b] = frames_b
+    boxes[pos_b] = boxes_b
+    frames[from_a] = frames_a
+    boxes[from_a] = boxes_a
+    return frames, boxes
+
+
+def tracks_from_json(data: Dict[Any, dict]) -> Dict[int, dict]:
+    """Builds the track store from JSON lists (legacy full-state autosave files)."""
+    return {
+        int(tid): make_track(d.get('frames', []), d.get('boxes', []),
+                             d.get('role', 'Ignore'), d.get('merged_from', [int(tid)]))
+        for tid, d in data.items()
+    }
+
 
 class HistoryManager:
-    def __init__(self, max_history: int = 20, ram_buffer: int = 5):
+    """Undo/redo stacks of track deltas produced by IdentityLogic transactions.
+
+    Each entry holds only the tracks and lineage keys an operation touched,
+    before and after, so push, undo and redo cost is proportional to the
+    change. The oldest entries are dropped when either `max_history` steps
+    or `memory_budget_mb` (estimated from the referenced arrays) is exceeded."""
+    def __init__(self, max_history: int = 500, memory_budget_mb: int = 512):
         self.max_history: int = max_history
-        self.ram_buffer: int = ram_buffer
-        self.temp_dir: str = tempfile.mkdtemp(prefix="hermes_history_")
+        self.memory_budget: int = memory_budget_mb * 1024 * 1024
         self.undo_stack: List[dict] = []
         self.redo_stack: List[dict] = []
-        self.current_state: Optional[dict] = None
-
-    def push_state(self, data: Any) -> None:
-        blob = pickle.dumps(data)
-        timestamp = time.time_ns()
-        new_entry = {'type': 'ram', 'blob': blob, 'timestamp': timestamp}
-
-        if self.current_state:
-            self.undo_stack.append(self.current_state)
-
-        self.current_state = new_entry
-
-        self._clear_stack(self.redo_stack)
+        self.used_bytes: int = 0
+
+    @staticmethod
+    def _delta_nbytes(delta: dict) -> int:
+        seen: Set[int] = set()
+        total = 0
+        for states in delta['tracks']:
+            for d in states.values():
+                total += 200
+                if d is None:
+                    continue
+                for arr in (d['frames'], d['boxes']):
+                    if id(arr) not in seen:
+                        seen.add(id(arr))
+                        total += arr.nbytes
+        total += 100 * len(delta['lineage'][0])
+        return total
+
+    def push(self, delta: dict) -> None:
+        delta['nbytes'] = self._delta_nbytes(delta)
+        self.undo_stack.append(delta)
+        self.used_bytes += delta['nbytes']
+        for entry in self.redo_stack:
+            self.used_bytes -= entry['nbytes']
         self.redo_stack = []
+        while self.undo_stack and (len(self.undo_stack) > self.max_history or
+                                   (self.used_bytes > self.memory_budget and len(self.undo_stack) > 1)):
+            self.used_bytes -= self.undo_stack.pop(0)['nbytes']
 
-        ram_slots_for_stack = self.ram_buffer - 1
-        if len(self.undo_stack) > ram_slots_for_stack:
-            idx_to_spill = len(self.undo_stack) - 1 - ram_slots_for_stack
-            if idx_to_spill >= 0:
-                self._spill_to_disk(self.undo_stack[idx_to_spill])
-
-        if len(self.undo_stack) > self.max_history:
-            oldest = self.undo_stack.pop(0)
-            self._delete_entry(oldest)
-
-    def undo(self) -> Optional[Any]:
+    def undo(self) -> Optional[dict]:
         if not self.undo_stack:
             return None
+        delta = self.undo_stack.pop()
+        self.redo_stack.append(delta)
+        return delta
 
-        if self.current_state:
-            self.redo_stack.append(self.current_state)
-
-        self.current_state = self.undo_stack.pop()
-        return self._load_entry(self.current_state)
-
-    def redo(self) -> Optional[Any]:
+    def redo(self) -> Optional[dict]:
         if not self.redo_stack:
             return None
+        delta = self.redo_stack.pop()
+        self.undo_stack.append(delta)
+        return delta
 
-        if self.current_state:
-            self.undo_stack.append(self.current_state)
-
-        self.current_state = self.redo_stack.pop()
-        return self._load_entry(self.current_state)
-
-    def _spill_to_disk(self, entry: dict) -> None:
-        if entry['type'] == 'ram':
-            filename = os.path.join(self.temp_dir, f"state_{entry['timestamp']}.pkl")
-            try:
-                with open(filename, 'wb') as f:
-                    f.write(entry['blob'])
-                entry['type'] = 'disk'
-                entry['path'] = filename
-                entry['blob'] = None
-            except Exception as e:
-                print(f"History Spill Error: {e}")
+    def clear(self) -> None:
+        self.undo_stack = []
+        self.redo_stack = []
+        self.used_bytes = 0
+
+
+class OperationJournal:
+    """Append-only JSONL journal of the operations applied to a session.
+
+    Lines are 'header' (pose/video paths the session was loaded from),
+    'op' (one IdentityLogic.apply_operation call, or undo/redo) and
+    'checkpoint' (a compact .npz state written next to the journal).
+    Each line is flushed and fsynced: entries are a few hundred bytes
+    and user-paced, so this costs well under a frame.
+    Recovery restores the latest checkpoint, or the pose file, and
+    replays the ops that follow it."""
+    def __init__(self, path: str):
+        self.path: str = path
+        self.checkpoint_path: str = os.path.splitext(path)[0] + ".checkpoint.npz"
+        self.lock: threading.Lock = threading.Lock()
+        self.seq: int = 0
+        self.checkpoint_seq: int = 0
+        # Bumped whenever the journal is started, resumed or closed, so that a
+        # checkpoint computed for an earlier session is never recorded
+        self.generation: int = 0
+        self._fh: Optional[Any] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._fh is not None
+
+    def start(self, pose_path: str, video_path: Optional[str], checkpoint_base: bool = False) -> None:
+        """Starts a new journal for a freshly loaded session (truncates any previous one).
+        With checkpoint_base, recovery must start from a checkpoint (no pose replay)."""
+        self.close()
+        self._remove_checkpoint()
+        with self.lock:
+            self.generation += 1
+            self.seq = 0
+            self.checkpoint_seq = 0
+            self._fh = open(self.path, 'w', encoding='utf-8')
+            self._write({'type': 'header', 'version': 1, 'time': time.time(), 'pose_path': pose_path,
+                         'video_path': video_path, 'checkpoint_base': checkpoint_base})
+
+    def resume(self, seq: int, checkpoint_seq: int) -> None:
+        """Continues appending to a recovered journal."""
+        self.close()
+        with self.lock:
+            self.generation += 1
+            self.seq = seq
+            self.checkpoint_seq = checkpoint_seq
+            self._fh = open(self.path, 'a', encoding='utf-8')
 
-    def _load_entry(self, entry: dict) -> Optional[Any]:
-        try:
-            if entry['type'] == 'ram':
-                return pickle.loads(entry['blob'])
-            else:
-                with open(entry['path'], 'rb') as f:
-                    return pickle.load(f)
-        except Exception as e:
-            print(f"History Load Error: {e}")
-            return None
+    def append(self, op: dict) -> None:
+        with self.lock:
+            if self._fh is None:
+                return
+            self.seq += 1
+            self._write(dict(op, type='op', seq=self.seq, time=time.time()))
+
+    def write_checkpoint(self, state: Dict[str, np.ndarray], seq: int, generation: Optional[int] = None) -> bool:
+        """Writes the packed state atomically, then records it in the journal.
+        Safe to call from a worker thread: pass the `generation` read when the
+        state was packed. The checkpoint is discarded (False) if the journal
+        was restarted, resumed or closed since, or a later one was recorded."""
+        if generation is None:
+            generation = self.generation
+        tmp_path = f"{self.checkpoint_path}.{threading.get_ident()}.tmp.npz"
+        np.savez(tmp_path, seq=np.int64(seq), **state)
+        with self.lock:
+            if self._fh is None or generation != self.generation or seq < self.checkpoint_seq:
+                os.remove(tmp_path)
+                return False
+            os.replace(tmp_path, self.checkpoint_path)
+            self.checkpoint_seq = seq
+            self._write({'type': 'checkpoint', 'seq': seq, 'time': time.time()})
+            return True
+
+    def close(self, delete: bool = False) -> None:
+        with self.lock:
+            self.generation += 1
+            if self._fh is not None:
+                try:
+                    self._fh.close()
+                except OSError:
+                    pass
+                self._fh = None
+        if delete:
+            self._remove_checkpoint()
+            if os.path.exists(self.path):
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
 
-    def _delete_entry(self, entry: dict) -> None:
-        if entry['type'] == 'disk' and os.path.exists(entry['path']):
+    def _remove_checkpoint(self) -> None:
+        if os.path.exists(self.checkpoint_path):
             try:
-                os.remove(entry['path'])
+                os.remove(self.checkpoint_path)
             except OSError:
                 pass
 
-    def _clear_stack(self, stack: List[dict]) -> None:
-        for entry in stack:
-            self._delete_entry(entry)
-        del stack[:]
-            
-    def __del__(self) -> None:
-        try:
-            temp_dir = getattr(self, "temp_dir", None)
-            if temp_dir and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-        except OSError:
-            pass
+    def _write(self, entry: dict) -> None:
+        self._fh.write(json.dumps(entry) + "\n")
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    @staticmethod
+    def read(path: str) -> Tuple[Optional[dict], List[dict], Optional[dict]]:
+        """Returns (header, ops, last checkpoint entry). A torn last line is ignored."""
+        header, ops, checkpoint = None, [], None
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                kind = entry.get('type')
+                if kind == 'header':
+                    header = entry
+                elif kind == 'op':
+                    ops.append(entry)
+                elif kind == 'checkpoint':
+                    checkpoint = entry
+        return header, ops, checkpoint
 
 
 class IdentityLogic:
@@ -124,6 +280,24 @@ class IdentityLogic:
         self.audit_log: List[dict] = []
         self.fps: float = fps
         self.lock: threading.RLock = threading.RLock()
+        # frame -> ids of the tracks with a detection at that frame
+        self.frame_index: Dict[int, Set[int]] = {}
+        # Bumped on every change of the track data (cache key for the views)
+        self.version: int = 0
+        # Pre-operation state of the tracks / lineage keys touched by the
+        # open transaction (None when no transaction is open)
+        self._txn_tracks: Optional[Dict[int, Optional[dict]]] = None
+        self._txn_lineage: Optional[Dict[int, Optional[int]]] = None
+        self._txn_log_start: int = 0
+        # Per-track summary arrays (see get_track_summary) and the IDs changed
+        # since they were built; None forces a full rebuild
+        self._summary: Optional[Dict[str, np.ndarray]] = None
+        self._summary_dirty: Set[int] = set()
+        # First frame not loaded yet during a progressive load (None: complete)
+        self.loaded_until: Optional[int] = None
+        # Appearance embeddings of the original pose-file track IDs (sorted)
+        self.appearance_ids: np.ndarray = np.empty(0, dtype=np.int64)
+        self.appearance: np.ndarray = np.empty((0, 0), dtype=np.float32)
 
     def set_fps(self, fps: float) -> None:
         self.fps = fps
@@ -138,8 +312,295 @@ class IdentityLogic:
 
     def set_data(self, tracks: Dict[int, dict], id_lineage: Dict[int, int]) -> None:
         with self.lock:
+            old_tracks = self.tracks
             self.tracks = tracks
             self.id_lineage = id_lineage
+            self.version += 1
+            self._summary = None
+            # Re-index only the tracks whose frames differ from the current state
+            for tid, d in old_tracks.items():
+                new = tracks.get(tid)
+                if new is None or not np.array_equal(new['frames'], d['frames']):
+                    self._index_remove(tid, d['frames'])
+            for tid, d in tracks.items():
+                old = old_tracks.get(tid)
+                if old is None or not np.array_equal(old['frames'], d['frames']):
+                    self._index_add(tid, d['frames'])
+
+    # ------------------------------------------------------------------ #
+    #  TRANSACTIONS (UNDO / REDO)                                          #
+    # ------------------------------------------------------------------ #
+    def begin_transaction(self) -> None:
+        """Starts recording the tracks touched by the following operations."""
+        with self.lock:
+            self._txn_tracks = {}
+            self._txn_lineage = {}
+            self._txn_log_start = len(self.audit_log)
+
+    def end_transaction(self) -> Optional[dict]:
+        """Closes the transaction and returns its delta (None if nothing changed).
+        Track states are shallow dict copies: arrays are shared, never mutated."""
+        with self.lock:
+            before_t, before_l = self._txn_tracks, self._txn_lineage
+            self._txn_tracks = self._txn_lineage = None
+            if not before_t and not before_l:
+                return None
+            after_t = {tid: dict(self.tracks[tid]) if tid in self.tracks else None for tid in before_t}
+            after_l = {oid: self.id_lineage.get(oid) for oid in before_l}
+            actions = [e['action'] for e in self.audit_log[self._txn_log_start:]]
+            return {'action': ", ".join(actions) or "Edit", 'tracks': (before_t, after_t), 'lineage': (before_l, after_l)}
+
+    def apply_delta(self, delta: dict, undo: bool = True) -> None:
+        """Restores the 'before' (undo) or 'after' (redo) side of a delta."""
+        side = 0 if undo else 1
+        with self.lock:
+            self._summary_dirty.update(delta['tracks'][side])
+            for tid, d in delta['tracks'][side].items():
+                old = self.tracks.get(tid)
+                same_frames = old is not None and d is not None and old['frames'] is d['frames']
+                if old is not None and not same_frames:
+                    self._index_remove(tid, old['frames'])
+                if d is None:
+                    self.tracks.pop(tid, None)
+                    continue
+                if not same_frames:
+                    self._index_add(tid, d['frames'])
+                self.tracks[tid] = dict(d)
+            for oid, master in delta['lineage'][side].items():
+                if master is None:
+                    self.id_lineage.pop(oid, None)
+                else:
+                    self.id_lineage[oid] = master
+            self._log_operation("Undo" if undo else "Redo", {"action": delta['action']})
+
+    # ------------------------------------------------------------------ #
+    #  JOURNALED OPERATIONS                                                #
+    # ------------------------------------------------------------------ #
+    def apply_operation(self, op: dict) -> Any:
+        """Runs one operation described by a plain dict (as stored in the
+        OperationJournal). Role sets travel as lists of names."""
+        kind = op['op']
+        if kind == 'assign_role':
+            return self.assign_role_to_ids(op['ids'], op['role'])
+        if kind == 'assign_roles':
+            by_role: Dict[str, List[int]] = {}
+            for tid, role in op['mapping'].items():
+                by_role.setdefault(role, []).append(int(tid))
+            for role, ids in by_role.items():
+                self.assign_role_to_ids(ids, role)
+            return len(op['mapping'])
+        if kind == 'role_rules':
+            return self.apply_role_rules(op['rules'], tuple(op['frame_size']), op['only_unassigned'])
+        if kind == 'merge':
+            return self.manual_merge(op['ids'], dict.fromkeys(op['valid_roles']))
+        if kind == 'merge_all_by_role':
+            return self.merge_all_by_role(dict.fromkeys(op['roles']))
+        if kind == 'split':
+            return self.split_track(op['track_id'], op['split_frame'], op['keep_head'])
+        if kind == 'auto_stitch':
+            return self.auto_stitch(op['lookahead'], op['time_gap'], op['stitch_dist'],
+                                    op.get('appearance_weight', 0.0))
+        if kind == 'absorb_noise':
+            return self.absorb_noise(dict.fromkeys(op['roles']), op['noise_dist'], op['time_gap'])
+        raise ValueError(f"Unknown operation: {kind}")
+
+    def replay_operations(self, ops: List[dict], history: HistoryManager) -> int:
+        """Re-applies journaled ops (including undo/redo) as the view did,
+        keeping their original audit timestamps. Returns the number of
+        undo/redo entries that found nothing to apply."""
+        misses = 0
+        for op in ops:
+            log_start = len(self.audit_log)
+            if op['op'] in ('undo', 'redo'):
+                delta = history.undo() if op['op'] == 'undo' else history.redo()
+                if delta is None:
+                    misses += 1
+                else:
+                    self.apply_delta(delta, undo=op['op'] == 'undo')
+            else:
+                self.begin_transaction()
+                self.apply_operation(op)
+                delta = self.end_transaction()
+                if delta is not None:
+                    history.push(delta)
+            for entry in self.audit_log[log_start:]:
+                entry['timestamp'] = op.get('time', entry['timestamp'])
+        return misses
+
+    def pack_state(self) -> Dict[str, np.ndarray]:
+        """Flat-array form of the session state, for journal checkpoints."""
+        with self.lock:
+            tr = list(self.tracks.values())
+            return {
+                'tids': np.fromiter(self.tracks.keys(), dtype=np.int64, count=len(tr)),
+                'lengths': np.array([len(d['frames']) for d in tr], dtype=np.int64),
+                'frames': np.concatenate([d['frames'] for d in tr]) if tr else np.empty(0, FRAME_DTYPE),
+                'boxes': np.concatenate([d['boxes'] for d in tr]) if tr else np.empty((0, 4), BOX_DTYPE),
+                'roles': np.array([d['role'] for d in tr], dtype=str),
+                'merged_lengths': np.array([len(d['merged_from']) for d in tr], dtype=np.int64),
+                'merged_from': np.array([o for d in tr for o in d['merged_from']], dtype=np.int64),
+                'lineage': np.array(list(self.id_lineage.items()), dtype=np.int64).reshape(-1, 2),
+                'audit_log': np.array(json.dumps(self.audit_log)),
+            }
+
+    def unpack_state(self, data: Any) -> None:
+        """Inverse of pack_state (accepts the mapping returned by np.load)."""
+        tids = data['tids'].tolist()
+        cuts = np.cumsum(data['lengths'])[:-1]
+        frames = np.split(data['frames'].astype(FRAME_DTYPE), cuts)
+        boxes = np.split(data['boxes'].astype(BOX_DTYPE), cuts)
+        merged = np.split(data['merged_from'], np.cumsum(data['merged_lengths'])[:-1])
+        roles = data['roles'].tolist()
+        tracks = {tid: {'frames': frames[i], 'boxes': boxes[i], 'role': roles[i], 'merged_from': merged[i].tolist()}
+                  for i, tid in enumerate(tids)}
+        with self.lock:
+            self.tracks = tracks
+            self.id_lineage = {int(k): int(v) for k, v in data['lineage'].tolist()}
+            self.audit_log = json.loads(str(data['audit_log']))
+            self._rebuild_frame_index()
+            self._summary = None
+            self.version += 1
+
+    def _touch(self, *tids: int) -> None:
+        """Records the pre-operation state of tracks about to change (first touch wins)."""
+        self._summary_dirty.update(tids)
+        if self._txn_tracks is not None:
+            for tid in tids:
+                if tid not in self._txn_tracks:
+                    d = self.tracks.get(tid)
+                    self._txn_tracks[tid] = dict(d) if d is not None else None
+
+    def _set_lineage(self, oid: int, master: int) -> None:
+        if self._txn_lineage is not None and oid not in self._txn_lineage:
+            self._txn_lineage[oid] = self.id_lineage.get(oid)
+        self.id_lineage[oid] = master
+
+    # ------------------------------------------------------------------ #
+    #  FRAME INDEX                                                         #
+    # ------------------------------------------------------------------ #
+    def _index_add(self, tid: int, frames: np.ndarray) -> None:
+        index = self.frame_index
+        for f in frames.tolist():
+            ids = index.get(f)
+            if ids is None:
+                index[f] = {tid}
+            else:
+                ids.add(tid)
+
+    def _index_remove(self, tid: int, frames: np.ndarray) -> None:
+        index = self.frame_index
+        for f in frames.tolist():
+            ids = index.get(f)
+            if ids is not None:
+                ids.discard(tid)
+                if not ids:
+                    del index[f]
+
+    def _index_move(self, old_tid: int, new_tid: int, frames: np.ndarray) -> None:
+        """Re-labels the given detections from `old_tid` to `new_tid` (merge/split)."""
+        index = self.frame_index
+        for f in frames.tolist():
+            ids = index.get(f)
+            if ids is None:
+                index[f] = {new_tid}
+            else:
+                ids.discard(old_tid)
+                ids.add(new_tid)
+
+    def _rebuild_frame_index(self) -> None:
+        """Builds the index from scratch with one sort over all detections."""
+        self.frame_index = {}
+        if not self.tracks:
+            return
+        all_frames = np.concatenate([d['frames'] for d in self.tracks.values()])
+        all_ids = np.repeat(np.fromiter(self.tracks.keys(), dtype=np.int64, count=len(self.tracks)),
+                            [len(d['frames']) for d in self.tracks.values()])
+        self._index_extend(all_ids, all_frames)
+
+    def _index_extend(self, ids: np.ndarray, frames: np.ndarray) -> None:
+        """Adds many (id, frame) pairs with one sort."""
+        order = np.argsort(frames, kind='stable')
+        uniq, starts = np.unique(frames[order], return_index=True)
+        id_list = ids[order].tolist()
+        bounds = starts.tolist() + [len(id_list)]
+        index = self.frame_index
+        for i, f in enumerate(uniq.tolist()):
+            group = set(id_list[bounds[i]:bounds[i + 1]])
+            current = index.get(f)
+            if current is None:
+                index[f] = group
+            else:
+                current |= group
+
+    def get_frame_detections(self, frame: int) -> List[Tuple[int, np.ndarray]]:
+        """Returns (track_id, box) for every track present at `frame`, sorted by ID."""
+        with self.lock:
+            out = []
+            for tid in sorted(self.frame_index.get(frame, ())):
+                box = track_box_at(self.tracks[tid], frame)
+                if box is not None:
+                    out.append((tid, box))
+            return out
+
+    # ------------------------------------------------------------------ #
+    #  TRACK SUMMARY                                                       #
+    # ------------------------------------------------------------------ #
+    def _summary_rows(self, tids: List[int]) -> Dict[str, np.ndarray]:
+        tracks = [self.tracks[t] for t in tids]
+        n = len(tids)
+        length = np.fromiter((len(d['frames']) for d in tracks), dtype=np.int64, count=n)
+        start = np.full(n, -1, dtype=np.int64)
+        end = np.full(n, -1, dtype=np.int64)
+        first_box = np.full((n, 4), np.nan)
+        last_box = np.full((n, 4), np.nan)
+        mean_box = np.full((n, 4), np.nan)
+        extent = np.full((n, 4), np.nan)
+        nz = np.flatnonzero(length)
+        if len(nz):
+            # One pass over the concatenated detections of all tracks
+            all_frames = np.concatenate([tracks[i]['frames'] for i in nz.tolist()])
+            all_boxes = np.concatenate([tracks[i]['boxes'] for i in nz.tolist()])
+            first = np.zeros(len(nz), dtype=np.int64)
+            np.cumsum(length[nz][:-1], out=first[1:])
+            last = first + length[nz] - 1
+            start[nz], end[nz] = all_frames[first], all_frames[last]
+            first_box[nz], last_box[nz] = all_boxes[first], all_boxes[last]
+            mean_box[nz] = np.add.reduceat(all_boxes, first, axis=0) / length[nz, None]
+            extent[nz, :2] = np.minimum.reduceat(all_boxes[:, :2], first, axis=0)
+            extent[nz, 2:] = np.maximum.reduceat(all_boxes[:, 2:], first, axis=0)
+        return {
+            'tid': np.asarray(tids, dtype=np.int64),
+            'start': start,
+            'end': end,
+            'length': length,
+            'n_merged': np.fromiter((len(d['merged_from']) for d in tracks), dtype=np.int64, count=n),
+            'role': np.array([d['role'] for d in tracks], dtype=object).reshape(n),
+            'first_box': first_box,
+            'last_box': last_box,
+            'mean_box': mean_box,
+            'extent': extent,
+        }
+
+    def get_track_summary(self) -> Dict[str, np.ndarray]:
+        """Per-track summary arrays sorted by track ID: 'tid', 'start', 'end'
+        (first/last frame, -1 when empty), 'length' (detections), 'n_merged',
+        'role', the (N, 4) 'first_box', 'last_box' and 'mean_box' and the
+        (N, 4) 'extent' of all boxes (NaN when empty). Only the tracks changed
+        since the last call are recomputed. The returned arrays must be
+        treated as read-only."""
+        with self.lock:
+            if self._summary is None:
+                self._summary = self._summary_rows(sorted(self.tracks))
+            elif self._summary_dirty:
+                old = self._summary
+                dirty = np.fromiter(self._summary_dirty, dtype=np.int64, count=len(self._summary_dirty))
+                keep = ~np.isin(old['tid'], dirty)
+                fresh = self._summary_rows(sorted(t for t in self._summary_dirty if t in self.tracks))
+                tid = np.concatenate((old['tid'][keep], fresh['tid']))
+                order = np.argsort(tid, kind='stable')
+                self._summary = {k: np.concatenate((old[k][keep], fresh[k]))[order] for k in old}
+            self._summary_dirty = set()
+            return self._summary
 
     def _log_operation(self, action: str, details: dict) -> None:
         entry = {
@@ -148,6 +609,7 @@ class IdentityLogic:
             "details": details
         }
         self.audit_log.append(entry)
+        self.version += 1
 
     def get_audit_log(self) -> List[dict]:
         with self.lock:
@@ -157,62 +619,175 @@ class IdentityLogic:
         with self.lock:
             self.audit_log = log
 
-    def load_from_json_gz(self, path: str) -> bool:
+    def load_from_json_gz(self, path: str, on_publish: Optional[Any] = None,
+                          publish_frames: int = 2000) -> bool:
         """Loads and parses track data from a YOLO .json.gz file.
-        Uses a temporary dict so partial/corrupt files don't pollute state."""
-        tmp_tracks: Dict[int, dict] = {}
-        tmp_lineage: Dict[int, int] = {}
+
+        The file is published progressively: every `publish_frames` frames the
+        parsed prefix is added to the live state and `on_publish(loaded_until)`
+        is called (from the loading thread). Until the end, `loaded_until`
+        holds the first frame not loaded yet (see tracks_loaded).
+        If parsing fails, the previous state is restored and the error re-raised."""
+        with self.lock:
+            previous = (self.tracks, self.id_lineage, self.audit_log, self.frame_index)
+            self.tracks, self.id_lineage, self.audit_log, self.frame_index = {}, {}, [], {}
+            self._summary = None
+            self.loaded_until = 0
+            self.version += 1
         has_untracked = False
+        pending_frames: Dict[int, List[np.ndarray]] = {}
+        pending_boxes: Dict[int, List[np.ndarray]] = {}
+        pending_count = 0
+        last_frame = -1
 
-        with gzip.open(path, 'rt', encoding='utf-8') as f:
-            for line in f:
-                d = json.loads(line)
-                idx = d['f_idx']
-                for i, det in enumerate(d['det']):
-                    tid = det.get('track_id')
-                    if tid is None:
-                        tid = -1
-                    tid = int(tid)
-                    
-                    if tid == -1:
-                        tid = 9000000 + (idx * 1000) + i
+        try:
+            # Boxes-only projection: keypoints are never parsed into arrays here.
+            for batch in iter_pose_batches(path, fields=(FIELD_BOXES,)):
+                last_frame = int(batch.f_idx[-1])
+                pending_count += len(batch)
+                if batch.n_detections:
+                    if not has_untracked and (batch.track_id == -1).any():
                         has_untracked = True
-                    
-                    if tid not in tmp_tracks:
-                        tmp_tracks[tid] = {'frames':[], 'boxes':[], 'role':'Ignore', 'merged_from':[tid]}
-                        tmp_lineage[tid] = tid
-                    tmp_tracks[tid]['frames'].append(idx)
-                    b = det['box']
-                    tmp_tracks[tid]['boxes'].append([b['x1'], b['y1'], b['x2'], b['y2']])
-        
-        # Only commit if full parse succeeded (no exception above)
+                    tids = resolve_track_ids(batch)
+
+                    # Group detections by track, keeping first-appearance order
+                    order = np.argsort(tids, kind='stable')
+                    uniq, starts = np.unique(tids[order], return_index=True)
+                    ends = np.append(starts[1:], len(order))
+                    first_seen = order[starts]
+                    for k in np.argsort(first_seen, kind='stable'):
+                        tid = int(uniq[k])
+                        rows = order[starts[k]:ends[k]]
+                        if tid not in pending_frames:
+                            pending_frames[tid] = []
+                            pending_boxes[tid] = []
+                        pending_frames[tid].append(batch.det_frame[rows])
+                        pending_boxes[tid].append(batch.boxes[rows])
+
+                if pending_count >= publish_frames:
+                    self._publish_loaded(pending_frames, pending_boxes, last_frame + 1)
+                    pending_frames, pending_boxes, pending_count = {}, {}, 0
+                    if on_publish is not None:
+                        on_publish(last_frame + 1)
+        except Exception:
+            with self.lock:
+                self.tracks, self.id_lineage, self.audit_log, self.frame_index = previous
+                self._summary = None
+                self.loaded_until = None
+                self.version += 1
+            raise
+
+        self._publish_loaded(pending_frames, pending_boxes, None)
         with self.lock:
-            self.tracks = tmp_tracks
-            self.id_lineage = tmp_lineage
-            self.audit_log = []
-            self._log_operation("Load Data", {"path": path, "track_count": len(tmp_tracks)})
+            self._log_operation("Load Data", {"path": path, "track_count": len(self.tracks)})
         return has_untracked
 
+    def _publish_loaded(self, frames: Dict[int, List[np.ndarray]], boxes: Dict[int, List[np.ndarray]],
+                        loaded_until: Optional[int]) -> None:
+        """Appends freshly parsed detections to the live tracks. New frames all
+        follow the loaded prefix, so arrays are extended by concatenation and
+        the frame index only gains new keys."""
+        with self.lock:
+            new_ids: List[np.ndarray] = []
+            new_frames: List[np.ndarray] = []
+            for tid, chunks in frames.items():
+                fr = np.concatenate(chunks).astype(FRAME_DTYPE)
+                bx = np.concatenate(boxes[tid])
+                # A fragment merged while loading keeps growing through its master
+                target = self.id_lineage.get(tid, tid)
+                t = self.tracks.get(target)
+                if t is None:
+                    self.tracks[tid] = make_track(fr, bx, 'Ignore', [tid])
+                    self.id_lineage[tid] = tid
+                    target = tid
+                else:
+                    t['frames'] = np.concatenate((t['frames'], fr))
+                    t['boxes'] = np.concatenate((t['boxes'], bx))
+                self._summary_dirty.add(target)
+                new_ids.append(np.full(len(fr), target, dtype=np.int64))
+                new_frames.append(fr)
+            if new_frames:
+                self._index_extend(np.concatenate(new_ids), np.concatenate(new_frames))
+            self.loaded_until = loaded_until
+            self.version += 1
+
+    def _track_closed(self, tid: int) -> bool:
+        d = self.tracks.get(tid)
+        if d is None:
+            return False
+        if not len(d['frames']):
+            return True
+        # Untracked detections are single-frame; tracker IDs are never reused
+        # after TRACK_CLOSE_GAP_S without detections (the tracker's lost buffer
+        # is at most a few seconds).
+        gap = 1 if tid >= SYNTHETIC_ID_BASE else int(TRACK_CLOSE_GAP_S * self.fps)
+        return int(d['frames'][-1]) + gap <= self.loaded_until
+
+    def tracks_loaded(self, ids: Optional[List[int]] = None) -> bool:
+        """True when the data of the given tracks (all tracks when None) is final,
+        i.e. no progressive load can still extend them."""
+        with self.lock:
+            if self.loaded_until is None:
+                return True
+            if ids is None:
+                return False
+            return all(self._track_closed(int(t)) for t in ids)
+
     def assign_role_to_ids(self, ids: List[int], role: str) -> None:
         with self.lock:
             for i in ids:
+                self._touch(int(i))
                 self.tracks[int(i)]['role'] = role
             self._log_operation("Assign Role", {"ids": ids, "role": role})
 
+    def apply_role_rules(self, rules: str, frame_size: Tuple[int, int] = (0, 0),
+                         only_unassigned: bool = True) -> Dict[str, int]:
+        """Assigns roles with a rule set (see hermes_role_rules), evaluated once
+        over the summary arrays of all tracks. With only_unassigned, tracks
+        that already have a role other than 'Ignore' are left alone.
+        Returns the number of tracks changed per role (one audit entry)."""
+        parsed = parse_rules(rules)
+        with self.lock:
+            s = self.get_track_summary()
+            mean_box, extent = s['mean_box'], s['extent']
+            w = mean_box[:, 2] - mean_box[:, 0]
+            h = mean_box[:, 3] - mean_box[:, 1]
+            fields = {
+                'cx': (mean_box[:, 0] + mean_box[:, 2]) / 2, 'cy': (mean_box[:, 1] + mean_box[:, 3]) / 2,
+                'w': w, 'h': h, 'area': w * h,
+                'x1': extent[:, 0], 'y1': extent[:, 1], 'x2': extent[:, 2], 'y2': extent[:, 3],
+                'start': s['start'] / self.fps, 'end': s['end'] / self.fps,
+                'dur': s['length'] / self.fps, 'n': s['length'], 'merged': s['n_merged'],
+                'role': s['role'], 'W': float(frame_size[0]), 'H': float(frame_size[1]),
+            }
+            choice = evaluate_rules(parsed, fields, len(s['tid']))
+            target = np.array([role for role, _, _ in parsed] + [None], dtype=object)[choice]
+            change = (choice >= 0) & (s['length'] > 0) & (target != s['role'])
+            if only_unassigned:
+                change &= s['role'] == 'Ignore'
+            ids: Dict[str, List[int]] = {}
+            for tid, role in zip(s['tid'][change].tolist(), target[change].tolist()):
+                ids.setdefault(role, []).append(tid)
+            for role, tids in ids.items():
+                self._touch(*tids)
+                for tid in tids:
+                    self.tracks[tid]['role'] = role
+            counts = {role: len(tids) for role, tids in ids.items()}
+            self._log_operation("Rule Assign", {"rules": [f"{role}: {cond}" for role, cond, _ in parsed],
+                                                "only_unassigned": only_unassigned, "counts": counts, "ids": ids})
+            return counts
+
     def merge_logic(self, master: int, slave: int) -> None:
         with self.lock:
             if slave not in self.tracks or master not in self.tracks:
                 return
-            self.tracks[master]['frames'].extend(self.tracks[slave]['frames'])
-            self.tracks[master]['boxes'].extend(self.tracks[slave]['boxes'])
-            self.tracks[master]['merged_from'].extend(self.tracks[slave]['merged_from'])
-            for oid, curr in self.id_lineage.items():
-                if curr == slave:
-                    self.id_lineage[oid] = master
+            self._touch(master, slave)
+            m, sl = self.tracks[master], self.tracks[slave]
+            self._index_move(slave, master, sl['frames'])
+            m['frames'], m['boxes'] = merge_sorted_tracks(m['frames'], m['boxes'], sl['frames'], sl['boxes'])
+            m['merged_from'] = m['merged_from'] + sl['merged_from']
+            self._redirect_lineage({slave: master})
             del self.tracks[slave]
-            z = sorted(zip(self.tracks[master]['frames'], self.tracks[master]['boxes']), key=lambda x: x[0])
-            self.tracks[master]['frames'] = [x[0] for x in z]
-            self.tracks[master]['boxes'] = [x[1] for x in z]
 
     def manual_merge(self, ids: List[Any], valid_roles: Optional[Dict] = None) -> int:
         with self.lock:
@@ -229,6 +804,7 @@ class IdentityLogic:
 
             for s in ids[1:]:
                 self.merge_logic(master, s)
+            self._touch(master)
             self.tracks[master]['role'] = final_role
             self._log_operation("Manual Merge", {"master": master, "merged_ids": ids, "final_role": final_role})
             return master
@@ -258,10 +834,9 @@ class IdentityLogic:
             frames = data['frames']
             boxes = data['boxes']
             
-            # Find split index
-            try:
-                split_idx = next(i for i, f in enumerate(frames) if f >= split_frame)
-            except StopIteration:
+            # Find split index (first frame >= split_frame)
+            split_idx = int(np.searchsorted(frames, split_frame, side='left'))
+            if split_idx >= len(frames):
                 return None, "Split frame out of bounds"
             
             if split_idx == 0:
@@ -270,6 +845,7 @@ class IdentityLogic:
             # Generate new ID
             max_id = max(self.tracks.keys()) if self.tracks else 0
             new_id = max_id + 1
+            self._touch(track_id, new_id)
             
             head_frames = frames[:split_idx]
             head_boxes = boxes[:split_idx]
@@ -282,8 +858,9 @@ class IdentityLogic:
                 self.tracks[track_id]['boxes'] = head_boxes
                 
                 # New gets tail
-                self.tracks[new_id] = {'frames': tail_frames, 'boxes': tail_boxes, 'role': 'Ignore', 'merged_from': []}
-                self.id_lineage[new_id] = new_id
+                self.tracks[new_id] = make_track(tail_frames, tail_boxes, 'Ignore', [])
+                self._index_move(track_id, new_id, tail_frames)
+                self._set_lineage(new_id, new_id)
                 self._log_operation("Split Track", {"original": track_id, "new": new_id, "split_frame": split_frame, "kept": "head"})
                 return new_id, len(tail_frames)
             else:
@@ -292,81 +869,306 @@ class IdentityLogic:
                 self.tracks[track_id]['boxes'] = tail_boxes
                 
                 # New gets head
-                self.tracks[new_id] = {'frames': head_frames, 'boxes': head_boxes, 'role': 'Ignore', 'merged_from': []}
-                self.id_lineage[new_id] = new_id
+                self.tracks[new_id] = make_track(head_frames, head_boxes, 'Ignore', [])
+                self._index_move(track_id, new_id, head_frames)
+                self._set_lineage(new_id, new_id)
                 self._log_operation("Split Track", {"original": track_id, "new": new_id, "split_frame": split_frame, "kept": "tail"})
                 return new_id, len(head_frames)
 
-    def auto_stitch(self, lookahead: int, time_gap: float, stitch_dist: float) -> int:
+    def _merge_chain(self, master: int, chain: List[int]) -> None:
+        """Concatenates the tracks in `chain` (which includes `master`) into `master`.
+        The chain must be in time order with no overlapping frames."""
+        self._touch(*chain)
+        m = self.tracks[master]
+        parts = [m if t == master else self.tracks.pop(t) for t in chain]
+        for t, d in zip(chain, parts):
+            if t != master:
+                self._index_move(t, master, d['frames'])
+        m['frames'] = np.concatenate([d['frames'] for d in parts])
+        m['boxes'] = np.concatenate([d['boxes'] for d in parts])
+        m['merged_from'] = m['merged_from'] + [o for t, d in zip(chain, parts) if t != master for o in d['merged_from']]
+
+    def _redirect_lineage(self, redirect: Dict[int, int]) -> None:
+        """Points every original ID owned by a key of `redirect` to its new master."""
+        if redirect:
+            moved = [(oid, redirect[curr]) for oid, curr in self.id_lineage.items() if curr in redirect]
+            for oid, master in moved:
+                self._set_lineage(oid, master)
+
+    def set_appearance(self, tids: np.ndarray, embeddings: np.ndarray) -> None:
+        """Sets the per-original-ID appearance embeddings (see hermes_appearance)."""
+        order = np.argsort(tids, kind='stable')
+        with self.lock:
+            self.appearance_ids = np.asarray(tids, dtype=np.int64)[order]
+            self.appearance = np.asarray(embeddings, dtype=np.float32)[order]
+
+    def has_appearance(self) -> bool:
+        return len(self.appearance_ids) > 0
+
+    def _track_embeddings(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Unit embedding of each track (mean over its original fragments) and a
+        mask of the tracks that have one."""
+        owner: List[int] = []
+        orig: List[int] = []
+        for i, tid in enumerate(ids.tolist()):
+            mf = self.tracks[tid]['merged_from']
+            owner.extend([i] * len(mf))
+            orig.extend(mf)
+        owner_a = np.asarray(owner, dtype=np.int64)
+        orig_a = np.asarray(orig, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.appearance_ids, orig_a), len(self.appearance_ids) - 1)
+        found = self.appearance_ids[pos] == orig_a
+        # Sum of the fragment embeddings of every track as one sparse product
+        weights = csr_matrix((np.ones(int(found.sum())), (owner_a[found], pos[found])),
+                             shape=(len(ids), len(self.appearance_ids)))
+        emb = np.asarray(weights @ self.appearance, dtype=np.float64)
+        norm = np.linalg.norm(emb, axis=1)
+        has = norm > 0
+        emb[has] /= norm[has, None]
+        return emb, has
+
+    def _find_stitch_links(self, lookahead: int, time_gap: float, stitch_dist: float,
+                           appearance_weight: float = 0.0) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+        """Builds every end->start candidate link in one pass over the sorted
+        endpoint arrays, then keeps the minimum-cost one-to-one subset.
+
+        A link a->b requires b to start 1..time_gap*fps frames after a ends,
+        b to be among the first `lookahead` tracks starting after a ends, and
+        the box centres at the junction to be closer than `stitch_dist`.
+        With appearance embeddings loaded and `appearance_weight` > 0, the link
+        cost also grows by appearance_weight * stitch_dist * (1 - cosine).
+        Returns the track IDs in start order and the chosen (a, b) positions."""
+        items = [(tid, d) for tid, d in self.tracks.items() if len(d['frames'])]
+        if len(items) < 2:
+            return np.empty(0, dtype=np.int64), []
+        ids = np.array([tid for tid, _ in items], dtype=np.int64)
+        starts = np.array([d['frames'][0] for _, d in items], dtype=np.int64)
+        ends = np.array([d['frames'][-1] for _, d in items], dtype=np.int64)
+        first_box = np.array([d['boxes'][0] for _, d in items], dtype=np.float64)
+        last_box = np.array([d['boxes'][-1] for _, d in items], dtype=np.float64)
+
+        order = np.argsort(starts, kind='stable')
+        ids, starts, ends = ids[order], starts[order], ends[order]
+        first_box, last_box = first_box[order], last_box[order]
+        n = len(ids)
+        rank = np.arange(n)
+
+        # Candidate window of every track: the starts following its end
+        lo = np.searchsorted(starts, ends, side='right')
+        hi = np.minimum(np.searchsorted(starts, ends + time_gap * self.fps, side='right'), lo + lookahead)
+        counts = np.clip(hi - lo, 0, None)
+        total = int(counts.sum())
+        if total == 0:
+            return ids, []
+        src = np.repeat(rank, counts)
+        dst = np.repeat(lo, counts) + (np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+
+        end_c = np.column_stack(((last_box[:, 0] + last_box[:, 2]) / 2, (last_box[:, 1] + last_box[:, 3]) / 2))
+        start_c = np.column_stack(((first_box[:, 0] + first_box[:, 2]) / 2, (first_box[:, 1] + first_box[:, 3]) / 2))
+        dist = np.hypot(end_c[src, 0] - start_c[dst, 0], end_c[src, 1] - start_c[dst, 1])
+        keep = dist < stitch_dist
+        src, dst, dist = src[keep], dst[keep], dist[keep]
+        if len(src) and appearance_weight > 0 and self.has_appearance():
+            # Cosine similarity of all candidate pairs in one vectorised product
+            involved, inv = np.unique(np.concatenate((src, dst)), return_inverse=True)
+            emb, has = self._track_embeddings(ids[involved])
+            a_i, b_i = inv[:len(src)], inv[len(src):]
+            cos = np.einsum('ij,ij->i', emb[a_i], emb[b_i])
+            both = has[a_i] & has[b_i]
+            dist = dist + np.where(both, appearance_weight * stitch_dist * (1.0 - cos), 0.0)
+            keep = dist < stitch_dist
+            src, dst, dist = src[keep], dst[keep], dist[keep]
+        if not len(src):
+            return ids, []
+
+        # Independent sub-problems: connected components of the bipartite
+        # graph (track ends on the left, track starts on the right).
+        graph = csr_matrix((np.ones(len(src)), (src, n + dst)), shape=(2 * n, 2 * n))
+        _, labels = connected_components(graph, directed=False)
+        edge_comp = labels[src]
+        comp_order = np.argsort(edge_comp, kind='stable')
+        _, comp_start, comp_size = np.unique(edge_comp[comp_order], return_index=True, return_counts=True)
+
+        links: List[Tuple[int, int]] = []
+        for c0, size in zip(comp_start.tolist(), comp_size.tolist()):
+            e = comp_order[c0:c0 + size]
+            if size == 1:
+                links.append((int(src[e[0]]), int(dst[e[0]])))
+                continue
+            rows, r_idx = np.unique(src[e], return_inverse=True)
+            cols, c_idx = np.unique(dst[e], return_inverse=True)
+            n_r, n_c = len(rows), len(cols)
+            # Extra "no link" column per row, costing the threshold itself,
+            # so every accepted link strictly lowers the total cost.
+            big = stitch_dist * (n_r + 1) + 1.0
+            cost = np.full((n_r, n_c + n_r), big)
+            cost[r_idx, c_idx] = dist[e]
+            cost[np.arange(n_r), n_c + np.arange(n_r)] = stitch_dist
+            r_sel, c_sel = linear_sum_assignment(cost)
+            for r, c in zip(r_sel.tolist(), c_sel.tolist()):
+                if c < n_c and cost[r, c] < stitch_dist:
+                    links.append((int(rows[r]), int(cols[c])))
+        return ids, links
+
+    def auto_stitch(self, lookahead: int, time_gap: float, stitch_dist: float,
+                    appearance_weight: float = 0.0) -> int:
         with self.lock:
-            merged = 0
-            changed = True
-            while changed:
-                changed = False
-                curr_ids = sorted(self.tracks.keys(), key=lambda x: min(self.tracks[x]['frames']))
-                i = 0
-                while i < len(curr_ids) - 1:
-                    id_a = curr_ids[i]
-                    best_match, min_dist = None, float('inf')
-                    search_limit = min(i + lookahead, len(curr_ids))
-                    for j in range(i + 1, search_limit):
-                        id_b = curr_ids[j]
-                        t_a, t_b = self.tracks[id_a], self.tracks[id_b]
-                        gap = t_b['frames'][0] - t_a['frames'][-1]
-                        if not (0 < gap <= (time_gap * self.fps)):
-                            continue
-                        ba, bb = t_a['boxes'][-1], t_b['boxes'][0]
-                        ca, cb = ((ba[0] + ba[2]) / 2, (ba[1] + ba[3]) / 2), ((bb[0] + bb[2]) / 2, (bb[1] + bb[3]) / 2)
-                        d = math.hypot(ca[0] - cb[0], ca[1] - cb[1])
-                        if d < stitch_dist and d < min_dist:
-                            min_dist, best_match = d, id_b
-                    if best_match:
-                        self.merge_logic(id_a, best_match)
-                        merged += 1
-                        changed = True
-                        break
-                    i += 1
-            self._log_operation("Auto Stitch", {"merged_count": merged, "params": {"lookahead": lookahead, "time_gap": time_gap, "stitch_dist": stitch_dist}})
+            ids, links = self._find_stitch_links(lookahead, time_gap, stitch_dist, appearance_weight)
+            succ = dict(links)
+            has_pred = set(succ.values())
+            redirect: Dict[int, int] = {}
+            merged_links: List[List[int]] = []
+            for head in sorted(set(succ) - has_pred):
+                master, cur = int(ids[head]), head
+                chain = [master]
+                while cur in succ:
+                    nxt = succ[cur]
+                    merged_links.append([int(ids[cur]), int(ids[nxt])])
+                    chain.append(int(ids[nxt]))
+                    cur = nxt
+                self._merge_chain(master, chain)
+                for t in chain[1:]:
+                    redirect[t] = master
+            self._redirect_lineage(redirect)
+            merged = len(merged_links)
+            self._log_operation("Auto Stitch", {"merged_count": merged, "links": merged_links,
+                                                "params": {"lookahead": lookahead, "time_gap": time_gap, "stitch_dist": stitch_dist,
+                                                           "appearance_weight": appearance_weight if self.has_appearance() else 0.0}})
             return merged
 
-    def absorb_noise(self, cast: Dict[str, dict], noise_dist: float, time_gap: float) -> int:
+    def absorb_noise(self, cast: Dict[str, dict], noise_dist: float, time_gap: float, max_passes: int = 100) -> int:
+        """Absorbs unassigned fragments into the cast tracks they continue.
+
+        A candidate is absorbed when it starts (or ends) less than `time_gap`
+        seconds after (before) a cast track, with the junction box centres
+        closer than `noise_dist`. Candidates that continue each other by the
+        same rule (mutual nearest links) are first chained, so a run of
+        fragments is absorbed as a unit. Every pass then works on endpoint
+        arrays: the chains are sorted by start and by end, so the gap window
+        of each cast track is a pair of binary searches and all distances are
+        one vectorized computation. Per pass, each cast track takes its
+        nearest chain on each side; a chain wanted by several tracks goes to
+        the closest one. Merges are applied in one batch at the end."""
         with self.lock:
-            main_tracks = [tid for tid, d in self.tracks.items() if d['role'] in cast]
-            candidates = [tid for tid, d in self.tracks.items() if d['role'] not in cast]
-            absorbed, changed = 0, True
+            main_ids = [tid for tid, d in self.tracks.items() if d['role'] in cast and len(d['frames'])]
+            cand_ids = [tid for tid, d in self.tracks.items() if d['role'] not in cast and len(d['frames'])]
             MAX_DIST, MAX_TIME_GAP = noise_dist, time_gap * self.fps
-            while changed:
-                changed = False
-                for main_id in list(main_tracks):
-                    if main_id not in self.tracks:
-                        continue
-                    main_data = self.tracks[main_id]
-                    main_frames = sorted(main_data['frames'])
-                    to_remove: List[int] = []
-                    for cand_id in candidates:
-                        if cand_id not in self.tracks or not set(main_frames).isdisjoint(self.tracks[cand_id]['frames']):
-                            continue
-                        cand_data = self.tracks[cand_id]
-                        c_frames = cand_data['frames']
-                        gap_after, dist_after = c_frames[0] - main_frames[-1], float('inf')
-                        if 0 < gap_after < MAX_TIME_GAP:
-                            end_m, start_c = main_data['boxes'][main_data['frames'].index(main_frames[-1])], cand_data['boxes'][0]
-                            cm, cc = ((end_m[0] + end_m[2]) / 2, (end_m[1] + end_m[3]) / 2), ((start_c[0] + start_c[2]) / 2, (start_c[1] + start_c[3]) / 2)
-                            dist_after = math.hypot(cm[0] - cc[0], cm[1] - cc[1])
-                        gap_before, dist_before = main_frames[0] - c_frames[-1], float('inf')
-                        if 0 < gap_before < MAX_TIME_GAP:
-                            end_c, start_m = cand_data['boxes'][-1], main_data['boxes'][main_data['frames'].index(main_frames[0])]
-                            cc, cm = ((end_c[0] + end_c[2]) / 2, (end_c[1] + end_c[3]) / 2), ((start_m[0] + start_m[2]) / 2, (start_m[1] + start_m[3]) / 2)
-                            dist_before = math.hypot(cm[0] - cc[0], cm[1] - cc[1])
-                        if dist_after < MAX_DIST or dist_before < MAX_DIST:
-                            self.merge_logic(main_id, cand_id)
-                            absorbed += 1
-                            changed = True
-                            to_remove.append(cand_id)
-                            main_frames = sorted(self.tracks[main_id]['frames'])
-                    for c in to_remove:
-                        if c in candidates:
-                            candidates.remove(c)
+            if not main_ids or not cand_ids:
+                self._log_operation("Absorb Noise", {"absorbed_count": 0, "params": {"noise_dist": noise_dist, "time_gap": time_gap}})
+                return 0
+
+            def centres(boxes: np.ndarray) -> np.ndarray:
+                return np.column_stack(((boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2))
+
+            def endpoints(ids: List[int]) -> Tuple[np.ndarray, ...]:
+                tr = [self.tracks[t] for t in ids]
+                return (np.array([d['frames'][0] for d in tr], dtype=np.int64),
+                        np.array([d['frames'][-1] for d in tr], dtype=np.int64),
+                        centres(np.array([d['boxes'][0] for d in tr], dtype=np.float64)),
+                        centres(np.array([d['boxes'][-1] for d in tr], dtype=np.float64)))
+
+            def window_pairs(lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+                counts = np.clip(hi - lo, 0, None)
+                total = int(counts.sum())
+                owner = np.repeat(np.arange(len(lo)), counts)
+                pos = np.repeat(lo, counts) + (np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+                return owner, pos
+
+            def nearest_per(key: np.ndarray, dist: np.ndarray, gap: np.ndarray) -> np.ndarray:
+                # Closest in space, then in time
+                order = np.lexsort((gap, dist, key))
+                _, first = np.unique(key[order], return_index=True)
+                return order[first]
+
+            m_start, m_end, m_sc, m_ec = endpoints(main_ids)
+            f_start, f_end, f_sc, f_ec = endpoints(cand_ids)
+            n_c = len(cand_ids)
+
+            # Chain candidates that continue each other (mutual nearest end->start
+            # links). Cast tracks take part in the competition, so a fragment that
+            # best continues a cast track is never chained behind noise.
+            a_start, a_end = np.concatenate((f_start, m_start)), np.concatenate((f_end, m_end))
+            a_sc, a_ec = np.concatenate((f_sc, m_sc)), np.concatenate((f_ec, m_ec))
+            by_start = np.argsort(a_start, kind='stable')
+            a_start_sorted = a_start[by_start]
+            src, pos = window_pairs(np.searchsorted(a_start_sorted, a_end, side='right'),
+                                    np.searchsorted(a_start_sorted, a_end + MAX_TIME_GAP, side='left'))
+            dst = by_start[pos]
+            dist = np.hypot(*(a_ec[src] - a_sc[dst]).T)
+            gap = a_start[dst] - a_end[src]
+            ok = (dist < MAX_DIST) & ((src < n_c) | (dst < n_c))
+            src, dst, dist, gap = src[ok], dst[ok], dist[ok], gap[ok]
+            mutual = np.intersect1d(nearest_per(src, dist, gap), nearest_per(dst, dist, gap))
+            mutual = mutual[(src[mutual] < n_c) & (dst[mutual] < n_c)]
+            succ = np.full(len(cand_ids), -1, dtype=np.int64)
+            succ[src[mutual]] = dst[mutual]
+            has_pred = np.zeros(len(cand_ids), dtype=bool)
+            has_pred[dst[mutual]] = True
+            groups: List[List[int]] = []
+            for h in np.flatnonzero(~has_pred).tolist():
+                members = [h]
+                while succ[members[-1]] >= 0:
+                    members.append(int(succ[members[-1]]))
+                groups.append(members)
+            heads = np.array([g[0] for g in groups], dtype=np.int64)
+            tails = np.array([g[-1] for g in groups], dtype=np.int64)
+
+            c_start, c_sc, c_end, c_ec = f_start[heads], f_sc[heads], f_end[tails], f_ec[tails]
+            by_start = np.argsort(c_start, kind='stable')
+            by_end = np.argsort(c_end, kind='stable')
+            c_start_sorted, c_end_sorted = c_start[by_start], c_end[by_end]
+            alive = np.ones(len(groups), dtype=bool)
+            before: List[List[int]] = [[] for _ in main_ids]   # absorbed chains, newest first
+            after: List[List[int]] = [[] for _ in main_ids]
+
+            for _ in range(max_passes):
+                # Candidates starting after each cast track ends
+                own_a, pos_a = window_pairs(np.searchsorted(c_start_sorted, m_end, side='right'),
+                                            np.searchsorted(c_start_sorted, m_end + MAX_TIME_GAP, side='left'))
+                cand_a = by_start[pos_a]
+                # Candidates ending before each cast track starts
+                own_b, pos_b = window_pairs(np.searchsorted(c_end_sorted, m_start - MAX_TIME_GAP, side='right'),
+                                            np.searchsorted(c_end_sorted, m_start, side='left'))
+                cand_b = by_end[pos_b]
+
+                owner = np.concatenate((own_a, own_b))
+                cand = np.concatenate((cand_a, cand_b))
+                dist = np.concatenate((np.hypot(*(m_ec[own_a] - c_sc[cand_a]).T),
+                                       np.hypot(*(m_sc[own_b] - c_ec[cand_b]).T)))
+                gap = np.concatenate((c_start[cand_a] - m_end[own_a], m_start[own_b] - c_end[cand_b]))
+                side = np.concatenate((np.ones(len(own_a), dtype=bool), np.zeros(len(own_b), dtype=bool)))
+                ok = alive[cand] & (dist < MAX_DIST)
+                if not ok.any():
+                    break
+                owner, cand, dist, gap, side = owner[ok], cand[ok], dist[ok], gap[ok], side[ok]
+
+                # Nearest chain per (track, side), then each chain to its closest track
+                pick = nearest_per(owner * 2 + side, dist, gap)
+                pick = pick[nearest_per(cand[pick], dist[pick], gap[pick])]
+
+                for o, c, is_after in zip(owner[pick].tolist(), cand[pick].tolist(), side[pick].tolist()):
+                    alive[c] = False
+                    if is_after:
+                        after[o].append(c)
+                        m_end[o], m_ec[o] = c_end[c], c_ec[c]
+                    else:
+                        before[o].append(c)
+                        m_start[o], m_sc[o] = c_start[c], c_sc[c]
+
+            absorbed = 0
+            redirect: Dict[int, int] = {}
+            for o, main_id in enumerate(main_ids):
+                if not before[o] and not after[o]:
+                    continue
+                head = [cand_ids[m] for g in reversed(before[o]) for m in groups[g]]
+                tail = [cand_ids[m] for g in after[o] for m in groups[g]]
+                absorbed_ids = head + tail
+                chain = head + [main_id] + tail
+                self._merge_chain(main_id, chain)
+                for t in absorbed_ids:
+                    redirect[t] = main_id
+                absorbed += len(absorbed_ids)
+            self._redirect_lineage(redirect)
             self._log_operation("Absorb Noise", {"absorbed_count": absorbed, "params": {"noise_dist": noise_dist, "time_gap": time_gap}})
             return absorbed
 
@@ -375,17 +1177,468 @@ class IdentityLogic:
         If multiple overlap, returns the smallest box (most specific)."""
         best_id: Optional[int] = None
         best_area = float('inf')
-        for tid, d in self.tracks.items():
-            if frame in d['frames']:
-                idx = d['frames'].index(frame)
-                bx1, by1, bx2, by2 = d['boxes'][idx]
-                if bx1 <= x <= bx2 and by1 <= y <= by2:
-                    area = (bx2 - bx1) * (by2 - by1)
-                    if area < best_area:
-                        best_area = area
-                        best_id = tid
+        for tid, box in self.get_frame_detections(frame):
+            bx1, by1, bx2, by2 = box.tolist()
+            if bx1 <= x <= bx2 and by1 <= y <= by2:
+                area = (bx2 - bx1) * (by2 - by1)
+                if area < best_area:
+                    best_area = area
+                    best_id = tid
         return best_id
 
+    # ------------------------------------------------------------------ #
+    #  ROLE ASSIGNMENT                                                     #
+    # ------------------------------------------------------------------ #
+    def _role_units(self, cast: Set[str], lookahead: int, time_gap: float, stitch_dist: float,
+                    appearance_weight: float) -> List[List[int]]:
+        """Groups the unassigned fragments into units that take one role each:
+        the chains auto-stitch would build (see _find_stitch_links), cut at
+        every cast track. Fragments are listed in time order."""
+        ids, links = self._find_stitch_links(lookahead, time_gap, stitch_dist, appearance_weight)
+        if not len(ids):
+            return [[tid] for tid, d in self.tracks.items() if d['role'] not in cast and len(d['frames'])]
+        succ = dict(links)
+        has_pred = set(succ.values())
+        units: List[List[int]] = []
+        for head in range(len(ids)):
+            if head in has_pred:
+                continue
+            run: List[int] = []
+            cur: Optional[int] = head
+            while cur is not None:
+                tid = int(ids[cur])
+                if self.tracks[tid]['role'] in cast:
+                    if run:
+                        units.append(run)
+                    run = []
+                else:
+                    run.append(tid)
+                cur = succ.get(cur)
+            if run:
+                units.append(run)
+        return units
+
+    def _role_samples(self, tids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Frames and box centres of a set of tracks, sorted by frame."""
+        frames = np.concatenate([self.tracks[t]['frames'] for t in tids])
+        boxes = np.concatenate([self.tracks[t]['boxes'] for t in tids])
+        order = np.argsort(frames, kind='stable')
+        boxes = boxes[order]
+        return frames[order], np.column_stack(((boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2))
+
+    def _role_costs(self, a_frames: np.ndarray, a_c: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                    first_c: np.ndarray, last_c: np.ndarray, base_dist: float, speed: float,
+                    max_gap: float) -> np.ndarray:
+        """Spatial cost of giving one role to every unit (inf when impossible).
+
+        A unit is compared with the role's detections just before its start
+        and just after its end: the centre distance is divided by the distance
+        the person could cover in the gap (base_dist + speed * gap seconds).
+        Units whose time span holds any detection of the role are excluded."""
+        before = np.searchsorted(a_frames, starts, side='left') - 1
+        after = np.searchsorted(a_frames, ends, side='right')
+        cost = np.full(len(starts), np.inf)
+        for idx, ok, point, ref in ((before, before >= 0, starts, first_c),
+                                    (after, after < len(a_frames), ends, last_c)):
+            idx = np.clip(idx, 0, len(a_frames) - 1)
+            gap = np.abs(a_frames[idx] - point) / self.fps
+            ok = ok & (gap <= max_gap)
+            dist = np.hypot(a_c[idx, 0] - ref[:, 0], a_c[idx, 1] - ref[:, 1])
+            cost = np.minimum(cost, np.where(ok, dist / (base_dist + speed * gap), np.inf))
+        # One person is never in two places at once
+        cost[after - before > 1] = np.inf
+        return cost
+
+    def propose_role_assignment(self, roles: List[str], lookahead: int = 15, time_gap: float = 2.0,
+                                stitch_dist: float = 150.0, appearance_weight: float = 0.0,
+                                max_cost: float = 1.0, speed: float = 100.0, max_gap: float = 10.0,
+                                max_passes: int = 20, time_limit: float = 60.0,
+                                cancel: Optional[threading.Event] = None,
+                                progress: Optional[Any] = None) -> Optional[Dict[int, str]]:
+        """Proposes a role for the unassigned fragments of the whole session.
+
+        Fragments are first grouped into units (see _role_units). Every
+        (unit, role) pair costs its spatial continuity with the role's tracks
+        (see _role_costs) plus, with appearance embeddings loaded, the cosine
+        distance to the role's mean embedding; pairs costing max_cost or more
+        are dropped. Each pass solves one sparse 0/1 program maximising the
+        total saving (max_cost - cost), with at most one role per unit and no
+        two units of a role overlapping in time. The chosen units then act as
+        role tracks for the next pass, until a pass adds nothing.
+
+        time_limit bounds the whole call: each pass gets what is left of it,
+        and the passes stop once it is spent. Setting `cancel` stops before
+        the next pass and returns None; `progress(pass_no)` is called as each
+        pass starts. The lock is released while a program is solved, so the
+        caller must keep the tracks unchanged until the call returns.
+
+        Nothing is changed: returns the proposed {track ID: role} mapping."""
+        deadline = time.monotonic() + time_limit
+        with self.lock:
+            roles = list(roles)
+            summary = self.get_track_summary()
+            units = self._role_units(set(roles), lookahead, time_gap, stitch_dist, appearance_weight)
+            if not units:
+                return {}
+            sizes = np.fromiter(map(len, units), dtype=np.int64, count=len(units))
+            members = np.fromiter((t for u in units for t in u), dtype=np.int64, count=int(sizes.sum()))
+            unit_first = np.zeros(len(units), dtype=np.int64)
+            np.cumsum(sizes[:-1], out=unit_first[1:])
+            rows = np.searchsorted(summary['tid'], members)
+            head, tail = rows[unit_first], rows[unit_first + sizes - 1]
+            starts, ends = summary['start'][head], summary['end'][tail]
+            fb, lb = summary['first_box'][head], summary['last_box'][tail]
+            first_c = np.column_stack(((fb[:, 0] + fb[:, 2]) / 2, (fb[:, 1] + fb[:, 3]) / 2))
+            last_c = np.column_stack(((lb[:, 0] + lb[:, 2]) / 2, (lb[:, 1] + lb[:, 3]) / 2))
+            unit_emb = None
+            if appearance_weight > 0 and self.has_appearance():
+                emb, has = self._track_embeddings(members)
+                unit_emb = np.add.reduceat(np.where(has[:, None], emb, 0.0), unit_first, axis=0)
+
+            non_empty = summary['length'] > 0
+            anchors = {role: summary['tid'][non_empty & (summary['role'] == role)].tolist() for role in roles}
+            samples = {role: self._role_samples(ids) for role, ids in anchors.items() if ids}
+            open_units = np.ones(len(units), dtype=bool)
+        proposal: Dict[int, str] = {}
+        for pass_no in range(max_passes):
+            if cancel is not None and cancel.is_set():
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if progress is not None:
+                progress(pass_no + 1)
+            with self.lock:
+                cand = np.flatnonzero(open_units)
+                pair_unit: List[np.ndarray] = []
+                pair_role: List[np.ndarray] = []
+                pair_cost: List[np.ndarray] = []
+                for r, role in enumerate(roles):
+                    if role not in samples:
+                        continue
+                    cost = self._role_costs(*samples[role], starts[cand], ends[cand], first_c[cand], last_c[cand],
+                                            stitch_dist, speed, max_gap)
+                    if unit_emb is not None:
+                        emb, has = self._track_embeddings(np.asarray(anchors[role], dtype=np.int64))
+                        centre = emb[has].sum(axis=0)
+                        u_emb = unit_emb[cand]
+                        u_norm, c_norm = np.linalg.norm(u_emb, axis=1), np.linalg.norm(centre)
+                        if c_norm > 0:
+                            cos = (u_emb @ centre) / np.maximum(u_norm * c_norm, 1e-12)
+                            cost += np.where(u_norm > 0, appearance_weight * (1.0 - cos) / 2.0, 0.0)
+                    ok = np.flatnonzero(cost < max_cost)
+                    pair_unit.append(cand[ok])
+                    pair_role.append(np.full(len(ok), r, dtype=np.int64))
+                    pair_cost.append(cost[ok])
+            if not sum(len(p) for p in pair_unit):
+                break
+            unit_of = np.concatenate(pair_unit)
+            role_of = np.concatenate(pair_role)
+            chosen = self._solve_role_program(unit_of, role_of, max_cost - np.concatenate(pair_cost),
+                                              starts, ends, remaining)
+            if cancel is not None and cancel.is_set():
+                return None
+            if not len(chosen):
+                break
+            gained: Dict[str, List[int]] = {}
+            for u, r in zip(unit_of[chosen].tolist(), role_of[chosen].tolist()):
+                open_units[u] = False
+                gained.setdefault(roles[r], []).extend(units[u])
+            with self.lock:
+                for role, ids in gained.items():
+                    anchors[role].extend(ids)
+                    samples[role] = self._role_samples(anchors[role])
+                    proposal.update(dict.fromkeys(ids, role))
+        if cancel is not None and cancel.is_set():
+            return None
+        return proposal
+
+    @staticmethod
+    def _solve_role_program(frag: np.ndarray, role_of: np.ndarray, saving: np.ndarray,
+                            starts: np.ndarray, ends: np.ndarray, time_limit: float) -> np.ndarray:
+        """Selects the (fragment, role) pairs of maximum total saving such that
+        every fragment is used once and the pairs of a role never overlap.
+        Returns the positions of the selected pairs."""
+        n = len(frag)
+        rows: List[np.ndarray] = []
+        cols: List[np.ndarray] = []
+        n_rows = 0
+
+        # At most one role per fragment
+        order = np.argsort(frag, kind='stable')
+        uniq, first, count = np.unique(frag[order], return_index=True, return_counts=True)
+        multi = np.flatnonzero(count > 1)
+        if len(multi):
+            size = count[multi]
+            pos = np.repeat(first[multi], size) + (np.arange(size.sum()) - np.repeat(np.cumsum(size) - size, size))
+            rows.append(np.repeat(np.arange(len(multi)), size))
+            cols.append(order[pos])
+            n_rows += len(multi)
+
+        # Per role: the pairs active at each start point form a clique of the
+        # interval graph, and these cliques cover every overlapping couple.
+        for r in np.unique(role_of).tolist():
+            p = np.flatnonzero(role_of == r)
+            p = p[np.argsort(starts[frag[p]], kind='stable')]
+            s, e = starts[frag[p]], ends[frag[p]]
+            # Pair i is active at the start points i .. last[i]
+            last = np.searchsorted(s, e, side='right') - 1
+            span = last - np.arange(len(p)) + 1
+            member = np.repeat(np.arange(len(p)), span)
+            point = member + (np.arange(span.sum()) - np.repeat(np.cumsum(span) - span, span))
+            size = np.bincount(point, minlength=len(p))
+            keep = size[point] > 1
+            if not keep.any():
+                continue
+            _, point_row = np.unique(point[keep], return_inverse=True)
+            rows.append(n_rows + point_row)
+            cols.append(p[member[keep]])
+            n_rows += int(point_row.max()) + 1
+
+        if not n_rows:
+            return np.arange(n)
+        a = csr_matrix((np.ones(sum(len(c) for c in cols)), (np.concatenate(rows), np.concatenate(cols))),
+                       shape=(n_rows, n))
+        res = milp(-saving, integrality=np.ones(n), bounds=Bounds(0, 1),
+                   constraints=LinearConstraint(a, -np.inf, 1),
+                   options={'time_limit': time_limit, 'mip_rel_gap': 1e-4})
+        if res.x is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(res.x > 0.5)
+
+
+class VirtualTrackTree(tk.Frame):
+    """
+    Track list that materialises only the rows currently on screen.
+
+    The full row order and the selection live in Python; the embedded
+    ttk.Treeview holds just the visible window and is refilled on scroll.
+    Rows are addressed by string IIDs (the track IDs) and their values are
+    produced on demand by ``row_provider(iid) -> (values, tags[, image])``.
+    Exposes the part of the Treeview API used by IdentityView.
+    """
+    def __init__(self, parent: tk.Widget, columns: Tuple[str, ...], row_provider: Any,
+                 show: str = "headings", style: str = "Treeview"):
+        super().__init__(parent)
+        self.row_provider = row_provider
+        self.tree = ttk.Treeview(self, columns=columns, show=show, selectmode="extended", style=style)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.rows: List[str] = []                  # every IID, in display order
+        self._pos: Dict[str, int] = {}             # IID -> index in rows
+        self._selected: Dict[str, None] = {}       # ordered set of selected IIDs
+        self._focus: str = ""
+        self._top: int = 0
+        self._shown: List[str] = []                # IIDs materialised in the Treeview
+        self._shown_values: Dict[str, Any] = {}
+        self._select_callbacks: List[Any] = []
+        self._modifiers: int = 0
+        self._notify_pending: bool = False
+
+        self.tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        self.tree.bind("<ButtonPress-1>", self._remember_modifiers, add="+")
+        self.tree.bind("<Configure>", lambda e: self._render())
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda e: self._scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self._scroll_by(3))
+        self.tree.bind("<Up>", lambda e: self._move_cursor(-1))
+        self.tree.bind("<Down>", lambda e: self._move_cursor(1))
+        self.tree.bind("<Prior>", lambda e: self._scroll_by(-self._page_size()))
+        self.tree.bind("<Next>", lambda e: self._scroll_by(self._page_size()))
+
+    # --- Treeview-compatible API ---
+    def heading(self, column: str, **kw: Any) -> Any:
+        return self.tree.heading(column, **kw)
+
+    def column(self, column: str, **kw: Any) -> Any:
+        return self.tree.column(column, **kw)
+
+    def tag_configure(self, tag: str, **kw: Any) -> Any:
+        return self.tree.tag_configure(tag, **kw)
+
+    def bind(self, sequence: str, func: Any, add: Any = None) -> Any:
+        if sequence == "<<TreeviewSelect>>":
+            self._select_callbacks.append(func)
+            return None
+        return self.tree.bind(sequence, func, add)
+
+    def exists(self, iid: str) -> bool:
+        return str(iid) in self._pos
+
+    def identify_row(self, y: int) -> str:
+        return self.tree.identify_row(y)
+
+    def selection(self) -> Tuple[str, ...]:
+        return tuple(self._selected)
+
+    def selection_set(self, items: Any) -> None:
+        if isinstance(items, (str, int)):
+            items = (items,)
+        new = {str(i): None for i in items if str(i) in self._pos}
+        if list(new) != list(self._selected):
+            self._selected = new
+            self._schedule_notify()
+        self._sync_selection()
+
+    def focus(self, iid: Optional[str] = None) -> str:
+        if iid is None:
+            return self._focus
+        self._focus = str(iid)
+        if self._focus in self._shown_values:
+            self.tree.focus(self._focus)
+        return self._focus
+
+    def see(self, iid: str) -> None:
+        pos = self._pos.get(str(iid))
+        if pos is None:
+            return
+        page = self._page_size()
+        if pos < self._top:
+            self._top = pos
+        elif pos >= self._top + page:
+            self._top = pos - page + 1
+        self._render()
+
+    # --- Model updates ---
+    def set_rows(self, rows: List[str]) -> None:
+        """Replaces the row order (e.g. after filtering); keeps scroll position
+        and the selection of the rows that are still present."""
+        self.rows = rows
+        self._pos = {iid: i for i, iid in enumerate(rows)}
+        sel = {iid: None for iid in self._selected if iid in self._pos}
+        if len(sel) != len(self._selected):
+            self._selected = sel
+            self._schedule_notify()
+        self._render()
+
+    # --- Rendering ---
+    def _row_height(self) -> int:
+        if self._shown:
+            bbox = self.tree.bbox(self._shown[0])
+            if bbox:
+                return max(1, bbox[3])
+        return 20
+
+    def _page_size(self) -> int:
+        h = self.tree.winfo_height()
+        if h <= 1:
+            return 30
+        header = 0
+        if self._shown:
+            bbox = self.tree.bbox(self._shown[0])
+            if bbox:
+                header = bbox[1]
+        return max(1, (h - header) // self._row_height())
+
+    def _render(self) -> None:
+        page = self._page_size()
+        self._top = max(0, min(self._top, len(self.rows) - page))
+        # One extra row so a partially visible last line is still drawn
+        wanted = self.rows[self._top:self._top + page + 1]
+        wanted_set = set(wanted)
+
+        stale = [iid for iid in self._shown if iid not in wanted_set]
+        if stale:
+            self.tree.delete(*stale)
+            for iid in stale:
+                del self._shown_values[iid]
+        # Only rows that appear, move or change value touch the Treeview
+        current = [iid for iid in self._shown if iid in wanted_set]
+        for idx, iid in enumerate(wanted):
+            row = self.row_provider(iid)
+            kw = {'values': row[0], 'tags': row[1]}
+            if len(row) > 2:
+                kw['image'] = row[2]
+            if iid not in self._shown_values:
+                self.tree.insert("", idx, iid=iid, **kw)
+                current.insert(idx, iid)
+            else:
+                if self._shown_values[iid] != row:
+                    self.tree.item(iid, **kw)
+                if current[idx] != iid:
+                    self.tree.move(iid, "", idx)
+                    current.remove(iid)
+                    current.insert(idx, iid)
+            self._shown_values[iid] = row
+        self._shown = wanted
+
+        self._sync_selection()
+        if self._focus in wanted_set:
+            self.tree.focus(self._focus)
+        n = len(self.rows)
+        if n:
+            self.scrollbar.set(self._top / n, min(1.0, (self._top + page) / n))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _sync_selection(self) -> None:
+        """Mirrors the model selection onto the materialised rows."""
+        want = tuple(iid for iid in self._shown if iid in self._selected)
+        if set(want) != set(self.tree.selection()):
+            self.tree.selection_set(want)
+
+    # --- Events ---
+    def _schedule_notify(self) -> None:
+        if not self._notify_pending:
+            self._notify_pending = True
+            self.after_idle(self._notify)
+
+    def _notify(self) -> None:
+        self._notify_pending = False
+        for cb in self._select_callbacks:
+            cb(None)
+
+    def _remember_modifiers(self, e: tk.Event) -> None:
+        self._modifiers = int(e.state)
+
+    def _on_tree_select(self, e: tk.Event) -> None:
+        tree_sel = self.tree.selection()
+        shown = set(self._shown)
+        if set(tree_sel) == {iid for iid in self._selected if iid in shown}:
+            return  # echo of our own _sync_selection
+        if self._modifiers & 0x0005:  # Shift / Control: extend the selection
+            new = {iid: None for iid in self._selected if iid not in shown}
+            new.update((iid, None) for iid in tree_sel)
+        else:
+            new = {iid: None for iid in tree_sel}
+        self._modifiers = 0
+        self._selected = new
+        focus = self.tree.focus()
+        if focus:
+            self._focus = focus
+        self._schedule_notify()
+
+    def _on_wheel(self, e: tk.Event) -> str:
+        self._scroll_by(-3 if e.delta > 0 else 3)
+        return "break"
+
+    def _scroll_by(self, rows: int) -> str:
+        self._top += rows
+        self._render()
+        return "break"
+
+    def _on_scrollbar(self, *args: str) -> None:
+        n = len(self.rows)
+        if args[0] == "moveto":
+            self._top = int(float(args[1]) * n)
+        elif args[0] == "scroll":
+            step = int(args[1])
+            self._top += step * (self._page_size() if args[2] == "pages" else 1)
+        self._render()
+
+    def _move_cursor(self, step: int) -> str:
+        if not self.rows:
+            return "break"
+        pos = self._pos.get(self._focus)
+        pos = 0 if pos is None else max(0, min(len(self.rows) - 1, pos + step))
+        iid = self.rows[pos]
+        self._focus = iid
+        self.see(iid)
+        self.selection_set(iid)
+        return "break"
+
 
 class IdentityView:
     def __init__(self, parent: tk.Widget, context: Any):
@@ -400,12 +1653,43 @@ class IdentityView:
         self.logic: IdentityLogic = IdentityLogic(self.fps)
         self.history: HistoryManager = HistoryManager()
         self.load_queue: queue.Queue = queue.Queue()
+        # During a progressive load: ops wait here until the new journal starts,
+        # and the previous history is kept in case the load fails
+        self._journal_backlog: Optional[List[dict]] = None
+        self._history_before_load: Optional[HistoryManager] = None
+        # True from the start of a journal recovery until its result is handled:
+        # the state is rebuilt outside the history, so no edit may interleave
+        self._recovering: bool = False
         
         # --- PARAMETRI CONFIGURABILI ---
         self.param_lookahead: int = 15      
         self.param_time_gap: float = 2.0      
         self.param_stitch_dist: int = 150   
         self.param_noise_dist: int = 100    
+        self.param_appearance_weight: float = 0.5
+
+        # Last rule set used for bulk role assignment (see hermes_role_rules)
+        self.role_rules_text: str = "# <role>: <condition>, first match wins\nNoise: dur < 0.5\n"
+
+        # Appearance embeddings (background extraction, see hermes_appearance)
+        self.appearance_queue: queue.Queue = queue.Queue()
+        self._appearance_cancel: threading.Event = threading.Event()
+        self._appearance_thread: Optional[threading.Thread] = None
+
+        # Track thumbnails (background sequential decode, per-video cache)
+        self.THUMB_CELL: Tuple[int, int] = (24, 48)
+        self.THUMB_COUNT: int = 3
+        self.show_thumbs_var: tk.BooleanVar = tk.BooleanVar(value=True)
+        self.thumbnails: Dict[int, bytes] = {}
+        self._thumb_photos: "OrderedDict[int, Any]" = OrderedDict()
+        self.thumbs_queue: queue.Queue = queue.Queue()
+        self._thumbs_cancel: threading.Event = threading.Event()
+        self._thumbs_thread: Optional[threading.Thread] = None
+
+        # Role proposal (background solve; edits wait until it ends)
+        self.PROPOSE_TIME_LIMIT: float = 60.0
+        self.propose_queue: queue.Queue = queue.Queue()
+        self._propose_cancel: Optional[threading.Event] = None
 
         # CAST
         if self.context.cast:
@@ -430,17 +1714,26 @@ class IdentityView:
         self._video_orig_w: int = 0
         self._video_orig_h: int = 0
 
+        # Rasterised timeline cache (see _draw_timeline)
+        self._timeline_key: Optional[tuple] = None
+        self._timeline_img: Optional[ImageTk.PhotoImage] = None
+
         self._setup_ui()
         self._setup_hotkeys()
         
+        # --- AUTOSAVE INIT ---
+        # Every operation is appended to the journal; the periodic autosave
+        # only writes a compact checkpoint when something changed.
+        self.AUTOSAVE_INTERVAL_MS: int = 300000
+        self.AUTOSAVE_FILENAME: str = "hermes_autosave_identity.json"  # legacy full-state autosave
+        self.JOURNAL_FILENAME: str = "hermes_autosave_identity.journal"
+        self.journal: OperationJournal = OperationJournal(self._get_autosave_path(self.JOURNAL_FILENAME))
+        recovering = self._check_for_autosave()
+
         # AUTO-LOAD
-        if self.context.video_path and self.context.pose_data_path:
+        if not recovering and self.context.video_path and self.context.pose_data_path:
             self.load_data_direct(self.context.video_path, self.context.pose_data_path)
 
-        # --- AUTOSAVE INIT ---
-        self.AUTOSAVE_INTERVAL_MS: int = 300000
-        self.AUTOSAVE_FILENAME: str = "hermes_autosave_identity.json"
-        self._check_for_autosave()
         self._start_autosave_loop()
         
         self._toplevel = self.parent.winfo_toplevel()
@@ -507,9 +1800,16 @@ class IdentityView:
         
         chk = tk.Checkbutton(tools, text="Hide short (<1s)", variable=self.hide_short_var, command=self.refresh_tree)
         chk.pack(side=tk.LEFT, padx=5)
+        tk.Checkbutton(tools, text="Thumbs", variable=self.show_thumbs_var,
+                       command=self._toggle_thumbnails).pack(side=tk.LEFT, padx=5)
+        self.lbl_thumbs = tk.Label(tools, text="", fg="gray")
+        self.lbl_thumbs.pack(side=tk.LEFT, padx=5)
 
         tk.Button(tools, text="⚙ Parameters", command=self.open_settings_dialog).pack(side=tk.RIGHT, padx=5)
         tk.Button(tools, text="📜 Log", command=self.show_audit_log_window).pack(side=tk.RIGHT, padx=5)
+        tk.Button(tools, text="🧬 Appearance", command=self.extract_appearance_logic).pack(side=tk.RIGHT, padx=5)
+        self.lbl_appearance = tk.Label(tools, text="", fg="gray")
+        self.lbl_appearance.pack(side=tk.RIGHT, padx=5)
         
         row1 = tk.Frame(lbl_tracks)
         row1.pack(fill=tk.X, pady=2)
@@ -521,8 +1821,17 @@ class IdentityView:
         tk.Button(row2, text="🔗 Merge Selected", command=self.manual_merge).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
         tk.Button(row2, text="🔗 Merge ALL by Role", bg="#d1e7dd", command=self.merge_all_by_role).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
 
+        row3 = tk.Frame(lbl_tracks)
+        row3.pack(fill=tk.X, pady=2)
+        self.btn_propose = tk.Button(row3, text="🎯 Propose Roles", command=self.propose_roles)
+        self.btn_propose.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        tk.Button(row3, text="📐 Role Rules", command=self.open_role_rules_dialog).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+
         cols = ("ID", "Origin", "Duration", "Assigned To")
-        self.tree = ttk.Treeview(lbl_tracks, columns=cols, show="headings", selectmode="extended")
+        self.tree_style = ttk.Style()
+        self.tree = VirtualTrackTree(lbl_tracks, cols, self._tree_row, show="tree headings", style="Thumbs.Treeview")
+        self.tree.heading("#0", text="")
+        self._apply_thumb_layout()
         self.tree.heading("ID", text="ID")
         self.tree.heading("Origin", text="Story")
         self.tree.heading("Duration", text="Sec")
@@ -533,10 +1842,7 @@ class IdentityView:
         self.tree.column("Duration", width=50)
         self.tree.column("Assigned To", width=100)
 
-        sb = ttk.Scrollbar(lbl_tracks, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=sb.set)
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        sb.pack(side=tk.RIGHT, fill=tk.Y)
 
         self.tree.bind("<Button-3>", self.show_context_menu)
         self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
@@ -549,12 +1855,16 @@ class IdentityView:
     #  TIMELINE VISIVA                                                     #
     # ------------------------------------------------------------------ #
     def _draw_timeline(self) -> None:
-        """Draws horizontal colored bars on the timeline canvas showing
-        where each assigned track is active.  Unassigned ('Ignore') tracks
-        are drawn as thin grey lines; cast members use their assigned colour."""
+        """Shows the track-coverage timeline and moves the playhead.
+
+        Coverage is painted into an off-screen image (grey stippled spans for
+        unassigned tracks, one coloured row per cast role) and re-rendered
+        only when the tracks, the cast colours or the canvas size change.
+        A regular frame update just moves the playhead line."""
         c = self.timeline_canvas
-        c.delete("all")
         if self.total_frames == 0 or not self.logic.tracks:
+            c.delete("all")
+            self._timeline_key = None
             return
 
         cw: int = c.winfo_width()
@@ -562,70 +1872,76 @@ class IdentityView:
         if cw < 10:
             return  # not yet laid out
 
+        key = (self.logic.version, tuple((role, tuple(v['color'])) for role, v in self.cast.items()),
+               cw, ch, self.total_frames)
+        if key != self._timeline_key:
+            self._timeline_key = key
+            role_order: List[str] = list(self.cast.keys())
+            row_h = max(4, (ch - 14) // max(len(role_order), 1))  # leave room for playhead
+            rgb = self._render_timeline(cw, ch, role_order, row_h)
+            self._timeline_img = ImageTk.PhotoImage(image=Image.fromarray(rgb))
+            c.delete("all")
+            c.create_image(0, 0, image=self._timeline_img, anchor="nw")
+            for i, role in enumerate(role_order):
+                y = i * row_h + row_h // 2
+                c.create_text(4, y, text=role, anchor="w", fill="white", font=("Segoe UI", 7))
+            c.create_line(0, 0, 0, ch, fill="white", width=2, tags="playhead")
+
+        px = int(self.current_frame * cw / self.total_frames)
+        c.coords("playhead", px, 0, px, ch)
+
+    @staticmethod
+    def _span_mask(x0: np.ndarray, x1: np.ndarray, width: int) -> np.ndarray:
+        """Boolean column mask covered by the half-open pixel spans [x0, x1)."""
+        x0 = np.clip(x0, 0, width)
+        x1 = np.clip(x1, 0, width)
+        edges = np.bincount(x0, minlength=width + 1) - np.bincount(x1, minlength=width + 1)
+        return np.cumsum(edges[:width]) > 0
+
+    def _render_timeline(self, cw: int, ch: int, role_order: List[str], row_h: int) -> np.ndarray:
+        """Paints the coverage timeline as an RGB array (ch, cw, 3)."""
+        img = np.empty((ch, cw, 3), dtype=np.uint8)
+        img[:] = (0x1e, 0x1e, 0x1e)
         scale: float = cw / self.total_frames
 
-        # Collect tracks that belong to the cast first, then the rest
-        cast_tracks: List[Tuple[int, dict]] = []
-        other_tracks: List[Tuple[int, dict]] = []
-        for tid in sorted(self.logic.tracks.keys()):
-            d = self.logic.tracks[tid]
-            if d['role'] in self.cast:
-                cast_tracks.append((tid, d))
-            else:
-                other_tracks.append((tid, d))
-
-        # Assign a row to each cast role
-        role_order: List[str] = list(self.cast.keys())
-        n_roles = max(len(role_order), 1)
-        row_h = max(4, (ch - 14) // n_roles)  # leave room for playhead
-
-        # Draw "Ignore" tracks as thin grey background bars (all in row 0 area, semi-transparent)
-        for tid, d in other_tracks:
-            if not d['frames']:
-                continue
-            x0 = int(d['frames'][0] * scale)
-            x1 = max(x0 + 1, int(d['frames'][-1] * scale))
-            c.create_rectangle(x0, 0, x1, ch - 14, fill="#3a3a3a", outline="", stipple="gray25")
-
-        # Draw cast tracks as solid colored bars
-        for tid, d in cast_tracks:
-            if not d['frames']:
-                continue
-            role = d['role']
-            if role not in role_order:
+        by_role: Dict[str, List[np.ndarray]] = {role: [] for role in role_order}
+        other_first: List[int] = []
+        other_last: List[int] = []
+        with self.logic.lock:
+            for d in self.logic.tracks.values():
+                if not len(d['frames']):
+                    continue
+                if d['role'] in by_role:
+                    by_role[d['role']].append(d['frames'])
+                else:
+                    other_first.append(d['frames'][0])
+                    other_last.append(d['frames'][-1])
+
+        # Unassigned tracks: first-to-last frame span, 25% stipple
+        if other_first:
+            x0 = (np.array(other_first) * scale).astype(np.int64)
+            x1 = np.maximum(x0 + 1, (np.array(other_last) * scale).astype(np.int64))
+            cols = self._span_mask(x0, x1, cw)
+            band_h = max(ch - 14, 0)
+            stipple = np.zeros((band_h, cw), dtype=bool)
+            stipple[::2, ::2] = True
+            img[:band_h][stipple & cols[None, :]] = (0x3a, 0x3a, 0x3a)
+
+        # Cast tracks: contiguous segments in the role's row
+        for row_idx, role in enumerate(role_order):
+            if not by_role[role]:
                 continue
-            row_idx = role_order.index(role)
+            frames = np.concatenate(by_role[role])
+            breaks = np.flatnonzero(np.diff(frames) != 1)
+            seg_start = frames[np.concatenate(([0], breaks + 1))]
+            seg_end = frames[np.concatenate((breaks, [len(frames) - 1]))]
+            x0 = (seg_start * scale).astype(np.int64)
+            x1 = np.maximum(x0 + 1, (seg_end * scale).astype(np.int64))
+            cols = self._span_mask(x0, x1, cw)
             y0 = row_idx * row_h
-            y1 = y0 + row_h - 1
-
             b, g, r = self.cast[role]['color']
-            hex_col = '#{:02x}{:02x}{:02x}'.format(r, g, b)
-
-            # Find contiguous segments to draw fewer rectangles
-            frames = d['frames']
-            seg_start = frames[0]
-            prev = frames[0]
-            for fi in range(1, len(frames)):
-                if frames[fi] > prev + 1:
-                    # end of segment
-                    x0 = int(seg_start * scale)
-                    x1 = max(x0 + 1, int(prev * scale))
-                    c.create_rectangle(x0, y0, x1, y1, fill=hex_col, outline="")
-                    seg_start = frames[fi]
-                prev = frames[fi]
-            # last segment
-            x0 = int(seg_start * scale)
-            x1 = max(x0 + 1, int(prev * scale))
-            c.create_rectangle(x0, y0, x1, y1, fill=hex_col, outline="")
-
-        # Draw playhead
-        px = int(self.current_frame * scale)
-        c.create_line(px, 0, px, ch, fill="white", width=2)
-
-        # Draw role labels
-        for i, role in enumerate(role_order):
-            y = i * row_h + row_h // 2
-            c.create_text(4, y, text=role, anchor="w", fill="white", font=("Segoe UI", 7))
+            img[y0:y0 + row_h - 1, cols] = (r, g, b)
+        return img
 
     def _on_timeline_click(self, event: tk.Event) -> None:
         """Seek to the frame the user clicked on in the timeline."""
@@ -679,6 +1995,7 @@ class IdentityView:
         for i in range(1, 10):
             root.bind(str(i), self._on_number)
         root.bind("<Control-z>", self.perform_undo)
+        root.bind("<Control-y>", self.perform_redo)
 
     def _is_hotkey_safe(self) -> bool:
         if not self.parent.winfo_viewable():
@@ -726,17 +2043,85 @@ class IdentityView:
             pass
 
     def _snapshot(self) -> None:
-        tracks, id_lineage = self.logic.get_data()
-        self.history.push_state((tracks, id_lineage))
+        """Opens an undo step; close it with _commit_history() after the operation."""
+        self.logic.begin_transaction()
+
+    def _commit_history(self) -> None:
+        delta = self.logic.end_transaction()
+        if delta is not None:
+            self.history.push(delta)
+
+    def _execute(self, op: dict) -> Any:
+        """Runs an operation as one undo step and appends it to the journal.
+        If the operation raises, whatever it changed is rolled back and
+        nothing is journaled."""
+        self._snapshot()
+        done = False
+        try:
+            result = self.logic.apply_operation(op)
+            done = True
+        finally:
+            if done:
+                self._commit_history()
+            else:
+                delta = self.logic.end_transaction()
+                if delta is not None:
+                    self.logic.apply_delta(delta, undo=True)
+        self._journal_append(op)
+        return result
+
+    def _journal_append(self, op: dict) -> None:
+        if self._journal_backlog is not None:
+            self._journal_backlog.append(op)
+        else:
+            self.journal.append(op)
+
+    def _ensure_loaded(self, ids: Optional[List[int]] = None) -> bool:
+        """False (with a notice) while a progressive load can still change the
+        data the operation needs: the given tracks, or the whole session.
+        Also False while a role proposal is being computed or a session is
+        being recovered."""
+        if self._propose_cancel is not None:
+            messagebox.showinfo("Busy", "Please wait: the role proposal is still running (or cancel it).")
+            return False
+        if self._recovering:
+            messagebox.showinfo("Busy", "Please wait: the session is still being recovered.")
+            return False
+        if self.logic.tracks_loaded(ids):
+            return True
+        what = "these tracks are" if ids is not None else "the pose file is"
+        messagebox.showinfo("Loading", f"Please wait: {what} still loading "
+                                       f"(frame {self.logic.loaded_until} of {self.total_frames}).")
+        return False
+
+    def _history_busy(self) -> bool:
+        """True while a load or recovery rebuilds the state outside the history,
+        or while a role proposal reads the tracks."""
+        if self._propose_cancel is not None or self._recovering:
+            return True
+        return self.logic.loaded_until is not None and self._journal_backlog is None
 
     def perform_undo(self, event: Optional[tk.Event] = None) -> None:
-        prev_state = self.history.undo()
-        if prev_state is not None:
-            tracks, id_lineage = prev_state
-            self.logic.set_data(tracks, id_lineage)
+        if self._history_busy():
+            return
+        delta = self.history.undo()
+        if delta is not None:
+            self.logic.apply_delta(delta, undo=True)
+            self._journal_append({'op': 'undo'})
+            self.refresh_tree()
+            self.show_frame()
+            print(f"Undo performed: {delta['action']}")
+
+    def perform_redo(self, event: Optional[tk.Event] = None) -> None:
+        if self._history_busy():
+            return
+        delta = self.history.redo()
+        if delta is not None:
+            self.logic.apply_delta(delta, undo=False)
+            self._journal_append({'op': 'redo'})
             self.refresh_tree()
             self.show_frame()
-            print("Undo performed.")
+            print(f"Redo performed: {delta['action']}")
     
     def _start_autosave_loop(self) -> None:
         try:
@@ -745,40 +2130,47 @@ class IdentityView:
             pass # Widget destroyed
 
     def _perform_autosave(self) -> None:
-        tracks, lineage = self.logic.get_data_snapshot()
-        audit_log = self.logic.get_audit_log()
-        if not tracks:
+        """Writes a compact checkpoint if the journal grew since the last one."""
+        journal = self.journal
+        seq, generation = journal.seq, journal.generation
+        if not journal.is_open or seq == journal.checkpoint_seq:
             self._start_autosave_loop()
             return
 
-        save_path = self._get_autosave_path()
+        state = self.logic.pack_state()
 
-        def save_task(data_to_save: dict, filepath: str) -> None:
+        def save_task() -> None:
             try:
-                tmp_path = filepath + ".tmp"
-                with open(tmp_path, 'w') as f:
-                    json.dump(data_to_save, f)
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                os.rename(tmp_path, filepath)
-                print(f"[Autosave] Saved to {filepath}")
+                if journal.write_checkpoint(state, seq, generation):
+                    print(f"[Autosave] Checkpoint at operation {seq}: {journal.checkpoint_path}")
             except Exception as e:
                 print(f"[Autosave] Error: {e}")
 
-        data_to_save = {
-            'tracks': tracks,
-            'id_lineage': lineage,
-            'audit_log': audit_log
-        }
-        threading.Thread(target=save_task, args=(data_to_save, save_path), daemon=True).start()
+        threading.Thread(target=save_task, daemon=True).start()
         self._start_autosave_loop()
 
-    def _get_autosave_path(self) -> str:
+    def _get_autosave_path(self, filename: Optional[str] = None) -> str:
+        filename = filename or self.AUTOSAVE_FILENAME
         if self.context and self.context.project_root:
-            return os.path.join(self.context.project_root, self.AUTOSAVE_FILENAME)
-        return self.AUTOSAVE_FILENAME
+            return os.path.join(self.context.project_root, filename)
+        return filename
+
+    def _check_for_autosave(self) -> bool:
+        """Offers to recover an interrupted session. Returns True if a recovery load was started."""
+        if os.path.exists(self.journal.path):
+            try:
+                header, ops, checkpoint = OperationJournal.read(self.journal.path)
+            except OSError as e:
+                print(f"[Autosave] Cannot read journal: {e}")
+                header, ops, checkpoint = None, [], None
+            if header and (ops or checkpoint):
+                if messagebox.askyesno("Recovery", "Found an unsaved session from a previous run "
+                                       f"({len(ops)} operations).\nDo you want to restore it?"):
+                    self._start_recovery(header, ops, checkpoint)
+                    return True
+            self.journal.close(delete=True)
+            return False
 
-    def _check_for_autosave(self) -> None:
         path = self._get_autosave_path()
         if os.path.exists(path):
             if messagebox.askyesno("Recovery", "Found an autosave file from a previous session.\nDo you want to restore it?"):
@@ -793,7 +2185,7 @@ class IdentityView:
                         tracks_data, lineage_data = saved_data, {}
                         audit_data = []
 
-                    tracks = {int(k): v for k, v in tracks_data.items()}
+                    tracks = tracks_from_json(tracks_data)
                     id_lineage = {int(k): v for k, v in lineage_data.items()}
 
                     if not id_lineage:
@@ -803,12 +2195,18 @@ class IdentityView:
                                 id_lineage[merged] = tid
                     
                     self.logic.set_data(tracks, id_lineage)
+                    self.history.clear()
                     if audit_data:
                         self.logic.set_audit_log(audit_data)
 
-                    self.refresh_tree()
-                    self.show_frame()
+                    # The restored state has no pose-file base: journal it from a checkpoint
+                    self.journal.start(self.context.pose_data_path, self.context.video_path, checkpoint_base=True)
+                    self.journal.write_checkpoint(self.logic.pack_state(), 0)
+                    os.remove(path)
+                    self.load_data_direct(self.context.video_path, None)
+                    self.json_path = self.context.pose_data_path
                     print(f"Restored autosave: {path}")
+                    return True
                 except Exception as e:
                     messagebox.showerror("Error", f"Corrupt autosave file: {e}")
             else:
@@ -816,8 +2214,59 @@ class IdentityView:
                     os.remove(path)
                 except OSError:
                     pass
+        return False
+
+    def _start_recovery(self, header: dict, ops: List[dict], checkpoint: Optional[dict]) -> None:
+        self._end_proposal()
+        video_path = header.get('video_path')
+        if video_path and os.path.exists(video_path):
+            self.load_data_direct(video_path, None)
+        self.json_path = header.get('pose_path')
+        self.context.pose_data_path = self.json_path
+        self._recovering = True
+        self._show_progress()
+        threading.Thread(target=self._recover_thread, args=(header, ops, checkpoint), daemon=True).start()
+        self.parent.after(100, self._check_load_queue)
+
+    def _recover_thread(self, header: dict, ops: List[dict], checkpoint: Optional[dict]) -> None:
+        """Rebuilds the session: latest checkpoint + later ops, or pose file + all ops."""
+        try:
+            self._load_cached_appearance(header.get('pose_path'))
+            history = HistoryManager()
+            restored = False
+            if checkpoint and os.path.exists(self.journal.checkpoint_path):
+                try:
+                    with np.load(self.journal.checkpoint_path) as data:
+                        if int(data['seq']) == checkpoint['seq']:
+                            self.logic.unpack_state(data)
+                            restored = True
+                except (OSError, KeyError, ValueError) as e:
+                    print(f"[Recovery] Checkpoint unusable: {e}")
+            if restored:
+                later = [op for op in ops if op['seq'] > checkpoint['seq']]
+                misses = self.logic.replay_operations(later, history)
+                # An undo reaching back before the checkpoint needs the full replay
+                if misses and not header.get('checkpoint_base'):
+                    restored = False
+            if not restored:
+                if header.get('checkpoint_base'):
+                    raise ValueError("The session checkpoint is missing or corrupt.")
+                history = HistoryManager()
+                self.logic.load_from_json_gz(header['pose_path'])
+                self.logic.replay_operations(ops, history)
+            has_untracked = any(oid >= SYNTHETIC_ID_BASE for oid in self.logic.id_lineage)
+            last_seq = ops[-1]['seq'] if ops else 0
+            cp_seq = checkpoint['seq'] if checkpoint else 0
+            self.load_queue.put(("recovered", has_untracked, history, last_seq, cp_seq))
+        except Exception as e:
+            self.load_queue.put(("error", str(e)))
 
     def _on_close(self) -> None:
+        self._appearance_cancel.set()
+        self._thumbs_cancel.set()
+        if self._propose_cancel is not None:
+            self._propose_cancel.set()
+        self.journal.close(delete=True)
         path = self._get_autosave_path()
         if os.path.exists(path):
             try:
@@ -833,12 +2282,13 @@ class IdentityView:
         """Opens a popup window to modify hardcoded parameters."""
         win = tk.Toplevel(self.parent)
         win.title("Algorithm Settings")
-        win.geometry("350x250")
+        win.geometry("350x280")
         
         v_lookahead = tk.IntVar(value=self.param_lookahead)
         v_time = tk.DoubleVar(value=self.param_time_gap)
         v_s_dist = tk.IntVar(value=self.param_stitch_dist)
         v_n_dist = tk.IntVar(value=self.param_noise_dist)
+        v_app = tk.DoubleVar(value=self.param_appearance_weight)
         
         tk.Label(win, text="1. Auto-Stitching", font=("bold")).pack(pady=(10,5))
         
@@ -857,6 +2307,11 @@ class IdentityView:
         tk.Label(f3, text="Max Distance (px):").pack(side=tk.LEFT)
         tk.Entry(f3, textvariable=v_s_dist, width=8).pack(side=tk.RIGHT)
 
+        f5 = tk.Frame(win)
+        f5.pack(fill=tk.X, padx=20)
+        tk.Label(f5, text="Appearance Weight (0-1):").pack(side=tk.LEFT)
+        tk.Entry(f5, textvariable=v_app, width=8).pack(side=tk.RIGHT)
+
         tk.Label(win, text="2. Noise Absorption", font=("bold")).pack(pady=(10,5))
         
         f4 = tk.Frame(win)
@@ -869,6 +2324,7 @@ class IdentityView:
             self.param_time_gap = v_time.get()
             self.param_stitch_dist = v_s_dist.get()
             self.param_noise_dist = v_n_dist.get()
+            self.param_appearance_weight = min(max(v_app.get(), 0.0), 1.0)
             win.destroy()
             messagebox.showinfo("Save", "Parameters updated successfully.")
 
@@ -876,34 +2332,229 @@ class IdentityView:
 
     def absorb_noise_logic(self) -> None:
         """Supervised Noise Absorption using configurable parameters."""
-        if not messagebox.askyesno("Confirm", f"Absorb noise (Dist < {self.param_noise_dist}px)? This cannot be undone in one step."):
+        if not self._ensure_loaded():
             return
-        self._snapshot()
-        
-        absorbed = self.logic.absorb_noise(self.cast, self.param_noise_dist, self.param_time_gap)
+        if not messagebox.askyesno("Confirm", f"Absorb noise (Dist < {self.param_noise_dist}px)? (Ctrl+Z to undo)"):
+            return
+        absorbed = self._execute({'op': 'absorb_noise', 'roles': list(self.cast),
+                                  'noise_dist': self.param_noise_dist, 'time_gap': self.param_time_gap})
         
         self.refresh_tree()
         messagebox.showinfo("Info", f"Assorbiti {absorbed} frammenti.")
 
     def auto_stitch(self) -> None:
         """Unsupervised Auto-Stitching using configurable parameters."""
-        if not messagebox.askyesno("Confirm", "Run auto-stitching? This may merge unrelated tracks and cannot be undone in one step."):
+        if not self._ensure_loaded():
+            return
+        if not messagebox.askyesno("Confirm", "Run auto-stitching? This may merge unrelated tracks (Ctrl+Z to undo)."):
             return
-        self._snapshot()
         p_win = self.param_lookahead
         p_time = self.param_time_gap
         p_dist = self.param_stitch_dist
         
-        merged = self.logic.auto_stitch(p_win, p_time, p_dist)
+        p_app = self.param_appearance_weight if self.logic.has_appearance() else 0.0
         
+        merged = self._execute({'op': 'auto_stitch', 'lookahead': p_win, 'time_gap': p_time, 'stitch_dist': p_dist,
+                                'appearance_weight': p_app})
+        
+        self.refresh_tree()
+        messagebox.showinfo("Info", f"Stitched {merged} fragments (Lookahead:{p_win}, Time:{p_time}s, Dist:{p_dist}px, Appearance:{p_app}).")
+
+    def propose_roles(self) -> None:
+        """Proposes a role for every unassigned fragment of the session in the
+        background and applies the confirmed proposal as one undo step.
+        While the solve runs the button cancels it."""
+        if self._propose_cancel is not None:
+            self._end_proposal()
+            return
+        if not self._ensure_loaded():
+            return
+        p_app = self.param_appearance_weight if self.logic.has_appearance() else 0.0
+        cancel = threading.Event()
+        self._propose_cancel = cancel
+        self.btn_propose.config(text="⏹ Cancel Proposal")
+        self._show_progress()
+        threading.Thread(target=self._propose_worker,
+                         args=(list(self.cast), self.param_lookahead, self.param_time_gap,
+                               self.param_stitch_dist, p_app, cancel), daemon=True).start()
+        self.parent.after(100, self._check_propose_queue)
+
+    def _propose_worker(self, roles: List[str], lookahead: int, time_gap: float, stitch_dist: float,
+                        appearance_weight: float, cancel: threading.Event) -> None:
+        try:
+            proposal = self.logic.propose_role_assignment(
+                roles, lookahead, time_gap, stitch_dist, appearance_weight,
+                time_limit=self.PROPOSE_TIME_LIMIT, cancel=cancel,
+                progress=lambda pass_no: self.propose_queue.put(("progress", cancel, pass_no)))
+            self.propose_queue.put(("done", cancel, proposal))
+        except Exception as e:
+            self.propose_queue.put(("error", cancel, str(e)))
+
+    def _check_propose_queue(self) -> None:
+        try:
+            while True:
+                status, cancel, payload = self.propose_queue.get_nowait()
+                if cancel is not self._propose_cancel:
+                    continue  # a cancelled run finishing late
+                if status == "progress":
+                    self.btn_propose.config(text=f"⏹ Cancel Proposal (pass {payload})")
+                    continue
+                break
+        except queue.Empty:
+            if self._propose_cancel is not None:
+                self.parent.after(100, self._check_propose_queue)
+            return
+        cancelled = cancel.is_set()
+        self._end_proposal()
+        if status == "error":
+            messagebox.showerror("Error", f"Role proposal failed: {payload}")
+            return
+        if cancelled or payload is None:
+            return
+        proposal = payload
+        if not proposal:
+            messagebox.showinfo("Info", "No proposal: assign at least one track to each person first.")
+            return
+        counts: Dict[str, int] = {}
+        for role in proposal.values():
+            counts[role] = counts.get(role, 0) + 1
+        lines = "\n".join(f"  {role}: {counts[role]} fragments" for role in self.cast if role in counts)
+        if not messagebox.askyesno("Confirm", f"Proposed roles for {len(proposal)} fragments:\n{lines}\n\nApply? (Ctrl+Z to undo)"):
+            return
+        if not self._ensure_loaded():
+            return
+        self._execute({'op': 'assign_roles', 'mapping': {str(tid): role for tid, role in proposal.items()}})
         self.refresh_tree()
-        messagebox.showinfo("Info", f"Stitched {merged} fragments (Lookahead:{p_win}, Time:{p_time}s, Dist:{p_dist}px).")
+        self.show_frame()
+
+    def _end_proposal(self) -> None:
+        """Drops the running proposal (if any) and restores the UI. The worker
+        stops reading the tracks at its next check; its late result is ignored."""
+        if self._propose_cancel is None:
+            return
+        self._propose_cancel.set()
+        self._propose_cancel = None
+        self.btn_propose.config(text="🎯 Propose Roles", state=tk.NORMAL)
+        if self.logic.loaded_until is None:
+            self.progress.stop()
+            self.progress.pack_forget()
+
+    def open_role_rules_dialog(self) -> None:
+        """Edits and applies a rule set for bulk role assignment."""
+        win = tk.Toplevel(self.parent)
+        win.title("Role Rules")
+        win.geometry("520x360")
+
+        tk.Label(win, text="Fields: cx cy w h area x1 y1 x2 y2 start end dur n merged role W H\n"
+                           "Functions: center_in(x1,y1,x2,y2) inside(...) overlaps(...) during(t0,t1) active(t0,t1)",
+                 justify=tk.LEFT, fg="gray").pack(anchor="w", padx=10, pady=(10, 5))
+        text = tk.Text(win, height=12, font=("Consolas", 10))
+        text.pack(fill=tk.BOTH, expand=True, padx=10)
+        text.insert("1.0", self.role_rules_text)
+        v_unassigned = tk.BooleanVar(value=True)
+        tk.Checkbutton(win, text="Only unassigned tracks", variable=v_unassigned).pack(anchor="w", padx=10)
+
+        def apply() -> None:
+            rules = text.get("1.0", tk.END).strip()
+            try:
+                parsed = parse_rules(rules)
+            except ValueError as e:
+                messagebox.showerror("Rule Error", str(e), parent=win)
+                return
+            if not parsed or not self._ensure_loaded():
+                return
+            if uses_frame_size(parsed) and not (self._video_orig_w and self._video_orig_h):
+                messagebox.showerror("Rule Error", "These rules use W / H, but the video frame size is "
+                                                   "not known. Load the video first.", parent=win)
+                return
+            self.role_rules_text = rules
+            try:
+                counts = self._execute({'op': 'role_rules', 'rules': rules, 'only_unassigned': v_unassigned.get(),
+                                        'frame_size': [self._video_orig_w, self._video_orig_h]})
+            except (ValueError, TypeError) as e:
+                messagebox.showerror("Rule Error", str(e), parent=win)
+                return
+            for role in counts:
+                if role not in self.cast and role != "Ignore":
+                    self.cast[role] = {"color": (random.randint(50, 200), random.randint(50, 200), random.randint(50, 200))}
+            win.destroy()
+            self.refresh_cast_list()
+            self.refresh_tree()
+            self.show_frame()
+            lines = "\n".join(f"  {role}: {n} tracks" for role, n in counts.items()) or "  no track changed"
+            messagebox.showinfo("Role Rules", f"Assigned {sum(counts.values())} tracks:\n{lines}")
+
+        tk.Button(win, text="Apply (Ctrl+Z to undo)", command=apply, bg="#4CAF50", fg="white").pack(pady=10)
+
+    # ------------------------------------------------------------------ #
+    #  APPEARANCE EMBEDDINGS                                               #
+    # ------------------------------------------------------------------ #
+    def _load_cached_appearance(self, pose_path: Optional[str]) -> None:
+        """Loads the embedding cache of a pose file, if any (worker thread)."""
+        cached = load_appearance_cache(pose_path) if pose_path else None
+        if cached is None:
+            self.logic.set_appearance(np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+        else:
+            self.logic.set_appearance(cached[0], cached[1])
+
+    def _update_appearance_status(self, text: Optional[str] = None) -> None:
+        if text is None:
+            n = len(self.logic.appearance_ids)
+            text = f"Appearance: {n} tracks" if n else ""
+        self.lbl_appearance.config(text=text)
+
+    def extract_appearance_logic(self) -> None:
+        """Extracts appearance embeddings in the background (one sequential video pass)."""
+        if not (self.video_path and self.json_path and os.path.exists(self.video_path)):
+            messagebox.showwarning("Warning", "Load video and pose data first.")
+            return
+        if self._appearance_thread is not None and self._appearance_thread.is_alive():
+            return
+        models_dir = self.context.paths.get("models") if self.context else None
+        self._appearance_cancel.clear()
+        self._update_appearance_status("Appearance: 0%")
+        self._appearance_thread = threading.Thread(target=self._appearance_worker,
+                                                   args=(self.json_path, self.video_path, models_dir), daemon=True)
+        self._appearance_thread.start()
+        self.parent.after(200, self._check_appearance_queue)
+
+    def _appearance_worker(self, pose_path: str, video_path: str, models_dir: Optional[str]) -> None:
+        try:
+            result = extract_appearance(pose_path, video_path, models_dir,
+                                        progress=lambda p: self.appearance_queue.put(("progress", pose_path, p)),
+                                        cancel=self._appearance_cancel)
+            if result is not None:
+                self.appearance_queue.put(("done", pose_path, result))
+        except Exception as e:
+            self.appearance_queue.put(("error", pose_path, str(e)))
+
+    def _check_appearance_queue(self) -> None:
+        try:
+            while True:
+                status, pose_path, payload = self.appearance_queue.get_nowait()
+                if pose_path != self.json_path:
+                    continue  # a different pose file was loaded meanwhile
+                if status == "progress":
+                    self._update_appearance_status(f"Appearance: {payload:.0%}")
+                elif status == "done":
+                    tids, emb, model_name = payload
+                    self.logic.set_appearance(tids, emb)
+                    self._update_appearance_status()
+                    print(f"Appearance embeddings ready: {len(tids)} tracks ({model_name}).")
+                else:
+                    self._update_appearance_status("")
+                    messagebox.showerror("Error", f"Appearance extraction failed: {payload}")
+        except queue.Empty:
+            pass
+        if self._appearance_thread is not None and (self._appearance_thread.is_alive() or not self.appearance_queue.empty()):
+            self.parent.after(200, self._check_appearance_queue)
 
     def merge_all_by_role(self) -> None:
+        if not self._ensure_loaded():
+            return
         if not messagebox.askyesno("Confirm", "Do you want to merge all tracks assigned to the same role?"):
             return
-        self._snapshot()
-        merge_count, roles_processed = self.logic.merge_all_by_role(self.cast)
+        merge_count, roles_processed = self._execute({'op': 'merge_all_by_role', 'roles': list(self.cast)})
         self.refresh_tree()
         if merge_count > 0:
             msg = f"Merged {merge_count} fragments for: {', '.join(roles_processed)}."
@@ -913,17 +2564,17 @@ class IdentityView:
 
     def manual_merge(self) -> None:
         sel = self.tree.selection()
-        if len(sel) < 2:
+        if len(sel) < 2 or not self._ensure_loaded([int(i) for i in sel]):
             return
-        self._snapshot()
-        
-        master = self.logic.manual_merge(list(sel), self.cast)
+        master = self._execute({'op': 'merge', 'ids': [int(i) for i in sel], 'valid_roles': list(self.cast)})
 
         self.refresh_tree()
         self.tree.selection_set(str(master))
 
     def split_track_at_current_frame(self, track_id: Optional[int] = None, override_frame: Optional[int] = None) -> None:
         """Splits a specific track into two at the specified frame."""
+        if not self._ensure_loaded():
+            return  # the new track ID must not collide with IDs still to be loaded
         if track_id is not None:
             track_id_to_split = track_id
         else:
@@ -951,20 +2602,14 @@ class IdentityView:
                                 "You must be strictly inside the track (after the first frame).")
             return
 
-        try:
-            next(i for i, f in enumerate(track_data['frames']) if f >= split_frame)
-        except StopIteration:
-            return
-
         msg = (f"Splitting track {track_id_to_split} at frame {split_frame}.\n\n"
                "Which part should KEEP the original ID and Role?\n"
                "YES = The PREVIOUS part (up to the cursor)\n"
                "NO = The NEXT part (from the cursor onwards)")
         keep_head = messagebox.askyesno("Confirm Split", msg)
 
-        self._snapshot()
-
-        new_track_id, created_len_or_msg = self.logic.split_track(track_id_to_split, split_frame, keep_head)
+        new_track_id, created_len_or_msg = self._execute({'op': 'split', 'track_id': int(track_id_to_split),
+                                                          'split_frame': int(split_frame), 'keep_head': bool(keep_head)})
 
         if new_track_id is None:
             messagebox.showerror("Split Error", str(created_len_or_msg))
@@ -999,23 +2644,14 @@ class IdentityView:
         text.config(state="disabled")
 
     def refresh_tree(self) -> None:
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        hide = self.hide_short_var.get()
-        for tid in sorted(self.logic.tracks.keys()):
-            d = self.logic.tracks[tid]
-            role = d['role']
-            dur = len(d['frames']) / self.fps
-            if hide and dur < 1.0 and role not in self.cast:
-                continue
-            
-            merged = str(d['merged_from']) if len(d['merged_from']) > 1 else str(tid)
-            tag = "Ignore"
-            if role in self.cast:
-                tag = role
-            
-            self.tree.insert("", "end", iid=str(tid), values=(tid, merged, f"{dur:.2f}", role), tags=(tag,))
-            
+        # Filter and order on the summary arrays; the tree only draws visible rows
+        summ = self.logic.get_track_summary()
+        keep = np.ones(len(summ['tid']), dtype=bool)
+        if self.hide_short_var.get():
+            in_cast = np.isin(summ['role'], list(self.cast))
+            keep = (summ['length'] >= self.fps) | in_cast
+        self.tree.set_rows([str(t) for t in summ['tid'][keep].tolist()])
+
         self.tree.tag_configure("Ignore", background="white")
         for n in self.cast:
             b,g,r = self.cast[n]['color']
@@ -1024,6 +2660,103 @@ class IdentityView:
         # Redraw timeline whenever tree data changes
         self._draw_timeline()
 
+    def _tree_row(self, iid: str) -> Tuple[tuple, tuple]:
+        """Values and tags of one track row (called only for visible rows)."""
+        tid = int(iid)
+        d = self.logic.tracks.get(tid)
+        if d is None:
+            return (tid, "", "", ""), ("Ignore",)
+        role = d['role']
+        dur = len(d['frames']) / self.fps
+        merged = str(d['merged_from']) if len(d['merged_from']) > 1 else str(tid)
+        tag = role if role in self.cast else "Ignore"
+        return (tid, merged, f"{dur:.2f}", role), (tag,), self._thumb_photo(d['merged_from'])
+
+    # ------------------------------------------------------------------ #
+    #  TRACK THUMBNAILS                                                    #
+    # ------------------------------------------------------------------ #
+    def _apply_thumb_layout(self) -> None:
+        if self.show_thumbs_var.get():
+            self.tree_style.configure("Thumbs.Treeview", rowheight=self.THUMB_CELL[1] + 4)
+            self.tree.column("#0", width=self.THUMB_CELL[0] * self.THUMB_COUNT + 8, minwidth=0, stretch=False)
+        else:
+            self.tree_style.configure("Thumbs.Treeview", rowheight=20)
+            self.tree.column("#0", width=0, minwidth=0, stretch=False)
+
+    def _toggle_thumbnails(self) -> None:
+        self._apply_thumb_layout()
+        if self.show_thumbs_var.get() and not self.thumbnails:
+            self._start_thumbnails()
+        self.refresh_tree()
+
+    def _thumb_photo(self, merged_from: List[int]) -> Any:
+        """PhotoImage of a track's first original fragment ("" when unavailable).
+        Only visible rows ask for one, so the LRU stays small."""
+        if not self.show_thumbs_var.get() or not merged_from:
+            return ""
+        oid = merged_from[0]
+        photo = self._thumb_photos.get(oid)
+        if photo is not None:
+            self._thumb_photos.move_to_end(oid)
+            return photo
+        data = self.thumbnails.get(oid)
+        if data is None:
+            return ""
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return ""
+        photo = ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)))
+        self._thumb_photos[oid] = photo
+        if len(self._thumb_photos) > 256:
+            self._thumb_photos.popitem(last=False)
+        return photo
+
+    def _start_thumbnails(self) -> None:
+        """(Re)starts the thumbnail worker for the current video / pose pair."""
+        self._thumbs_cancel.set()
+        self.thumbnails = {}
+        self._thumb_photos.clear()
+        if not (self.show_thumbs_var.get() and self.video_path and self.json_path
+                and os.path.exists(self.video_path) and os.path.exists(self.json_path)):
+            return
+        self._thumbs_cancel = threading.Event()
+        self.lbl_thumbs.config(text="Thumbs: 0%")
+        self._thumbs_thread = threading.Thread(target=self._thumbs_worker,
+                                               args=(self.json_path, self.video_path, self._thumbs_cancel), daemon=True)
+        self._thumbs_thread.start()
+        self.parent.after(200, self._check_thumbs_queue)
+
+    def _thumbs_worker(self, pose_path: str, video_path: str, cancel: threading.Event) -> None:
+        try:
+            thumbs = extract_thumbnails(pose_path, video_path, self.THUMB_COUNT, self.THUMB_CELL,
+                                        progress=lambda p: self.thumbs_queue.put(("progress", pose_path, p)),
+                                        cancel=cancel)
+            if thumbs is not None:
+                self.thumbs_queue.put(("done", pose_path, thumbs))
+        except Exception as e:
+            self.thumbs_queue.put(("error", pose_path, str(e)))
+
+    def _check_thumbs_queue(self) -> None:
+        try:
+            while True:
+                status, pose_path, payload = self.thumbs_queue.get_nowait()
+                if pose_path != self.json_path:
+                    continue
+                if status == "progress":
+                    self.lbl_thumbs.config(text=f"Thumbs: {payload:.0%}")
+                elif status == "done":
+                    self.thumbnails = payload
+                    self._thumb_photos.clear()
+                    self.lbl_thumbs.config(text="")
+                    self.refresh_tree()
+                else:
+                    self.lbl_thumbs.config(text="")
+                    print(f"[Thumbnails] {payload}")
+        except queue.Empty:
+            pass
+        if self._thumbs_thread is not None and (self._thumbs_thread.is_alive() or not self.thumbs_queue.empty()):
+            self.parent.after(200, self._check_thumbs_queue)
+
     def browse_video(self) -> None:
         v = filedialog.askopenfilename(filetypes=[("Video", "*.mp4 *.avi *.mov")]) 
         if v:
@@ -1035,6 +2768,9 @@ class IdentityView:
             self.load_data_direct(self.video_path, j)
 
     def load_data_direct(self, video_path: Optional[str], json_path: Optional[str]) -> None:
+        if self.logic.loaded_until is not None or self._recovering:
+            messagebox.showinfo("Loading", "Please wait for the current pose file to finish loading.")
+            return
         if video_path:
             self.video_path = video_path
             self.context.video_path = video_path
@@ -1047,25 +2783,38 @@ class IdentityView:
             self.cap = cv2.VideoCapture(self.video_path)
             self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
             self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            self._video_orig_w = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self._video_orig_h = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
             self.logic.set_fps(self.fps)
             self.slider.config(to=self.total_frames-1)
         
         if self.json_path and os.path.exists(self.json_path):
-            siblings = [c for c in self.right_panel.winfo_children() if c != self.progress]
-            if siblings:
-                self.progress.pack(fill=tk.X, pady=5, side=tk.TOP, before=siblings[0])
-            else:
-                self.progress.pack(fill=tk.X, pady=5, side=tk.TOP)
-            self.progress.start(10)
+            # The load clears the previous session at once: from here on, undo/redo
+            # and the journal belong to the new one (restored on error).
+            self._end_proposal()
+            self._history_before_load = self.history
+            self.history = HistoryManager()
+            self._journal_backlog = []
+            self._show_progress()
             threading.Thread(target=self._load_json_thread_refactored, args=(self.json_path,), daemon=True).start()
             self.parent.after(100, self._check_load_queue)
         else:
             self.refresh_tree()
             self.show_frame()
 
+    def _show_progress(self) -> None:
+        siblings = [c for c in self.right_panel.winfo_children() if c != self.progress]
+        if siblings:
+            self.progress.pack(fill=tk.X, pady=5, side=tk.TOP, before=siblings[0])
+        else:
+            self.progress.pack(fill=tk.X, pady=5, side=tk.TOP)
+        self.progress.start(10)
+
     def _load_json_thread_refactored(self, path: str) -> None:
         try:
-            has_untracked = self.logic.load_from_json_gz(path)
+            has_untracked = self.logic.load_from_json_gz(
+                path, on_publish=lambda until: self.load_queue.put(("partial", until)))
+            self._load_cached_appearance(path)
             self.load_queue.put(("success", has_untracked))
         except Exception as e:
             self.load_queue.put(("error", str(e)))
@@ -1074,19 +2823,47 @@ class IdentityView:
         try:
             msg = self.load_queue.get_nowait()
             status = msg[0]
-            
+
+            if status == "partial":
+                # Loaded prefix: usable right away, the load goes on
+                self.refresh_tree()
+                self.show_frame()
+                self.parent.after(100, self._check_load_queue)
+                return
+
             self.progress.stop()
             self.progress.pack_forget()
+            self._recovering = False
+            backlog, self._journal_backlog = self._journal_backlog, None
             
-            if status == "success":
-                _, has_untracked = msg
+            if status in ("success", "recovered"):
+                has_untracked = msg[1]
+                if status == "recovered":
+                    _, _, self.history, last_seq, cp_seq = msg
+                    self.journal.resume(last_seq, cp_seq)
+                    print(f"Recovered session: {last_seq} journaled operations.")
+                else:
+                    if backlog is None:
+                        self.history.clear()
+                    self.journal.start(self.json_path, self.video_path)
+                    for op in backlog or ():
+                        self.journal.append(op)
+                self._history_before_load = None
                 if has_untracked:
                     self.hide_short_var.set(False)
                     print("Info: Untracked detections detected (ID -1). 'Hide short' disabled.")
                 
+                self._update_appearance_status()
+                self._start_thumbnails()
                 self.refresh_tree()
                 self.show_frame()
             elif status == "error":
+                if backlog is not None and self._history_before_load is not None:
+                    # The previous session was restored by the logic
+                    self.history = self._history_before_load
+                    self._history_before_load = None
+                    self.refresh_tree()
+                    self.show_frame()
                 messagebox.showerror("Error", f"Failed to load JSON: {msg[1]}")
                 
         except queue.Empty:
@@ -1096,6 +2873,8 @@ class IdentityView:
         if not self.logic.tracks:
             messagebox.showwarning("Warning", "Load video and pose data before loading an identity mapping.")
             return
+        if not self._ensure_loaded():
+            return
 
         f = filedialog.askopenfilename(filetypes=[("Identity JSON", "*.json")])
         if not f:
@@ -1105,16 +2884,18 @@ class IdentityView:
             with open(f, 'r') as file:
                 mapping = json.load(file)
             
-            loaded_count = 0
             new_roles: Set[str] = set()
+            roles_to_assign: Dict[str, str] = {}
             
             for tid_str, role in mapping.items():
                 tid = int(tid_str)
                 if tid in self.logic.tracks:
-                    self.logic.tracks[tid]['role'] = role
-                    loaded_count += 1
+                    roles_to_assign[str(tid)] = role
                     if role not in self.cast and role != "Ignore":
                         new_roles.add(role)
+            loaded_count = len(roles_to_assign)
+            if roles_to_assign:
+                self._execute({'op': 'assign_roles', 'mapping': roles_to_assign})
             
             for role in new_roles:
                 self.cast[role] = {"color": (random.randint(50, 200), random.randint(50, 200), random.randint(50, 200))}
@@ -1132,7 +2913,7 @@ class IdentityView:
             messagebox.showerror("Error", f"Unable to load the file:\n{e}")
 
     def save_mapping(self) -> None:
-        if not self.json_path:
+        if not self.json_path or not self._ensure_loaded():
             return
 
         base_name = os.path.basename(self.json_path).replace(".json.gz", "_identity.json")
@@ -1184,9 +2965,10 @@ class IdentityView:
         if s: 
             n = self.list_cast.get(s[0])
             del self.cast[n]
-            for t in self.logic.tracks.values():
-                if t['role'] == n:
-                    t['role'] = 'Ignore'
+            with self.logic.lock:
+                ids = [tid for tid, t in self.logic.tracks.items() if t['role'] == n]
+            if ids:
+                self._execute({'op': 'assign_role', 'ids': ids, 'role': 'Ignore'})
             self.refresh_cast_list()
             self.refresh_tree()
             
@@ -1236,7 +3018,7 @@ class IdentityView:
                 if tid in self.logic.tracks:
                     t_frames = self.logic.tracks[tid]['frames']
                     # Logic requires: split_frame > first_frame AND split_frame <= last_frame
-                    if t_frames and (frozen_frame_for_split > t_frames[0]) and (frozen_frame_for_split <= t_frames[-1]):
+                    if len(t_frames) and (frozen_frame_for_split > t_frames[0]) and (frozen_frame_for_split <= t_frames[-1]):
                         can_split = True
             except Exception:
                 pass
@@ -1256,7 +3038,9 @@ class IdentityView:
 
     def assign_role_to_selection(self, role: str) -> None:
         selected_ids = [str(i) for i in self.tree.selection()]
-        self.logic.assign_role_to_ids([int(i) for i in selected_ids], role)
+        if not self._ensure_loaded([int(i) for i in selected_ids]):
+            return
+        self._execute({'op': 'assign_role', 'ids': [int(i) for i in selected_ids], 'role': role})
         self.refresh_tree()
         # Restore selection and focus after tree rebuild
         existing = [iid for iid in selected_ids if self.tree.exists(iid)]
@@ -1277,10 +3061,10 @@ class IdentityView:
                 frames = track_data['frames']
 
                 # FIX: Se siamo già dentro la traccia, non saltare all'inizio.
-                if frames and (frames[0] <= self.current_frame <= frames[-1]):
+                if len(frames) and (frames[0] <= self.current_frame <= frames[-1]):
                     return
 
-                self.current_frame = frames[0]
+                self.current_frame = int(frames[0])
                 self.slider.set(self.current_frame)
                 self.show_frame()
             except (ValueError, IndexError, KeyError):
@@ -1291,7 +3075,7 @@ class IdentityView:
         # ma solo quando lo richiedi esplicitamente col doppio click.
         s = self.tree.selection()
         if s: 
-            start_frame = self.logic.tracks[int(s[0])]['frames'][0]
+            start_frame = int(self.logic.tracks[int(s[0])]['frames'][0])
             self.current_frame = start_frame
             self.slider.set(self.current_frame)
             self.show_frame()
@@ -1329,17 +3113,14 @@ class IdentityView:
 
         self._video_orig_h, self._video_orig_w = frame.shape[:2]
 
-        for tid, d in self.logic.tracks.items():
-            if self.current_frame in d['frames']:
-                role = d['role']
-                idx = d['frames'].index(self.current_frame)
-                box = d['boxes'][idx]
-                col = (100,100,100)
-                if role in self.cast:
-                    col = self.cast[role]['color']
-                x1,y1,x2,y2 = map(int, box)
-                cv2.rectangle(frame, (x1,y1), (x2,y2), col, 2)
-                cv2.putText(frame, f"{tid} {role if role!='Ignore' else ''}", (x1,y1-5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, col, 2)
+        for tid, box in self.logic.get_frame_detections(self.current_frame):
+            role = self.logic.tracks[tid]['role']
+            col = (100,100,100)
+            if role in self.cast:
+                col = self.cast[role]['color']
+            x1,y1,x2,y2 = map(int, box)
+            cv2.rectangle(frame, (x1,y1), (x2,y2), col, 2)
+            cv2.putText(frame, f"{tid} {role if role!='Ignore' else ''}", (x1,y1-5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, col, 2)
         frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         img = Image.fromarray(frame)
 
@@ -9,6 +9,8 @@ import threading
 import cv2
 from PIL import Image, ImageTk
 
+from hermes_region import RegionLogic
+
 
 # ═══════════════════════════════════════════════════════════════════
 # MODEL — Pure logic
@@ -21,9 +23,13 @@ class GazeLogic:
 
     def __init__(self):
         self._cancel_flag = False
+        self._region = None  # RegionLogic of a running direct mapping
 
     def cancel(self):
         self._cancel_flag = True
+        region = self._region
+        if region is not None:
+            region.cancel()
 
     # ── AOI Loading ─────────────────────────────────────────────
 
@@ -40,7 +46,10 @@ class GazeLogic:
         """
         # DataFrame, similar to a table, with columns and rows. 
         # Each column has a name and a type, e.g. 'Frame' (int), 'x1' (float), 'Role' (str), etc.
-        df = pd.read_csv(csv_path)
+        if csv_path.lower().endswith(".parquet"):
+            df = pd.read_parquet(csv_path)
+        else:
+            df = pd.read_csv(csv_path)
         # Flexible ID column detection
         if 'ID' in df.columns:
             id_col_name = 'ID'
@@ -224,33 +233,19 @@ class GazeLogic:
         # The offset allows for correcting any temporal misalignment between the gaze data and the video.
         return int((timestamp - offset) * fps)
 
-    # ── Main Mapping Pipeline ───────────────────────────────────
-    
-    def run_mapping(self,
-                    aoi_path: str,
-                    gaze_path: str,
-                    video_res: tuple[int, int],
-                    fps: float,
-                    offset: float,
-                    output_dir: str | None = None,  # <--- Nuovo Parametro
-                    progress_callback=None) -> tuple[str, int]:
-        
-        self._cancel_flag = False
-        W, H = video_res
+    # ── Gaze Streaming ──────────────────────────────────────────
 
-        # 1. Load & index AOI
-        if progress_callback:
-            progress_callback("Loading AOI into memory...")
-        
-        # The load_aoi_data function reads the AOI CSV file and organizes the AOI information into a dictionary.
-        # It also detects which column in the CSV contains the unique identifier for each AOI.
-        aoi_lookup, id_col_name = self.load_aoi_data(aoi_path)
-        
-        if progress_callback:
-            progress_callback(f"AOI indexed ({len(aoi_lookup)} frames). Streaming gaze…")
+    def _iter_gaze_samples(self, gaze_path: str, video_res: tuple[int, int],
+                           fps: float, offset: float):
+        """
+        Stream the gaze file and yield one tuple per usable 2D gaze sample.
 
-        # 2. Stream gaze data 
-        output_rows: list[dict] = []
+        Yields
+        ------
+        (timestamp, frame_idx, px, py, gx, gy)
+            Pixel (px, py) and normalised (gx, gy) gaze position.
+        """
+        W, H = video_res
 
         # With the gazedata.gz file open, it reads it line by line. 
         # (Instead of loading the whole file in memory, it reads line by line).
@@ -293,45 +288,55 @@ class GazeLogic:
                 px, py = self.normalised_to_pixel(gx, gy, W, H)
                 # The normalized gaze coordinates (gx, gy) are converted to pixel coordinates (px, py) using the normalised_to_pixel function. This function multiplies the normalized values by the video resolution (width and height) to get the actual pixel position of the gaze on the video frame.
 
-                # Hit-test
-                # For the current frame index, it retrieves the list of active AOIs from the aoi_lookup dictionary.
-                active_aois = aoi_lookup.get(frame_idx, [])
-                
-                # The calculate_hit function is called to determine if the gaze point (px, py) hits any of the active AOIs in the current frame. 
-                # It checks if the gaze point is within the bounding box of each AOI and returns the one with the smallest area that contains the gaze point. 
-                best = self.calculate_hit(px, py, active_aois, id_col_name)
-
-                if best:
-                    hit_role, hit_aoi, hit_tid = best['role'], best['aoi'], best['tid']
-                    hit_shape = best.get('shape', 'box')
-                    hit_x1, hit_y1, hit_x2, hit_y2 = best['x1'], best['y1'], best['x2'], best['y2']
-                else:
-                    hit_role, hit_aoi, hit_tid = "None", "None", -1
-                    hit_shape = "None"
-                    hit_x1, hit_y1, hit_x2, hit_y2 = -1, -1, -1, -1
-
-
-                output_rows.append({
-                    "Timestamp":    ts,
-                    "Frame_Est":    frame_idx,
-                    "Gaze_X":       px,
-                    "Gaze_Y":       py,
-                    "Hit_Role":     hit_role,
-                    "Hit_AOI":      hit_aoi,
-                    "Hit_TrackID":  hit_tid,
-                    "Hit_Shape":    hit_shape,
-                    "Hit_x1":       hit_x1,
-                    "Hit_y1":       hit_y1,
-                    "Hit_x2":       hit_x2,
-                    "Hit_y2":       hit_y2,
-                    "Raw_Gaze2D_X": gx,
-                    "Raw_Gaze2D_Y": gy,
-                })
+                yield ts, frame_idx, px, py, gx, gy
 
-        # 3. Write output
-        if progress_callback:
-            progress_callback("Saving CSV…")
+    def _map_samples(self, samples, aoi_lookup: dict, id_col_name: str) -> list[dict]:
+        """Hit-test gaze samples against their frame's AOIs and build the output rows."""
+        output_rows: list[dict] = []
+        for ts, frame_idx, px, py, gx, gy in samples:
+            if self._cancel_flag:
+                raise InterruptedError("Mapping cancelled by user.")
+
+            # Hit-test
+            # For the current frame index, it retrieves the list of active AOIs from the aoi_lookup dictionary.
+            active_aois = aoi_lookup.get(frame_idx, [])
+            
+            # The calculate_hit function is called to determine if the gaze point (px, py) hits any of the active AOIs in the current frame. 
+            # It checks if the gaze point is within the bounding box of each AOI and returns the one with the smallest area that contains the gaze point. 
+            best = self.calculate_hit(px, py, active_aois, id_col_name)
+
+            if best:
+                hit_role, hit_aoi, hit_tid = best['role'], best['aoi'], best['tid']
+                hit_shape = best.get('shape', 'box')
+                hit_x1, hit_y1, hit_x2, hit_y2 = best['x1'], best['y1'], best['x2'], best['y2']
+            else:
+                hit_role, hit_aoi, hit_tid = "None", "None", -1
+                hit_shape = "None"
+                hit_x1, hit_y1, hit_x2, hit_y2 = -1, -1, -1, -1
+
+
+            output_rows.append({
+                "Timestamp":    ts,
+                "Frame_Est":    frame_idx,
+                "Gaze_X":       px,
+                "Gaze_Y":       py,
+                "Hit_Role":     hit_role,
+                "Hit_AOI":      hit_aoi,
+                "Hit_TrackID":  hit_tid,
+                "Hit_Shape":    hit_shape,
+                "Hit_x1":       hit_x1,
+                "Hit_y1":       hit_y1,
+                "Hit_x2":       hit_x2,
+                "Hit_y2":       hit_y2,
+                "Raw_Gaze2D_X": gx,
+                "Raw_Gaze2D_Y": gy,
+            })
+        return output_rows
 
+    @staticmethod
+    def _save_mapped(output_rows: list[dict], gaze_path: str,
+                     output_dir: str | None) -> tuple[str, int]:
+        """Write the <gaze>_MAPPED.csv file and return its path and row count."""
         base_name = os.path.basename(gaze_path).replace(".gz", "")
         filename = f"{base_name}_MAPPED.csv"
 
@@ -348,6 +353,94 @@ class GazeLogic:
 
         return out_path, len(df_out)
 
+    # ── Main Mapping Pipeline ───────────────────────────────────
+    
+    def run_mapping(self,
+                    aoi_path: str,
+                    gaze_path: str,
+                    video_res: tuple[int, int],
+                    fps: float,
+                    offset: float,
+                    output_dir: str | None = None,  # <--- Nuovo Parametro
+                    progress_callback=None) -> tuple[str, int]:
+        
+        self._cancel_flag = False
+
+        # 1. Load & index AOI
+        if progress_callback:
+            progress_callback("Loading AOI into memory...")
+        
+        # The load_aoi_data function reads the AOI CSV file and organizes the AOI information into a dictionary.
+        # It also detects which column in the CSV contains the unique identifier for each AOI.
+        aoi_lookup, id_col_name = self.load_aoi_data(aoi_path)
+        
+        if progress_callback:
+            progress_callback(f"AOI indexed ({len(aoi_lookup)} frames). Streaming gaze…")
+
+        # 2. Stream gaze data and hit-test each sample
+        output_rows = self._map_samples(
+            self._iter_gaze_samples(gaze_path, video_res, fps, offset), aoi_lookup, id_col_name)
+
+        # 3. Write output
+        if progress_callback:
+            progress_callback("Saving CSV…")
+        return self._save_mapped(output_rows, gaze_path, output_dir)
+
+    def run_direct_mapping(self,
+                           pose_path: str,
+                           identity_path: str,
+                           profile_path: str,
+                           gaze_path: str,
+                           video_res: tuple[int, int],
+                           fps: float,
+                           offset: float,
+                           output_dir: str | None = None,
+                           kp_conf_thresh: float = 0.3,
+                           progress_callback=None) -> tuple[str, int]:
+        """
+        Map gaze straight from pose data, identity map and AOI profile.
+
+        Same output as exporting the AOI CSV in Region and running
+        run_mapping on it, without the intermediate file: AOIs are computed
+        only for the frames that gaze samples fall on. Manual corrections and
+        TOI rule overrides of a Region session are not applied; export the
+        AOI CSV from Region when they matter.
+        """
+        self._cancel_flag = False
+
+        with open(profile_path, 'r') as f:
+            profile = json.load(f)
+        if not isinstance(profile, dict) or 'roles' not in profile:
+            raise ValueError(f"Not an AOI profile (no 'roles'): {profile_path}")
+
+        # 1. Gaze first: it tells which frames need AOIs
+        if progress_callback:
+            progress_callback("Reading gaze…")
+        samples = list(self._iter_gaze_samples(gaze_path, video_res, fps, offset))
+
+        # 2. Pose + identities, then AOIs of the gazed frames only
+        self._region = region = RegionLogic()
+        region.fps = fps
+        region.load_pose_data(pose_path, progress_callback=progress_callback)
+        region.load_identity_map(identity_path)
+        if self._cancel_flag:
+            raise InterruptedError("Mapping cancelled by user.")
+
+        frames = {s[1] for s in samples}
+        if progress_callback:
+            progress_callback(f"Computing AOIs for {len(frames)} gazed frames…")
+        aoi_lookup = region.get_aoi_lookup(frames, profile, kp_conf_thresh)
+        self._region = None
+
+        # 3. Hit-test and write
+        if progress_callback:
+            progress_callback(f"AOI ready ({len(aoi_lookup)} frames). Mapping {len(samples)} samples…")
+        output_rows = self._map_samples(samples, aoi_lookup, 'TrackID')
+
+        if progress_callback:
+            progress_callback("Saving CSV…")
+        return self._save_mapped(output_rows, gaze_path, output_dir)
+
 
 # ═══════════════════════════════════════════════════════════════════
 # VIEW / CONTROLLER — UI only
@@ -364,6 +457,12 @@ class GazeView:
         self.gaze_path = tk.StringVar()
         self.output_dir = tk.StringVar()
 
+        # Direct mode: AOIs from pose + identity + profile, no AOI CSV
+        self.direct_mode = tk.BooleanVar(value=False)
+        self.pose_path = tk.StringVar()
+        self.identity_path = tk.StringVar()
+        self.profile_path = tk.StringVar()
+
         self.video_res_w = tk.IntVar(value=1920)
         self.video_res_h = tk.IntVar(value=1080)
         self.fps = tk.DoubleVar(value=25.0)
@@ -378,6 +477,10 @@ class GazeView:
             self.gaze_path.set(self.context.gaze_data_path)
         if hasattr(self.context, 'output_dir') and self.context.output_dir:
             self.output_dir.set(self.context.output_dir)
+        if self.context.pose_data_path:
+            self.pose_path.set(self.context.pose_data_path)
+        if self.context.identity_map_path:
+            self.identity_path.set(self.context.identity_map_path)
             
     # ── UI Construction ─────────────────────────────────────────
 
@@ -396,10 +499,22 @@ class GazeView:
         lf_files = tk.LabelFrame(main, text="1. Input Files", padx=10, pady=10)
         lf_files.pack(fill=tk.X, pady=5)
 
-        self._add_file_picker(lf_files, "AOI File (.csv):", self.aoi_path, "*.csv")
+        self._add_file_picker(lf_files, "AOI File (.csv):", self.aoi_path, "*.csv *.parquet")
         self._add_file_picker(lf_files, "Tobii Gaze Data (.gz):", self.gaze_path, "*.gz")
         self._add_dir_picker(lf_files, "Output Folder:", self.output_dir)
 
+        lf_direct = tk.LabelFrame(main, text="1b. Direct Mode (skip the AOI file)", padx=10, pady=10)
+        lf_direct.pack(fill=tk.X, pady=5)
+        tk.Checkbutton(lf_direct, text="Compute AOIs from pose data, only for frames with gaze",
+                       variable=self.direct_mode).pack(anchor="w")
+        tk.Label(lf_direct,
+                 text="Region manual corrections and TOI rule overrides are NOT applied: "
+                      "export the AOI file from Region to map with them.",
+                 fg="#b71c1c", font=("Arial", 8), wraplength=520, justify="left").pack(anchor="w")
+        self._add_file_picker(lf_direct, "Pose Data (.gz):", self.pose_path, "*.gz")
+        self._add_file_picker(lf_direct, "Identity Map (.json):", self.identity_path, "*.json")
+        self._add_file_picker(lf_direct, "AOI Profile (.json):", self.profile_path, "*.json")
+
         # 2. Sync parameters
         lf_params = tk.LabelFrame(main, text="2. Video & Sync Parameters",
                                   padx=10, pady=10)
@@ -473,7 +588,19 @@ class GazeView:
     # ── Process Orchestration (threaded) ────────────────────────
 
     def run_process(self):
-        if not self.aoi_path.get() or not self.gaze_path.get():
+        direct = self.direct_mode.get()
+        if direct:
+            if not all(v.get() for v in (self.pose_path, self.identity_path, self.profile_path, self.gaze_path)):
+                messagebox.showwarning("Missing Files",
+                                       "Direct mode needs Pose Data, Identity Map, AOI Profile and GazeData files.")
+                return
+            if self._region_session_has_edits() and not messagebox.askyesno(
+                    "Region Corrections Found",
+                    "This participant has a Region edit session with manual corrections or TOI "
+                    "rule overrides.\n\nDirect mode ignores them, so the result will differ from "
+                    "the exported AOI file.\n\nContinue with direct mode anyway?"):
+                return
+        elif not self.aoi_path.get() or not self.gaze_path.get():
             messagebox.showwarning("Missing Files",
                                    "Select both AOI file and GazeData file.")
             return
@@ -492,11 +619,29 @@ class GazeView:
             "fps":       self.fps.get(),
             "offset":    self.sync_offset.get(),
             "output_dir": self.output_dir.get(),
+            "direct":    direct,
+            "pose_path": self.pose_path.get(),
+            "identity_path": self.identity_path.get(),
+            "profile_path": self.profile_path.get(),
         }
 
         threading.Thread(target=self._thread_worker,
                          args=(params,), daemon=True).start()
 
+    def _region_session_has_edits(self) -> bool:
+        """True if Region's autosaved session (_aoi_edit_session.json) holds any correction."""
+        out_dir = self.context.paths.get("output", "")
+        folder = out_dir if out_dir and os.path.exists(out_dir) else os.getcwd()
+        path = os.path.join(folder, "_aoi_edit_session.json")
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return bool(payload.get("manual_overrides")) or bool(payload.get("toi_rule_overrides"))
+
     def _cancel_process(self):
         if messagebox.askyesno("Stop", "Abort processing?"):
             self.logic.cancel()
@@ -504,15 +649,28 @@ class GazeView:
 
     def _thread_worker(self, params):
         try:
-            out_path, total_rows = self.logic.run_mapping(
-                aoi_path=params["aoi_path"],
-                gaze_path=params["gaze_path"],
-                video_res=params["video_res"],
-                fps=params["fps"],
-                offset=params["offset"],
-                output_dir=params["output_dir"],
-                progress_callback=self._on_progress,
-            )
+            if params["direct"]:
+                out_path, total_rows = self.logic.run_direct_mapping(
+                    pose_path=params["pose_path"],
+                    identity_path=params["identity_path"],
+                    profile_path=params["profile_path"],
+                    gaze_path=params["gaze_path"],
+                    video_res=params["video_res"],
+                    fps=params["fps"],
+                    offset=params["offset"],
+                    output_dir=params["output_dir"],
+                    progress_callback=self._on_progress,
+                )
+            else:
+                out_path, total_rows = self.logic.run_mapping(
+                    aoi_path=params["aoi_path"],
+                    gaze_path=params["gaze_path"],
+                    video_res=params["video_res"],
+                    fps=params["fps"],
+                    offset=params["offset"],
+                    output_dir=params["output_dir"],
+                    progress_callback=self._on_progress,
+                )
             self.context.mapped_csv_path = out_path
             self.parent.after(0, lambda: self._on_success(out_path, total_rows))
         except InterruptedError:
@@ -18,6 +18,8 @@ import csv
 import datetime
 from ultralytics import YOLO  # type: ignore
 
+from hermes_pose_io import iter_pose_batches, FIELD_BOXES, FIELD_CONF, FIELD_KEYPOINTS
+
 # --- RESEARCH PARAMETERS & HEURISTICS (CONSTANTS) ---
 # Globally exposed for reproducibility and tuning. Here are initialised, but can be adjusted by the user via the UI sliders.
 # CONF_THRESHOLD: Conservative threshold to balance Precision and Recall.
@@ -330,26 +332,21 @@ class PoseEstimatorLogic:
                 writer = csv.writer(f_csv)
                 writer.writerow(header)
                 
-                with gzip.open(json_gz_path, 'rt', encoding='utf-8') as f_json:
-                    for line in f_json:
-                        frame = json.loads(line)
-                        f_idx = frame['f_idx']
-                        ts = frame['ts']
-                        
-                        for det in frame.get('det', []):
-                            row = [f_idx, ts, det.get('track_id', -1), det.get('conf', 0)]
-                            b = det.get('box', {})
-                            row.extend([b.get('x1',0), b.get('y1',0), b.get('x2',0), b.get('y2',0)])
-                            kps = det.get('keypoints', [])
-                            if not kps:
-                                row.extend([0] * (17 * 3))
-                            else:
-                                for point in kps:
-                                    row.extend(point) 
-                                    if len(point) < 3:
-                                        row.append(0) 
-                            writer.writerow(row)
-                            
+                # Le detection arrivano già come array NumPy (box, conf, keypoints) a blocchi di frame.
+                for batch in iter_pose_batches(json_gz_path, fields=(FIELD_BOXES, FIELD_CONF, FIELD_KEYPOINTS)):
+                    if not batch.n_detections:
+                        continue
+                    det_ts = np.repeat(batch.ts, np.diff(batch.det_offsets))
+                    kps = np.nan_to_num(batch.keypoints, nan=0.0)
+                    kps[~batch.has_keypoints] = 0
+                    kps_flat = kps.reshape(batch.n_detections, -1).tolist()
+                    writer.writerows(
+                        [f_idx, ts, tid, conf, *box, *kp_row]
+                        for f_idx, ts, tid, conf, box, kp_row in zip(
+                            batch.det_frame.tolist(), det_ts.tolist(), batch.track_id.tolist(),
+                            batch.conf.tolist(), batch.boxes.tolist(), kps_flat)
+                    )
+
             if on_log:
                 on_log(f"✅ CSV Export complete: {csv_path}")
             return True
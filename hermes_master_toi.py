@@ -7,6 +7,8 @@ from datetime import datetime
 import scipy.io as sio
 import gzip
 
+from hermes_pose_io import iter_pose_batches, FIELD_FRAMES, FIELD_RAW
+
 # --- GESTIONE PROFILI ---
 class ProfileManager:
     def __init__(self, profiles_dir):
@@ -738,27 +740,20 @@ class DataCropper:
             dropped_frames = 0
             
             # 3. Streaming Read/Write (Memoria efficiente)
+            # Proiezione "frames" + "raw": le righe vengono riscritte intatte, senza
+            # ricostruire il JSON. Con skip_invalid ogni riga viene comunque validata,
+            # così le righe troncate o corrotte vengono scartate come prima.
             print("⏳ Processing (Streaming)...")
-            with gzip.open(json_gz_path, 'rt', encoding='utf-8') as f_in, \
-                 gzip.open(new_path, 'wt', encoding='utf-8') as f_out:
-                
-                for line in f_in:
-                    try:
-                        # Parsing veloce solo per leggere il timestamp
-                        # Nota: se il file è enorme, json.loads su ogni riga è il collo di bottiglia,
-                        # ma è comunque il metodo più sicuro.
-                        frame = json.loads(line)
-                        ts = frame.get('ts', 0.0)
-                        
-                        if ts >= start_cut_time:
-                            # Scrive la riga originale intatta (veloce)
-                            f_out.write(line)
-                            kept_frames += 1
-                        else:
-                            dropped_frames += 1
-                            
-                    except json.JSONDecodeError:
-                        continue
+            # compresslevel=3 come il writer del modulo Human: il livello 9 di default domina i tempi
+            with gzip.open(new_path, 'wb', compresslevel=3) as f_out:
+                for batch in iter_pose_batches(json_gz_path, fields=(FIELD_FRAMES, FIELD_RAW),
+                                               skip_invalid=True):
+                    keep = batch.ts >= start_cut_time
+                    n_keep = int(keep.sum())
+                    if n_keep:
+                        f_out.writelines(line for line, k in zip(batch.lines, keep.tolist()) if k)
+                    kept_frames += n_keep
+                    dropped_frames += len(batch) - n_keep
 
             print("✅ Pruning complete.")
             print(f"   Frames removed:   {dropped_frames}")
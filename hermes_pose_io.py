@@ -0,0 +1,351 @@
+"""
+Shared reader for the pose files written by the Human module
+(<name>_yolo.json.gz, one JSON object per frame).
+
+Every consumer (Entity, Region, Master TOI cropping, flat CSV export and the
+MATLAB converter) reads the file through ``iter_pose_batches`` so that:
+
+* only the requested fields are materialised (field projection);
+* frames outside a requested range are skipped before being parsed;
+* the optional ``orjson`` backend is used when installed;
+* results are delivered as NumPy batches instead of per-line dicts.
+"""
+
+import gzip
+import json
+import re
+
+import numpy as np
+
+try:
+    import orjson  # Optional fast JSON backend
+except ImportError:
+    orjson = None
+
+
+# ═══════════════════════════════════════════════════════════════════
+# CONSTANTS
+# ═══════════════════════════════════════════════════════════════════
+
+NUM_KEYPOINTS = 17
+
+# Untracked detections (track_id == -1 / null) get a per-detection synthetic ID.
+# Entity and Region must agree on this formula, so it lives here.
+SYNTHETIC_ID_BASE = 9000000
+
+# Field projections
+FIELD_FRAMES = "frames"        # f_idx / ts only (never parses detections)
+FIELD_BOXES = "boxes"          # detection boxes (+ track ids)
+FIELD_KEYPOINTS = "keypoints"  # detection keypoints (+ track ids)
+FIELD_CONF = "conf"            # detection confidence (+ track ids)
+FIELD_RAW = "raw"              # original line bytes, untouched
+
+VALID_FIELDS = {FIELD_FRAMES, FIELD_BOXES, FIELD_KEYPOINTS, FIELD_CONF, FIELD_RAW}
+_DETECTION_FIELDS = {FIELD_BOXES, FIELD_KEYPOINTS, FIELD_CONF}
+
+# The Human writer emits {"f_idx": N, "ts": T, "det": [...]} in this key order,
+# so the frame header can be read without parsing the (large) detection list.
+_HEADER_RE = re.compile(rb'^\s*\{\s*"f_idx"\s*:\s*(-?\d+)\s*,\s*"ts"\s*:\s*(-?[0-9][0-9.eE+-]*)')
+
+
+# ═══════════════════════════════════════════════════════════════════
+# BATCH CONTAINER
+# ═══════════════════════════════════════════════════════════════════
+
+class PoseBatch:
+    """
+    A block of consecutive frames in columnar form.
+
+    Frame-level arrays have one entry per frame; detection-level arrays have
+    one entry per detection, grouped by frame in file order.
+    ``det_offsets[i]:det_offsets[i + 1]`` is the detection slice of frame ``i``.
+
+    Attributes
+    ----------
+    f_idx : ndarray[int64] (F,)
+    ts : ndarray[float64] (F,)
+    det_offsets : ndarray[int64] (F + 1,)
+    det_frame : ndarray[int64] (N,)
+        Frame index of every detection.
+    det_slot : ndarray[int32] (N,)
+        Position of the detection inside its frame's ``det`` list.
+    track_id : ndarray[int64] (N,)
+        Raw tracker ID (-1 when missing / null).
+    boxes : ndarray[float32] (N, 4) | None
+        x1, y1, x2, y2.
+    conf : ndarray[float32] (N,) | None
+    keypoints : ndarray[float32] (N, K, 3) | None
+        x, y, conf. Missing points are NaN; two-value points get conf 1.0.
+    has_keypoints : ndarray[bool] (N,) | None
+        False when the detection has no 'keypoints' key at all.
+    lines : list[bytes] | None
+        Original lines, only with the 'raw' projection.
+
+    Coordinates are stored as float32: the Human module writes float32
+    tensors, so the conversion is lossless for its files.
+    """
+
+    __slots__ = ("f_idx", "ts", "det_offsets", "det_frame", "det_slot", "track_id",
+                 "boxes", "conf", "keypoints", "has_keypoints", "lines")
+
+    def __init__(self, f_idx, ts, det_offsets, det_frame, det_slot, track_id,
+                 boxes=None, conf=None, keypoints=None, has_keypoints=None, lines=None):
+        self.f_idx = f_idx
+        self.ts = ts
+        self.det_offsets = det_offsets
+        self.det_frame = det_frame
+        self.det_slot = det_slot
+        self.track_id = track_id
+        self.boxes = boxes
+        self.conf = conf
+        self.keypoints = keypoints
+        self.has_keypoints = has_keypoints
+        self.lines = lines
+
+    def __len__(self):
+        return len(self.f_idx)
+
+    @property
+    def n_detections(self):
+        return len(self.det_frame)
+
+    def frame_slice(self, i):
+        """Detection slice for the i-th frame of the batch."""
+        return slice(int(self.det_offsets[i]), int(self.det_offsets[i + 1]))
+
+
+def resolve_track_ids(batch):
+    """
+    Return track IDs with untracked detections replaced by the synthetic
+    per-detection ID (9000000 + frame * 1000 + slot).
+    """
+    tids = batch.track_id.copy()
+    missing = tids == -1
+    if missing.any():
+        tids[missing] = (SYNTHETIC_ID_BASE
+                         + batch.det_frame[missing] * 1000
+                         + batch.det_slot[missing].astype(np.int64))
+    return tids
+
+
+# ═══════════════════════════════════════════════════════════════════
+# PARSING HELPERS
+# ═══════════════════════════════════════════════════════════════════
+
+def _get_loads(backend):
+    if backend == "json":
+        return json.loads
+    if backend == "orjson":
+        if orjson is None:
+            raise ValueError("JSON backend 'orjson' requested but the package is not installed.")
+        return orjson.loads
+    if backend == "auto":
+        return orjson.loads if orjson is not None else json.loads
+    raise ValueError(f"Unknown JSON backend: {backend!r}")
+
+
+def _normalise_keypoints(raw_kps):
+    """Convert the dict keypoint format ({'x': [...], 'y': [...], ...}) to triples."""
+    if isinstance(raw_kps, dict) and 'x' in raw_kps:
+        xs, ys = raw_kps['x'], raw_kps['y']
+        confs = raw_kps.get('visible', raw_kps.get('confidence', [1.0] * len(xs)))
+        return [[xs[k], ys[k], confs[k] if k < len(confs) else 0] for k in range(len(xs))]
+    if isinstance(raw_kps, list):
+        return raw_kps
+    return []
+
+
+def _fill_keypoints_slow(out, kps_lists, num_keypoints):
+    """Per-detection fallback for ragged / partial keypoint lists."""
+    out.fill(np.nan)
+    for n, kps in enumerate(kps_lists):
+        for k, pt in enumerate(kps[:num_keypoints]):
+            if not isinstance(pt, (list, tuple)) or len(pt) < 2:
+                continue
+            out[n, k, 0] = pt[0]
+            out[n, k, 1] = pt[1]
+            out[n, k, 2] = pt[2] if len(pt) >= 3 else 1.0
+
+
+class _BatchBuilder:
+    """Accumulates parsed frames and emits a PoseBatch."""
+
+    def __init__(self, fields, num_keypoints):
+        self.want_det = bool(fields & _DETECTION_FIELDS)
+        self.want_boxes = FIELD_BOXES in fields
+        self.want_kps = FIELD_KEYPOINTS in fields
+        self.want_conf = FIELD_CONF in fields
+        self.want_raw = FIELD_RAW in fields
+        self.num_keypoints = num_keypoints
+        self.reset()
+
+    def reset(self):
+        self.f_idx = []
+        self.ts = []
+        self.counts = []
+        self.track_id = []
+        self.det_slot = []
+        self.boxes = []
+        self.conf = []
+        self.kps = []
+        self.has_kps = []
+        self.lines = []
+
+    def __len__(self):
+        return len(self.f_idx)
+
+    def add(self, f_idx, ts, dets, line):
+        self.f_idx.append(f_idx)
+        self.ts.append(ts)
+        if self.want_raw:
+            self.lines.append(line)
+        if not self.want_det:
+            self.counts.append(0)
+            return
+
+        self.counts.append(len(dets))
+        for slot, det in enumerate(dets):
+            tid = det.get('track_id')
+            self.track_id.append(-1 if tid is None else int(tid))
+            self.det_slot.append(slot)
+            if self.want_boxes:
+                b = det.get('box') or {}
+                self.boxes.append((b.get('x1', 0), b.get('y1', 0), b.get('x2', 0), b.get('y2', 0)))
+            if self.want_conf:
+                c = det.get('conf')
+                self.conf.append(0.0 if c is None else c)
+            if self.want_kps:
+                raw = det.get('keypoints')
+                self.has_kps.append(raw is not None)
+                self.kps.append(_normalise_keypoints(raw) if raw is not None else [])
+
+    def build(self):
+        f_idx = np.asarray(self.f_idx, dtype=np.int64)
+        ts = np.asarray(self.ts, dtype=np.float64)
+        counts = np.asarray(self.counts, dtype=np.int64)
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        n = int(offsets[-1])
+
+        batch = PoseBatch(
+            f_idx=f_idx,
+            ts=ts,
+            det_offsets=offsets,
+            det_frame=np.repeat(f_idx, counts),
+            det_slot=np.asarray(self.det_slot, dtype=np.int32),
+            track_id=np.asarray(self.track_id, dtype=np.int64),
+            lines=self.lines if self.want_raw else None,
+        )
+        if self.want_boxes:
+            batch.boxes = np.asarray(self.boxes, dtype=np.float32).reshape(n, 4)
+        if self.want_conf:
+            batch.conf = np.asarray(self.conf, dtype=np.float32)
+        if self.want_kps:
+            k = self.num_keypoints
+            batch.has_keypoints = np.asarray(self.has_kps, dtype=bool)
+            kps = None
+            try:
+                # Fast path: every detection has K full [x, y, conf] triples.
+                kps = np.asarray(self.kps, dtype=np.float32)
+                if kps.shape != (n, k, 3):
+                    kps = None
+            except (ValueError, TypeError):
+                kps = None
+            if kps is None:
+                kps = np.empty((n, k, 3), dtype=np.float32)
+                _fill_keypoints_slow(kps, self.kps, k)
+            batch.keypoints = kps
+        self.reset()
+        return batch
+
+
+# ═══════════════════════════════════════════════════════════════════
+# PUBLIC API
+# ═══════════════════════════════════════════════════════════════════
+
+def iter_pose_batches(path, fields=(FIELD_BOXES,), frame_range=None, batch_frames=2048,
+                      backend="auto", num_keypoints=NUM_KEYPOINTS, skip_invalid=False):
+    """
+    Stream a pose .json.gz file as PoseBatch objects.
+
+    Parameters
+    ----------
+    path : str
+        Path to the <name>_yolo.json.gz file.
+    fields : iterable[str]
+        Projection: any of 'frames', 'boxes', 'keypoints', 'conf', 'raw'.
+        'frames' alone reads only f_idx/ts and never parses detections.
+        Track IDs and detection slots are always included with any
+        detection field.
+    frame_range : tuple(int | None, int | None) | None
+        Half-open [start, stop) range of f_idx to keep. Pose files are
+        written in frame order, so reading stops at ``stop``.
+    batch_frames : int
+        Number of frames per emitted batch.
+    backend : str
+        'auto' (orjson when installed), 'json' or 'orjson'.
+    num_keypoints : int
+        Keypoints per detection in the dense keypoint array.
+    skip_invalid : bool
+        Skip lines that cannot be parsed instead of raising. With 'raw',
+        every line in range is then fully parsed, even when the header
+        alone would give the frame index.
+
+    Yields
+    ------
+    PoseBatch
+    """
+    fields = set(fields)
+    unknown = fields - VALID_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown pose fields: {sorted(unknown)}")
+
+    loads = _get_loads(backend)
+    builder = _BatchBuilder(fields, num_keypoints)
+    start, stop = frame_range if frame_range else (None, None)
+    need_det = builder.want_det
+    # Raw lines are copied as they are: with skip_invalid, parse them anyway so
+    # that truncated or corrupt lines are dropped rather than passed on.
+    check_raw = builder.want_raw and skip_invalid
+
+    with gzip.open(path, 'rb') as f:
+        for line in f:
+            m = _HEADER_RE.match(line)
+            d = None
+            if m:
+                f_idx = int(m.group(1))
+                ts = float(m.group(2))
+            else:
+                if not line.strip():
+                    continue
+                try:
+                    d = loads(line)
+                    f_idx = int(d['f_idx'])
+                    ts = float(d.get('ts', 0.0) or 0.0)
+                except (ValueError, KeyError, TypeError):
+                    if skip_invalid:
+                        continue
+                    raise
+
+            if start is not None and f_idx < start:
+                continue
+            if stop is not None and f_idx >= stop:
+                break
+
+            dets = ()
+            if d is None and (need_det or check_raw):
+                try:
+                    d = loads(line)
+                except ValueError:
+                    if skip_invalid:
+                        continue
+                    raise
+            if need_det:
+                dets = d.get('det') or ()
+
+            builder.add(f_idx, ts, dets, line)
+            if len(builder) >= batch_frames:
+                yield builder.build()
+
+    if len(builder):
+        yield builder.build()
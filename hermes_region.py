@@ -2,15 +2,31 @@ import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 import cv2
 import json
-import gzip
 import os
 import math
 import copy
 import threading
+import hashlib
+import bisect
+import multiprocessing
+import shutil
+import tempfile
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from types import MappingProxyType
+import numpy as np
 import pandas as pd
 from PIL import Image, ImageTk
 from datetime import datetime
 
+try:
+    import pyarrow as pa  # Optional: Parquet export
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from hermes_pose_io import iter_pose_batches, resolve_track_ids, FIELD_KEYPOINTS, NUM_KEYPOINTS
+
 # ═══════════════════════════════════════════════════════════════════
 # CONSTANTS
 # ═══════════════════════════════════════════════════════════════════
@@ -66,6 +82,159 @@ class AOIProfileManager:
             return []
         return [f for f in os.listdir(self.folder) if f.endswith(".json")]
 
+# ═══════════════════════════════════════════════════════════════════
+# OVERRIDE STORE — manual AOI corrections as frame intervals
+# ═══════════════════════════════════════════════════════════════════
+
+class OverrideStore:
+    """
+    Manual AOI boxes, stored as frame intervals per (track_id, role, aoi).
+
+    Each key holds sorted, non-overlapping spans ``[first, last] -> box``;
+    a later edit wins over the part of older spans it covers, and adjacent
+    spans with the same box are merged, so a correction over a whole TOI
+    is a single entry. Point lookups are a bisection on the key's spans.
+
+    Span lists are never modified in place (an edit builds new lists for
+    its key), so ``copy()`` only copies the key table and snapshots share
+    every key an edit did not touch.
+    """
+
+    def __init__(self):
+        # {(track_id, role, aoi): ([first, ...], [last, ...], [box, ...])}
+        self._spans = {}
+
+    @staticmethod
+    def _key(track_id, role, aoi):
+        return (int(track_id), str(role), str(aoi))
+
+    def __len__(self):
+        return sum(len(firsts) for firsts, _lasts, _boxes in self._spans.values())
+
+    def __eq__(self, other):
+        return isinstance(other, OverrideStore) and self._spans == other._spans
+
+    def copy(self):
+        new = OverrideStore()
+        new._spans = dict(self._spans)
+        return new
+
+    # ── Edits ───────────────────────────────────────────────────
+
+    def set_range(self, first, last, track_id, role, aoi, box):
+        """Apply ``box`` on frames first..last; returns True if anything changed."""
+        return self._splice(self._key(track_id, role, aoi), int(first), int(last), tuple(box))
+
+    def clear_range(self, first, last, track_id=None, role=None, aoi=None):
+        """Remove overrides on frames first..last (all AOIs when the key is None)."""
+        keys = list(self._spans) if track_id is None else [self._key(track_id, role, aoi)]
+        changed = False
+        for key in keys:
+            changed |= self._splice(key, int(first), int(last), None)
+        return changed
+
+    def _splice(self, key, first, last, box):
+        if last < first:
+            return False
+        firsts, lasts, boxes = self._spans.get(key, ([], [], []))
+        i = bisect.bisect_left(lasts, first)
+        j = bisect.bisect_right(firsts, last)
+        old = list(zip(firsts[i:j], lasts[i:j], boxes[i:j]))
+        new = []
+        if old and old[0][0] < first:
+            new.append((old[0][0], first - 1, old[0][2]))
+        if box is not None:
+            new.append((first, last, box))
+        if old and old[-1][1] > last:
+            new.append((last + 1, old[-1][1], old[-1][2]))
+
+        # Merge with touching spans carrying the same box.
+        if i > 0 and new and lasts[i - 1] == new[0][0] - 1 and boxes[i - 1] == new[0][2]:
+            i -= 1
+            old.insert(0, (firsts[i], lasts[i], boxes[i]))
+            new[0] = (firsts[i], new[0][1], new[0][2])
+        if j < len(firsts) and new and firsts[j] == new[-1][1] + 1 and boxes[j] == new[-1][2]:
+            old.append((firsts[j], lasts[j], boxes[j]))
+            new[-1] = (new[-1][0], lasts[j], new[-1][2])
+            j += 1
+        merged = []
+        for span in new:
+            if merged and merged[-1][1] == span[0] - 1 and merged[-1][2] == span[2]:
+                merged[-1] = (merged[-1][0], span[1], span[2])
+            else:
+                merged.append(span)
+        if merged == old:
+            return False
+
+        firsts = firsts[:i] + [s[0] for s in merged] + firsts[j:]
+        lasts = lasts[:i] + [s[1] for s in merged] + lasts[j:]
+        boxes = boxes[:i] + [s[2] for s in merged] + boxes[j:]
+        if firsts:
+            self._spans[key] = (firsts, lasts, boxes)
+        else:
+            self._spans.pop(key, None)
+        return True
+
+    # ── Queries ─────────────────────────────────────────────────
+
+    def get(self, frame_idx, track_id, role, aoi):
+        spans = self._spans.get(self._key(track_id, role, aoi))
+        if spans is None:
+            return None
+        firsts, lasts, boxes = spans
+        i = bisect.bisect_right(firsts, int(frame_idx)) - 1
+        return boxes[i] if i >= 0 and lasts[i] >= int(frame_idx) else None
+
+    def spans(self):
+        """Iterate (track_id, role, aoi, first, last, box) in key / frame order."""
+        for (tid, role, aoi), (firsts, lasts, boxes) in sorted(self._spans.items()):
+            for first, last, box in zip(firsts, lasts, boxes):
+                yield tid, role, aoi, first, last, box
+
+    def window(self, first, last):
+        """Copy restricted to the spans touching frames first..last."""
+        new = OverrideStore()
+        for key, (firsts, lasts, boxes) in self._spans.items():
+            i = bisect.bisect_left(lasts, first)
+            j = bisect.bisect_right(firsts, last)
+            if i < j:
+                new._spans[key] = (firsts[i:j], lasts[i:j], boxes[i:j])
+        return new
+
+    def lookup(self, frames, track_ids, roles, aois):
+        """
+        Overrides of many AOI rows at once.
+
+        Returns
+        -------
+        list[tuple[int, tuple]]
+            (row index, box) for every row with an override.
+        """
+        if not self._spans or not len(frames):
+            return []
+        o_tids = np.fromiter((k[0] for k in self._spans), dtype=np.int64, count=len(self._spans))
+        cand = np.flatnonzero(np.isin(track_ids, o_tids))
+        groups = {}
+        for i, key in zip(cand.tolist(), zip(track_ids[cand].tolist(), roles[cand].tolist(), aois[cand].tolist())):
+            if key in self._spans:
+                groups.setdefault(key, []).append(i)
+        hits = []
+        for key, rows in groups.items():
+            firsts, lasts, boxes = self._spans[key]
+            rows = np.asarray(rows, dtype=np.int64)
+            f = frames[rows]
+            k = np.searchsorted(np.asarray(firsts), f, side="right") - 1
+            ok = (k >= 0) & (f <= np.asarray(lasts)[np.maximum(k, 0)])
+            hits.extend((r, boxes[s]) for r, s in zip(rows[ok].tolist(), k[ok].tolist()))
+        return hits
+
+    def changed_ranges(self, other):
+        """Frame ranges whose overrides differ between two stores."""
+        a = set(self.spans())
+        b = set(other.spans())
+        return [(s[3], s[4]) for s in a ^ b]
+
+
 # ═══════════════════════════════════════════════════════════════════
 # MODEL — Pure logic, no tkinter
 # ═══════════════════════════════════════════════════════════════════
@@ -79,11 +248,33 @@ class RegionLogic:
     # Roles that are always skipped during rendering / export
     IGNORED_ROLES = {"Ignore", "Noise", "Unknown"}
 
+    # Causes of the uncovered frames in get_coverage_report
+    COVERAGE_CAUSES = {1: "missing pose", 2: "unmapped role", 3: "low kp conf"}
+
+    # Frames per block of the vectorised export
+    EXPORT_CHUNK_FRAMES = 4096
+    # Process-pool export: only worth its start-up cost on long sessions
+    EXPORT_POOL_MIN_FRAMES = 4 * EXPORT_CHUNK_FRAMES
+    EXPORT_MAX_WORKERS = 8
+
     def __init__(self):
-        self.pose_data = {}      # { frame_idx: { track_id: [[x,y,conf], ...] } }
+        # Dense pose tensors: row r holds the people of frame pose_frames[r]
+        # in file order; slots past pose_count[r] are empty (NaN / -1).
+        self.pose_frames = np.empty(0, dtype=np.int64)                           # (F,)
+        self.pose_count = np.empty(0, dtype=np.int64)                            # (F,)
+        self.pose_tids = np.empty((0, 0), dtype=np.int64)                        # (F, P)
+        self.pose_kps = np.empty((0, 0, NUM_KEYPOINTS, 3), dtype=np.float32)    # (F, P, 17, [x, y, conf])
+        self._frame_row = np.empty(0, dtype=np.int64)                            # frame_idx -> row, -1 if absent
         self.identity_map = {}   # { "track_id_str": "RoleName" }
-        # {(frame_idx, track_id, role, aoi_name): (x1, y1, x2, y2)}
-        self.manual_overrides = {}
+        # (x1, y1, x2, y2) per (track_id, role, aoi_name) over frame intervals
+        self.manual_overrides = OverrideStore()
+        # Revision of the overrides of each frame (frames past the array
+        # share _rev_tail) and of the pose / identity data, so cached AOIs
+        # can tell exactly which frames went stale.
+        self._override_rev = np.zeros(0, dtype=np.int64)
+        self._rev_tail = 0
+        self._rev_counter = 0
+        self.data_version = 0
         self.total_frames = 0
         self.fps = 30.0
         self._cancel_flag = False
@@ -96,7 +287,7 @@ class RegionLogic:
 
     def load_pose_data(self, path, progress_callback=None):
         """
-        Load a .json.gz pose file and populate self.pose_data.
+        Load a .json.gz pose file into the dense pose tensors.
 
         Parameters
         ----------
@@ -106,65 +297,132 @@ class RegionLogic:
             Optional feedback hook.
         """
         self._cancel_flag = False
-        temp_data = {}
+        frames, det_rec, det_tid, det_kps = [], [], [], []
+        n_rec = 0
 
         if progress_callback:
             progress_callback(f"Loading poses: {os.path.basename(path)}")
 
-        with gzip.open(path, 'rt', encoding='utf-8') as file:
-            for line_num, line in enumerate(file):
-                if self._cancel_flag:
-                    raise InterruptedError("Pose loading cancelled by user.")
-
-                d = json.loads(line)
-                f_idx = d['f_idx']
-                frame_dict = {}
+        # Keypoints-only projection: boxes and confidences are never materialised.
+        for batch in iter_pose_batches(path, fields=(FIELD_KEYPOINTS,)):
+            if self._cancel_flag:
+                raise InterruptedError("Pose loading cancelled by user.")
+
+            # Track-ID handling (same synthetic-ID logic as Entity)
+            keep = batch.has_keypoints
+            rec = np.repeat(np.arange(n_rec, n_rec + len(batch)), np.diff(batch.det_offsets))
+            frames.append(batch.f_idx)
+            det_rec.append(rec[keep])
+            det_tid.append(resolve_track_ids(batch)[keep])
+            det_kps.append(batch.keypoints[keep])
+            n_rec += len(batch)
+
+            if progress_callback:
+                progress_callback(f"Loading frame {int(batch.f_idx[-1])}...")
+
+        if frames:
+            tensors = self._build_pose_tensors(np.concatenate(frames), np.concatenate(det_rec),
+                                               np.concatenate(det_tid), np.concatenate(det_kps))
+        else:
+            tensors = self._build_pose_tensors(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                                               np.empty(0, dtype=np.int64),
+                                               np.empty((0, NUM_KEYPOINTS, 3), dtype=np.float32))
 
-                for i, det in enumerate(d['det']):
-                    if 'keypoints' not in det:
-                        continue
+        # Atomic swap — single lock acquisition
+        with self.lock:
+            (self.pose_frames, self.pose_count, self.pose_tids,
+             self.pose_kps, self._frame_row) = tensors
+            self.data_version += 1
 
-                    # Track-ID handling (replicate Entity synthetic-ID logic)
-                    raw_tid = det.get('track_id', -1)
-                    if raw_tid is None:
-                        raw_tid = -1
-                    tid = int(raw_tid)
-                    if tid == -1:
-                        tid = 9000000 + (f_idx * 1000) + i
+        count = len(self.pose_frames)
+        if progress_callback:
+            progress_callback(f"Poses loaded: {count} frames.")
+        return count
 
-                    # Parse keypoints (support both dict and list formats)
-                    raw_kps = det['keypoints']
-                    final_kps = []
-                    if isinstance(raw_kps, dict) and 'x' in raw_kps:
-                        xs, ys = raw_kps['x'], raw_kps['y']
-                        confs = raw_kps.get('visible', raw_kps.get('confidence', [1.0] * len(xs)))
-                        for k in range(len(xs)):
-                            final_kps.append([xs[k], ys[k], confs[k] if k < len(confs) else 0])
-                    elif isinstance(raw_kps, list):
-                        final_kps = raw_kps
+    @staticmethod
+    def _build_pose_tensors(rec_frames, det_rec, det_tid, det_kps):
+        """
+        Pack per-detection keypoints into (frames, persons, 17, 3) tensors.
 
-                    frame_dict[tid] = final_kps
+        Parameters
+        ----------
+        rec_frames : ndarray[int64]
+            f_idx of every frame record, in file order.
+        det_rec, det_tid, det_kps : ndarray
+            Record index, track ID and keypoints of every detection.
 
-                temp_data[f_idx] = frame_dict
+        A frame written twice keeps its last record; a track ID repeated
+        inside a frame keeps its first slot and its last keypoints.
 
-                if progress_callback and line_num % 1000 == 0:
-                    progress_callback(f"Loading frame {f_idx}...")
+        Returns
+        -------
+        tuple
+            (pose_frames, pose_count, pose_tids, pose_kps, frame_row)
+        """
+        frame_ids, rev_first = np.unique(rec_frames[::-1], return_index=True)
+        is_last = np.zeros(len(rec_frames), dtype=bool)
+        is_last[len(rec_frames) - 1 - rev_first] = True
+        keep = is_last[det_rec]
+        row = np.searchsorted(frame_ids, rec_frames[det_rec[keep]])
+        det_tid, det_kps = det_tid[keep], det_kps[keep]
+
+        n = len(row)
+        order = np.lexsort((np.arange(n), det_tid, row))
+        new_group = np.ones(n, dtype=bool)
+        new_group[1:] = (row[order][1:] != row[order][:-1]) | (det_tid[order][1:] != det_tid[order][:-1])
+        if not new_group.all():
+            group_start = np.flatnonzero(new_group)
+            first = order[group_start]
+            last = order[np.append(group_start[1:], n) - 1]
+            det_kps = det_kps.copy()
+            det_kps[first] = det_kps[last]
+            keep = np.zeros(n, dtype=bool)
+            keep[first] = True
+            row, det_tid, det_kps = row[keep], det_tid[keep], det_kps[keep]
+
+        count = np.bincount(row, minlength=len(frame_ids)).astype(np.int64)
+        persons = int(count.max()) if len(count) else 0
+        start = np.zeros(len(frame_ids), dtype=np.int64)
+        np.cumsum(count[:-1], out=start[1:])
+        slot = np.arange(len(row)) - start[row]
+
+        tids = np.full((len(frame_ids), persons), -1, dtype=np.int64)
+        kps = np.full((len(frame_ids), persons, det_kps.shape[1], 3), np.nan, dtype=np.float32)
+        tids[row, slot] = det_tid
+        kps[row, slot] = det_kps
+
+        valid = frame_ids >= 0
+        frame_row = np.full(int(frame_ids[-1]) + 1 if valid.any() else 0, -1, dtype=np.int64)
+        frame_row[frame_ids[valid]] = np.flatnonzero(valid)
+        return frame_ids, count, tids, kps, frame_row
+
+    def has_pose_data(self):
+        return len(self.pose_frames) > 0
+
+    def _row_of_frame(self, frame_idx):
+        frame_idx = int(frame_idx)
+        if 0 <= frame_idx < len(self._frame_row):
+            return int(self._frame_row[frame_idx])
+        return -1
 
-        # Atomic swap — single lock acquisition
+    def get_frame_poses(self, frame_idx):
+        """Keypoints of one frame as {track_id: [[x, y, conf], ...]} in file order."""
         with self.lock:
-            self.pose_data = temp_data
-
-        count = len(self.pose_data)
-        if progress_callback:
-            progress_callback(f"Poses loaded: {count} frames.")
-        return count
+            r = self._row_of_frame(frame_idx)
+            if r < 0:
+                return None
+            n = int(self.pose_count[r])
+            return dict(zip(self.pose_tids[r, :n].tolist(), self.pose_kps[r, :n].tolist()))
 
     # ── Identity I/O ────────────────────────────────────────────
 
     def load_identity_map(self, path):
         """Load the identity JSON and return the number of mapped IDs."""
         with open(path, 'r') as f:
-            self.identity_map = json.load(f)
+            identity_map = json.load(f)
+        with self.lock:
+            self.identity_map = identity_map
+            self.data_version += 1
         return len(self.identity_map)
 
     # ── Geometry Engine ─────────────────────────────────────────
@@ -383,6 +641,317 @@ class RegionLogic:
 
         return {"shape_type": "box", "box": base_box}
 
+    # ── Vectorised Geometry Engine ──────────────────────────────
+    #
+    # The same arithmetic as calculate_box / calculate_shape, applied to all
+    # the people of a role at once. Keypoints are widened to float64 and the
+    # operations run in the scalar engine's order, so results are identical.
+
+    # Extra geometry columns per shape type (see _shape_from_box)
+    SHAPE_EXTRAS = {
+        "box": (),
+        "circle": ("cx", "cy", "radius"),
+        "oval": ("cx", "cy", "rx", "ry", "angle"),
+        "polygon": ("points",),
+    }
+
+    @staticmethod
+    def _vector_keypoints(kps, rule, kp_conf_thresh):
+        """The rule's keypoints (float64) and their validity, as calculate_box tests it."""
+        n_kps = kps.shape[1]
+        idx = [i for i in rule.get('kps', []) if -n_kps <= i < n_kps]
+        pts = kps[:, idx, :].astype(np.float64)
+        valid = (pts[..., 2] > kp_conf_thresh) & (pts[..., 0] > 1) & (pts[..., 1] > 1)
+        return pts, valid
+
+    @staticmethod
+    def _vector_boxes(kps, rule, kp_conf_thresh, cache=None, cache_key=None):
+        """
+        calculate_box for many people.
+
+        Parameters
+        ----------
+        kps : ndarray[float32] (D, K, 3)
+        cache : dict | None
+            Keypoint validity and raw extents, keyed by (cache_key, rule
+            keypoints): rules sharing keypoints over the same people (other
+            rules or other profiles) only redo margin and scaling.
+
+        Returns
+        -------
+        ok : ndarray[bool] (D,)
+            People with at least one valid keypoint.
+        box : ndarray[int64] (n_ok, 4)
+        px, py : ndarray[float64] (n_ok, n_kps)
+            Selected keypoints of the ok people.
+        valid : ndarray[bool] (n_ok, n_kps)
+        """
+        key = (cache_key, tuple(rule.get('kps', [])))
+        base = cache.get(key) if cache is not None else None
+        if base is None:
+            pts, valid = RegionLogic._vector_keypoints(kps, rule, kp_conf_thresh)
+            ok = valid.any(axis=1)
+            px, py, valid = pts[ok, :, 0], pts[ok, :, 1], valid[ok]
+            base = (ok, px, py, valid,
+                    np.where(valid, px, np.inf).min(axis=1), np.where(valid, px, -np.inf).max(axis=1),
+                    np.where(valid, py, np.inf).min(axis=1), np.where(valid, py, -np.inf).max(axis=1))
+            if cache is not None:
+                cache[key] = base
+        ok, px, py, valid, min_x, max_x, min_y, max_y = base
+
+        m = int(rule.get('margin_px', 0))
+        min_x, max_x, min_y, max_y = min_x - m, max_x + m, min_y - m, max_y + m
+
+        base_exp = float(rule.get('expand_factor', 1.0))
+        scale_w = float(rule.get('scale_w', base_exp))
+        scale_h = float(rule.get('scale_h', base_exp))
+        w = max_x - min_x
+        h = max_y - min_y
+        cx = min_x + w / 2
+        cy = min_y + h / 2
+        new_w = w * scale_w
+        new_h = h * scale_h
+        min_x = cx - new_w / 2
+        max_x = cx + new_w / 2
+        min_y = cy - new_h / 2
+        max_y = cy + new_h / 2
+
+        if 'offset_y_bottom' in rule:
+            max_y = max_y + int(rule['offset_y_bottom'])
+
+        min_x = np.maximum(min_x, 0)
+        min_y = np.maximum(min_y, 0)
+        box = np.trunc(np.column_stack((min_x, min_y, max_x, max_y))).astype(np.int64)
+        return ok, box, px, py, valid
+
+    @staticmethod
+    def _vector_sanitize(box):
+        x1 = np.maximum(box[:, 0], 0)
+        y1 = np.maximum(box[:, 1], 0)
+        return np.column_stack((x1, y1, np.maximum(x1 + 1, box[:, 2]), np.maximum(y1 + 1, box[:, 3])))
+
+    @staticmethod
+    def _half(v):
+        """int(v / 2) for integer arrays."""
+        return np.trunc(v / 2).astype(np.int64)
+
+    def _vector_shapes(self, kps, rule, kp_conf_thresh, cache=None, cache_key=None):
+        """
+        calculate_shape for many people (cache: see _vector_boxes).
+
+        Returns
+        -------
+        dict | None
+            'ok' (D,) mask, 'shape_type', 'box' (n_ok, 4) and the shape's
+            extra columns ('points' is a list of point lists).
+        """
+        if not rule.get('kps', []):
+            return None
+        ok, box, px, py, valid = self._vector_boxes(kps, rule, kp_conf_thresh, cache, cache_key)
+        shape_type = str(rule.get("shape", "box")).lower()
+        out = {"ok": ok, "box": box}
+
+        if shape_type == "polygon":
+            out["shape_type"] = "polygon"
+            out["points"] = self._vector_polygons(box, px, py, valid)
+        elif shape_type == "circle":
+            b = self._vector_sanitize(box)
+            cx = self._half(b[:, 0] + b[:, 2])
+            cy = self._half(b[:, 1] + b[:, 3])
+            r = np.maximum(1, self._half(np.minimum(b[:, 2] - b[:, 0], b[:, 3] - b[:, 1])))
+            sb = self._vector_sanitize(np.column_stack((cx - r, cy - r, cx + r, cy + r)))
+            out["shape_type"] = "circle"
+            out["box"] = sb
+            out["cx"] = self._half(sb[:, 0] + sb[:, 2])
+            out["cy"] = self._half(sb[:, 1] + sb[:, 3])
+            out["radius"] = np.maximum(1, self._half(np.minimum(sb[:, 2] - sb[:, 0], sb[:, 3] - sb[:, 1])))
+        elif shape_type in ("oval", "ellipse"):
+            b = self._vector_sanitize(box)
+            out["shape_type"] = "oval"
+            out["box"] = b
+            out["cx"] = self._half(b[:, 0] + b[:, 2])
+            out["cy"] = self._half(b[:, 1] + b[:, 3])
+            out["rx"] = np.maximum(1, self._half(b[:, 2] - b[:, 0]))
+            out["ry"] = np.maximum(1, self._half(b[:, 3] - b[:, 1]))
+            out["angle"] = np.zeros(len(b), dtype=np.int64)
+        else:
+            out["shape_type"] = "box"
+        return out
+
+    @staticmethod
+    def _vector_polygons(box, px, py, valid):
+        """Polygon points of calculate_shape: the valid keypoints mapped from
+        their own bbox onto the AOI box, ordered by angle around their mean."""
+        n_valid = valid.sum(axis=1)
+        points = [None] * len(box)
+        poly = np.flatnonzero(n_valid >= 3)
+        if len(poly):
+            v = valid[poly]
+            x, y = px[poly], py[poly]
+            sx1 = np.where(v, x, np.inf).min(axis=1, keepdims=True)
+            sy1 = np.where(v, y, np.inf).min(axis=1, keepdims=True)
+            sx2 = np.where(v, x, -np.inf).max(axis=1, keepdims=True)
+            sy2 = np.where(v, y, -np.inf).max(axis=1, keepdims=True)
+            b = box[poly]
+            dx1, dy1 = b[:, 0:1], b[:, 1:2]
+            sw = np.maximum(1e-6, sx2 - sx1)
+            sh = np.maximum(1e-6, sy2 - sy1)
+            dw = np.maximum(1e-6, b[:, 2:3] - dx1)
+            dh = np.maximum(1e-6, b[:, 3:4] - dy1)
+            with np.errstate(invalid='ignore'):
+                mx = np.trunc(dx1 + ((x - sx1) / sw) * dw)
+                my = np.trunc(dy1 + ((y - sy1) / sh) * dh)
+            mx = np.where(v, mx, 0).astype(np.int64)
+            my = np.where(v, my, 0).astype(np.int64)
+            cnt = n_valid[poly]
+            cx = mx.sum(axis=1, keepdims=True) / cnt[:, None]
+            cy = my.sum(axis=1, keepdims=True) / cnt[:, None]
+            ang = np.where(v, np.arctan2(my - cy, mx - cx), np.inf)
+            order = np.argsort(ang, axis=1, kind='stable')
+            mx = np.take_along_axis(mx, order, axis=1).tolist()
+            my = np.take_along_axis(my, order, axis=1).tolist()
+            for j, i in enumerate(poly.tolist()):
+                k = int(cnt[j])
+                points[i] = list(zip(mx[j][:k], my[j][:k]))
+        for i in np.flatnonzero(n_valid < 3).tolist():
+            x1, y1, x2, y2 = box[i].tolist()
+            points[i] = [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+        return points
+
+    def _aoi_table(self, rows, profile, kp_conf_thresh=0.3, overrides=None, shared=None):
+        """
+        All AOIs of a block of frames, computed rule by rule over arrays.
+
+        Parameters
+        ----------
+        rows : ndarray[int64]
+            Rows of the pose tensors, in frame order.
+        profile : dict
+            AOI profile used for every frame of the block.
+        overrides : OverrideStore | None
+            Manual overrides to apply.
+        shared : dict | None
+            Scratch space reused across calls on the same rows and threshold
+            (e.g. one per profile): detections, their roles and the keypoint
+            bases of _vector_boxes are then computed once.
+
+        Returns
+        -------
+        dict[str, ndarray]
+            Columns 'frame', 'track_id', 'role', 'aoi', 'shape_type', 'box'
+            (n, 4), 'cx', 'cy', 'radius', 'rx', 'ry' (-1 when absent), 'angle'
+            (0 when absent), 'points' (object) and 'corrected', ordered by
+            frame, person slot and rule as get_frame_aoi_data lists them.
+        """
+        shared = {} if shared is None else shared
+        if "dets" not in shared:
+            with self.lock:
+                count = self.pose_count[rows]
+                present = np.arange(self.pose_tids.shape[1]) < count[:, None]
+                det_r, det_s = np.nonzero(present)
+                frames = self.pose_frames[rows][det_r]
+                tids = self.pose_tids[rows[det_r], det_s]
+                kps = self.pose_kps[rows[det_r], det_s]
+
+            uniq, inv = np.unique(tids, return_inverse=True)
+            roles_u = np.array([self.identity_map.get(str(t), "Unknown") for t in uniq.tolist()] + [""], dtype=object)
+            det_role = roles_u[inv] if len(tids) else roles_u[:0]
+            by_role = {}
+            for role in sorted(set(det_role.tolist()) - self.IGNORED_ROLES):
+                dets = np.flatnonzero(det_role == role)
+                by_role[role] = (dets, kps[dets])
+            shared["dets"] = (frames, tids, by_role)
+        frames, tids, by_role = shared["dets"]
+
+        parts = []
+        for role, (dets, role_kps) in by_role.items():
+            for k, rule in enumerate(self._get_rules(profile, role)):
+                # Identical rules (e.g. in other profiles of the block) are computed once
+                part_key = (role, repr(sorted(rule.items())))
+                if ("shape", part_key) not in shared:
+                    shared[("shape", part_key)] = self._vector_shapes(role_kps, rule, kp_conf_thresh, shared, role)
+                shape = shared[("shape", part_key)]
+                if shape is None or not shape["ok"].any():
+                    continue
+                shape = dict(shape, key=part_key)
+                shape["det"] = dets[shape["ok"]]
+                shape["rule"] = k
+                shape["role"] = role
+                shape["aoi"] = rule['name']
+                parts.append(shape)
+
+        n = sum(len(p["det"]) for p in parts)
+        table = {
+            "frame": np.empty(n, dtype=np.int64),
+            "track_id": np.empty(n, dtype=np.int64),
+            "role": np.empty(n, dtype=object),
+            "aoi": np.empty(n, dtype=object),
+            "shape_type": np.empty(n, dtype=object),
+            "box": np.empty((n, 4), dtype=np.int64),
+            "cx": np.full(n, -1, dtype=np.int64),
+            "cy": np.full(n, -1, dtype=np.int64),
+            "radius": np.full(n, -1, dtype=np.int64),
+            "rx": np.full(n, -1, dtype=np.int64),
+            "ry": np.full(n, -1, dtype=np.int64),
+            "angle": np.zeros(n, dtype=np.int64),
+            "points": np.empty(n, dtype=object),
+            "corrected": np.zeros(n, dtype=bool),
+            "det": np.empty(n, dtype=np.int64),   # detection index in shared["dets"]
+            "parts": [],                          # (rule key, row positions) per computed rule
+        }
+        if not n:
+            return table
+        det = np.concatenate([p["det"] for p in parts])
+        rule_k = np.concatenate([np.full(len(p["det"]), p["rule"]) for p in parts])
+        order = np.lexsort((rule_k, det))
+        pos = np.empty(n, dtype=np.int64)
+        pos[order] = np.arange(n)
+
+        start = 0
+        for p in parts:
+            sl = pos[start:start + len(p["det"])]
+            start += len(p["det"])
+            table["parts"].append((p["key"], sl))
+            table["role"][sl] = p["role"]
+            table["aoi"][sl] = p["aoi"]
+            table["shape_type"][sl] = p["shape_type"]
+            table["box"][sl] = p["box"]
+            for key in self.SHAPE_EXTRAS[p["shape_type"]]:
+                if key == "points":
+                    pts = np.empty(len(sl), dtype=object)
+                    pts[:] = p["points"]
+                    table["points"][sl] = pts
+                else:
+                    table[key][sl] = p[key]
+        table["det"] = det[order]
+        table["frame"] = frames[table["det"]]
+        table["track_id"] = tids[table["det"]]
+
+        if overrides:
+            self._apply_overrides(table, overrides)
+        return table
+
+    def _apply_overrides(self, table, overrides):
+        """Replace the geometry of the rows with a manual override (in place)."""
+        hits = overrides.lookup(table["frame"], table["track_id"], table["role"], table["aoi"])
+        for i, box in hits:
+            base = self._table_shape(table, i)
+            shape = self._shape_from_box(base["shape_type"], box, base_shape=base)
+            table["shape_type"][i] = shape["shape_type"]
+            table["box"][i] = shape["box"]
+            for extra, default in (("cx", -1), ("cy", -1), ("radius", -1), ("rx", -1), ("ry", -1), ("angle", 0)):
+                table[extra][i] = shape.get(extra, default)
+            table["points"][i] = shape.get("points")
+            table["corrected"][i] = True
+
+    def _table_shape(self, table, i):
+        """One row of an AOI table as a calculate_shape-style dict."""
+        shape_type = table["shape_type"][i]
+        shape = {"shape_type": shape_type, "box": tuple(table["box"][i].tolist())}
+        for key in self.SHAPE_EXTRAS[shape_type]:
+            shape[key] = table[key][i] if key == "points" else int(table[key][i])
+        return shape
+
     # ── Helper: safe profile role lookup ────────────────────────
 
     @staticmethod
@@ -392,10 +961,6 @@ class RegionLogic:
             return []
         return profile['roles'].get(role, profile['roles'].get("DEFAULT", []))
 
-    @staticmethod
-    def _override_key(frame_idx, track_id, role, aoi_name):
-        return (int(frame_idx), int(track_id), str(role), str(aoi_name))
-
     @staticmethod
     def _sanitize_box(box):
         x1, y1, x2, y2 = [int(v) for v in box]
@@ -405,23 +970,59 @@ class RegionLogic:
         y2 = max(y1 + 1, y2)
         return (x1, y1, x2, y2)
 
+    def _touch_range(self, first, last):
+        """Bump the override revision of frames first..last (lock held)."""
+        self._rev_counter += 1
+        size = max(self.total_frames, len(self._frame_row))
+        if len(self._override_rev) < size:
+            grown = np.full(size, self._rev_tail, dtype=np.int64)
+            grown[:len(self._override_rev)] = self._override_rev
+            self._override_rev = grown
+        self._override_rev[max(0, first):max(0, last + 1)] = self._rev_counter
+        if last >= len(self._override_rev):
+            self._rev_tail = self._rev_counter
+
+    def override_revision(self, frame_idx):
+        """Revision of the manual overrides of one frame (0 if never edited)."""
+        frame_idx = int(frame_idx)
+        if 0 <= frame_idx < len(self._override_rev):
+            return int(self._override_rev[frame_idx])
+        return self._rev_tail
+
     def set_manual_override(self, frame_idx, track_id, role, aoi_name, box):
-        key = self._override_key(frame_idx, track_id, role, aoi_name)
+        self.set_manual_override_range(frame_idx, frame_idx, track_id, role, aoi_name, box)
+
+    def set_manual_override_range(self, first, last, track_id, role, aoi_name, box):
+        """Override one AOI on frames first..last with a single interval entry."""
+        box = self._sanitize_box(box)
         with self.lock:
-            self.manual_overrides[key] = self._sanitize_box(box)
+            if self.manual_overrides.set_range(first, last, track_id, role, aoi_name, box):
+                self._touch_range(int(first), int(last))
 
     def clear_manual_override(self, frame_idx, track_id, role, aoi_name):
-        key = self._override_key(frame_idx, track_id, role, aoi_name)
+        self.clear_manual_override_range(frame_idx, frame_idx, track_id, role, aoi_name)
+
+    def clear_manual_override_range(self, first, last, track_id, role, aoi_name):
         with self.lock:
-            if key in self.manual_overrides:
-                del self.manual_overrides[key]
+            if self.manual_overrides.clear_range(first, last, track_id, role, aoi_name):
+                self._touch_range(int(first), int(last))
 
     def clear_overrides_for_frame(self, frame_idx):
-        frame_idx = int(frame_idx)
+        self.clear_overrides_range(frame_idx, frame_idx)
+
+    def clear_overrides_range(self, first, last):
+        """Remove every override on frames first..last."""
         with self.lock:
-            keys_to_remove = [k for k in self.manual_overrides if k[0] == frame_idx]
-            for k in keys_to_remove:
-                del self.manual_overrides[k]
+            if self.manual_overrides.clear_range(first, last):
+                self._touch_range(int(first), int(last))
+
+    def replace_manual_overrides(self, overrides):
+        """Swap in a whole OverrideStore, bumping only the frames that differ."""
+        with self.lock:
+            changed = self.manual_overrides.changed_ranges(overrides)
+            self.manual_overrides = overrides
+            for first, last in changed:
+                self._touch_range(first, last)
 
     def get_frame_aoi_data(self, frame_idx, profile, kp_conf_thresh=0.3):
         """
@@ -432,56 +1033,91 @@ class RegionLogic:
         list[dict]
             Each item has: frame, track_id, role, aoi, box, corrected.
         """
-        items = []
+        return self.get_frames_aoi_data([frame_idx], profile, kp_conf_thresh)[int(frame_idx)]
+
+    def get_frames_aoi_data(self, frame_indices, profile, kp_conf_thresh=0.3):
+        """
+        Return the AOIs of several frames, computed in one vectorised pass.
+
+        Returns
+        -------
+        dict[int, list[dict]]
+            get_frame_aoi_data output for every requested frame.
+        """
+        frames = sorted({int(f) for f in frame_indices})
+        result = {f: [] for f in frames}
         if not profile or 'roles' not in profile:
-            return items
+            return result
 
         with self.lock:
-            frame_poses = dict(self.pose_data.get(frame_idx, {}))
-            frame_overrides = {
-                k: v for k, v in self.manual_overrides.items() if k[0] == int(frame_idx)
+            rows = np.array([self._row_of_frame(f) for f in frames], dtype=np.int64)
+            rows = rows[rows >= 0]
+            if not len(rows):
+                return result
+            overrides = self.manual_overrides.window(frames[0], frames[-1])
+
+        table = self._aoi_table(rows, profile, kp_conf_thresh, overrides)
+        for i in range(len(table["frame"])):
+            shape_type = table["shape_type"][i]
+            row = {
+                "frame": int(table["frame"][i]),
+                "track_id": int(table["track_id"][i]),
+                "role": table["role"][i],
+                "aoi": table["aoi"][i],
+                "shape_type": shape_type,
+                "box": tuple(table["box"][i].tolist()),
+                "corrected": bool(table["corrected"][i]),
             }
+            for extra_key in self.SHAPE_EXTRAS[shape_type]:
+                row[extra_key] = table[extra_key][i] if extra_key == "points" else int(table[extra_key][i])
+            result[row["frame"]].append(row)
+        return result
 
-        if not frame_poses:
-            return items
+    def get_aoi_lookup(self, frame_indices, profile, kp_conf_thresh=0.3, profile_for_frame_fn=None):
+        """
+        AOIs of the requested frames only, as rows of the export layout.
 
-        for tid, kps in frame_poses.items():
-            role = self.identity_map.get(str(tid), "Unknown")
-            if role in self.IGNORED_ROLES:
-                continue
+        This is the in-memory counterpart of export_csv for gaze mapping:
+        frames nobody looks at are never computed, and polygons keep their
+        points as lists instead of a JSON string.
 
-            rules = self._get_rules(profile, role)
-            for rule in rules:
-                base_shape = self.calculate_shape(kps, rule, kp_conf_thresh)
-                if not base_shape:
-                    continue
+        Returns
+        -------
+        dict[int, list[dict]]
+            { frame_idx: [ {Frame, TrackID, Role, AOI, ShapeType, x1, ...} ] }
+            for the requested frames that have at least one AOI.
+        """
+        if not profile or 'roles' not in profile:
+            raise ValueError("Cannot compute AOIs: no valid AOI profile loaded.")
 
-                key = self._override_key(frame_idx, tid, role, rule['name'])
-                if key in frame_overrides:
-                    shape = self._shape_from_box(
-                        base_shape.get("shape_type", "box"),
-                        frame_overrides[key],
-                        base_shape=base_shape,
-                    )
-                    corrected = True
-                else:
-                    shape = base_shape
-                    corrected = False
-
-                row = {
-                    "frame": int(frame_idx),
-                    "track_id": int(tid),
-                    "role": role,
-                    "aoi": rule['name'],
-                    "shape_type": shape.get("shape_type", "box"),
-                    "box": shape["box"],
-                    "corrected": corrected,
-                }
-                for extra_key in ("points", "cx", "cy", "radius", "rx", "ry", "angle"):
-                    if extra_key in shape:
-                        row[extra_key] = shape[extra_key]
-                items.append(row)
-        return items
+        frames = sorted({int(f) for f in frame_indices})
+        if not frames:
+            return {}
+        with self.lock:
+            rows = [self._row_of_frame(f) for f in frames]
+            overrides = self.manual_overrides.window(frames[0], frames[-1])
+
+        # Consecutive requested frames sharing a profile form one block.
+        blocks = []
+        for f_idx, row in zip(frames, rows):
+            if row < 0:
+                continue
+            prof = profile_for_frame_fn(f_idx, profile) if profile_for_frame_fn else profile
+            last = blocks[-1] if blocks else None
+            if last is None or (prof is not last[0] and prof != last[0]) or len(last[1]) >= self.EXPORT_CHUNK_FRAMES:
+                blocks.append((prof, []))
+            blocks[-1][1].append(row)
+
+        lookup = {}
+        for prof, block_rows in blocks:
+            if self._cancel_flag:
+                raise InterruptedError("AOI computation cancelled by user.")
+            table = self._aoi_table(np.array(block_rows, dtype=np.int64), prof, kp_conf_thresh, overrides)
+            if not len(table["frame"]):
+                continue
+            for rec in self._table_to_frame(table, json_points=False).to_dict('records'):
+                lookup.setdefault(rec["Frame"], []).append(rec)
+        return lookup
 
     # ── Render Data (for View) ──────────────────────────────────
 
@@ -494,27 +1130,33 @@ class RegionLogic:
         list[dict]
             Each dict has keys: box, color, label, track_id, role, aoi, corrected, shape_type.
         """
-        items = []
-        frame_aois = self.get_frame_aoi_data(frame_idx, profile, kp_conf_thresh)
-        for aoi in frame_aois:
-            if aoi["corrected"]:
-                color = (0, 220, 0)
-            else:
-                color = (255, 0, 255) if aoi["aoi"] == "Peripersonal" else (0, 255, 255)
-            items.append({
-                "box": aoi["box"],
-                "color": color,
-                "label": f"{aoi['role']}:{aoi['aoi']}",
-                "track_id": aoi["track_id"],
-                "role": aoi["role"],
-                "aoi": aoi["aoi"],
-                "corrected": aoi["corrected"],
-                "shape_type": aoi.get("shape_type", "box"),
-            })
-            for extra_key in ("points", "cx", "cy", "radius", "rx", "ry", "angle"):
-                if extra_key in aoi:
-                    items[-1][extra_key] = aoi[extra_key]
-        return items
+        return self.get_frames_render_data([frame_idx], profile, kp_conf_thresh)[int(frame_idx)]
+
+    def get_frames_render_data(self, frame_indices, profile, kp_conf_thresh=0.3):
+        """Drawable items of several frames, as {frame: get_render_data output}."""
+        frame_aois = self.get_frames_aoi_data(frame_indices, profile, kp_conf_thresh)
+        return {f: [self._render_item(aoi) for aoi in aois] for f, aois in frame_aois.items()}
+
+    @staticmethod
+    def _render_item(aoi):
+        if aoi["corrected"]:
+            color = (0, 220, 0)
+        else:
+            color = (255, 0, 255) if aoi["aoi"] == "Peripersonal" else (0, 255, 255)
+        item = {
+            "box": aoi["box"],
+            "color": color,
+            "label": f"{aoi['role']}:{aoi['aoi']}",
+            "track_id": aoi["track_id"],
+            "role": aoi["role"],
+            "aoi": aoi["aoi"],
+            "corrected": aoi["corrected"],
+            "shape_type": aoi.get("shape_type", "box"),
+        }
+        for extra_key in ("points", "cx", "cy", "radius", "rx", "ry", "angle"):
+            if extra_key in aoi:
+                item[extra_key] = aoi[extra_key]
+        return item
 
     # ── Diagnostics ─────────────────────────────────────────────
 
@@ -536,8 +1178,7 @@ class RegionLogic:
             lines.append("❌ NO PROFILE loaded (profile is empty or missing 'roles').")
             return "\n".join(lines)
 
-        with self.lock:
-            frame_poses = self.pose_data.get(frame_idx)
+        frame_poses = self.get_frame_poses(frame_idx)
 
         if not frame_poses:
             lines.append(f"❌ NO POSE found for frame {frame_idx}.")
@@ -584,20 +1225,122 @@ class RegionLogic:
         lines.append("=" * 40)
         return "\n".join(lines)
 
+    def get_coverage_report(self, profile, kp_conf_thresh=0.3, profile_for_frame_fn=None):
+        """
+        AOI coverage of the whole video, computed block-wise over the pose tensors.
+
+        A frame is covered for (role, AOI) when at least one person mapped to
+        the role has a valid keypoint for the rule, i.e. when the AOI is drawn.
+        Uncovered frames get a cause: no detection at all (missing pose),
+        nobody mapped to the role (unmapped role), or the role is there but
+        no keypoint of the rule passes the confidence test (low kp conf).
+
+        Returns
+        -------
+        dict
+            'frames': number of frames analysed (0 .. frames - 1).
+            'items': one dict per (role, AOI) with 'role', 'aoi', 'coverage'
+            (%), 'covered' (frames), 'runs' [(first, last, cause)] of the
+            uncovered frames and 'status' (ndarray[int8] per frame, 0 when
+            covered, otherwise a COVERAGE_CAUSES key).
+        """
+        if not profile or 'roles' not in profile:
+            raise ValueError("Cannot compute coverage: no valid AOI profile loaded.")
+
+        with self.lock:
+            n = self.total_frames if self.total_frames > 0 else len(self._frame_row)
+            identity_map = dict(self.identity_map)
+        roles = ({r for r in profile['roles'] if r != "DEFAULT"} | set(identity_map.values())) - self.IGNORED_ROLES
+        has_pose = np.zeros(n, dtype=bool)
+        has_role = {r: np.zeros(n, dtype=bool) for r in roles}
+        covered = {}   # (role, aoi) -> ndarray[bool] (n,)
+        for r in sorted(roles):
+            for rule in self._get_rules(profile, r):
+                covered[(r, rule['name'])] = np.zeros(n, dtype=bool)
+
+        for rows, prof in self._export_blocks(profile, profile_for_frame_fn):
+            with self.lock:
+                count = self.pose_count[rows]
+                det_r, det_s = np.nonzero(np.arange(self.pose_tids.shape[1]) < count[:, None])
+                frames = self.pose_frames[rows][det_r]
+                tids = self.pose_tids[rows[det_r], det_s]
+                kps = self.pose_kps[rows[det_r], det_s]
+            inside = (frames >= 0) & (frames < n)
+            frames, tids, kps = frames[inside], tids[inside], kps[inside]
+            has_pose[frames] = True
+
+            uniq, inv = np.unique(tids, return_inverse=True)
+            roles_u = np.array([identity_map.get(str(t), "Unknown") for t in uniq.tolist()] + [""], dtype=object)
+            det_role = roles_u[inv] if len(tids) else roles_u[:0]
+            for r in roles:
+                dets = np.flatnonzero(det_role == r)
+                if not len(dets):
+                    continue
+                has_role[r][frames[dets]] = True
+                for rule in self._get_rules(prof, r):
+                    _pts, valid = self._vector_keypoints(kps[dets], rule, kp_conf_thresh)
+                    ok = valid.any(axis=1)
+                    key = (r, rule['name'])
+                    if key not in covered:
+                        covered[key] = np.zeros(n, dtype=bool)
+                    covered[key][frames[dets[ok]]] = True
+
+        items = []
+        for (r, aoi), cov in covered.items():
+            status = np.where(cov, 0, np.where(~has_pose, 1, np.where(~has_role[r], 2, 3))).astype(np.int8)
+            change = np.flatnonzero(np.diff(status)) + 1
+            starts = np.concatenate(([0], change))[:len(status)]
+            ends = np.concatenate((change, [n])) - 1
+            fail = status[starts] > 0
+            runs = [(s, e, self.COVERAGE_CAUSES[c]) for s, e, c in
+                    zip(starts[fail].tolist(), ends[fail].tolist(), status[starts[fail]].tolist())]
+            n_cov = int(cov.sum())
+            items.append({
+                "role": r, "aoi": aoi,
+                "coverage": 100.0 * n_cov / n if n else 0.0,
+                "covered": n_cov, "runs": runs, "status": status,
+            })
+        return {"frames": n, "items": items}
+
+    def format_coverage_report(self, report, max_runs=5):
+        """Human-readable summary of get_coverage_report, longest failure runs first."""
+        fps = max(1e-6, self.fps)
+        lines = ["=" * 40, f"AOI COVERAGE ({report['frames']} frames)", "=" * 40]
+        for item in report["items"]:
+            lines.append(f"{item['role']}:{item['aoi']}  {item['coverage']:.1f}% "
+                         f"({item['covered']}/{report['frames']} frames, {len(item['runs'])} gaps)")
+            for first, last, cause in sorted(item["runs"], key=lambda run: run[0] - run[1])[:max_runs]:
+                lines.append(f"   ❌ {first / fps:9.2f}s – {last / fps:9.2f}s  "
+                             f"frames {first}-{last} ({last - first + 1})  {cause}")
+        lines.append("=" * 40)
+        return "\n".join(lines)
+
     # ── CSV Export ──────────────────────────────────────────────
 
     def export_csv(self, output_path, profile, kp_conf_thresh=0.3,
-                   progress_callback=None, profile_for_frame_fn=None):
+                   progress_callback=None, profile_for_frame_fn=None, workers=None):
         """
         Iterate over all frames and export AOI bounding boxes to CSV.
 
+        Rows are streamed to disk block by block, so memory stays bounded by
+        a few blocks whatever the session length. The file is written next to
+        ``output_path`` and moved into place only once complete. Long sessions
+        are computed in a process pool and written in frame order, giving the
+        same bytes as a single-process export.
+
         Parameters
         ----------
         output_path : str
+            A ``.parquet`` path writes Parquet instead (needs pyarrow).
         profile : dict
             The currently-active AOI profile.
         kp_conf_thresh : float
         progress_callback : callable(str) | None
+        profile_for_frame_fn : callable(int, dict) -> dict | None
+            Per-frame profile (e.g. TOI overrides); evaluated in this process.
+        workers : int | None
+            Worker processes; None picks one per CPU (up to EXPORT_MAX_WORKERS),
+            1 computes everything in this process.
 
         Returns
         -------
@@ -609,61 +1352,565 @@ class RegionLogic:
         if not profile or 'roles' not in profile:
             raise ValueError("Cannot export: no valid AOI profile loaded.")
 
-        rows = []
+        parquet = output_path.lower().endswith(".parquet")
+        if parquet and pq is None:
+            raise ValueError("Parquet export needs the 'pyarrow' package (pip install pyarrow).")
 
         with self.lock:
-            all_frames = sorted(self.pose_data.keys())
-            total = len(all_frames)
+            total = len(self.pose_frames)
+            overrides = self.manual_overrides.copy()
 
-        for count, f_idx in enumerate(all_frames):
-            if self._cancel_flag:
-                raise InterruptedError("Export cancelled by user.")
-            if profile_for_frame_fn:
-                prof_for_frame = profile_for_frame_fn(f_idx, profile)
-            else:
-                prof_for_frame = profile
-            frame_aois = self.get_frame_aoi_data(f_idx, prof_for_frame, kp_conf_thresh)
-            for aoi in frame_aois:
-                b = aoi["box"]
-                shape_type = aoi.get("shape_type", "box")
-                shape_points = json.dumps(aoi.get("points", [])) if shape_type == "polygon" else ""
-                rows.append({
-                    "Frame": f_idx,
-                    "Timestamp": round(f_idx / self.fps, 4),
-                    "TrackID": aoi["track_id"],
-                    "Role": aoi["role"],
-                    "AOI": aoi["aoi"],
-                    "ShapeType": shape_type,
-                    "ShapePoints": shape_points,
-                    "CenterX": aoi.get("cx", -1),
-                    "CenterY": aoi.get("cy", -1),
-                    "Radius": aoi.get("radius", -1),
-                    "RadiusX": aoi.get("rx", -1),
-                    "RadiusY": aoi.get("ry", -1),
-                    "Angle": aoi.get("angle", 0),
-                    "x1": b[0], "y1": b[1],
-                    "x2": b[2], "y2": b[3],
-                    "Corrected": int(aoi["corrected"]),
-                })
+        blocks = [(int(rows[0]), int(rows[-1]) + 1, ((None, prof),))
+                  for rows, prof in self._export_blocks(profile, profile_for_frame_fn)]
+        workers = self._export_workers(workers, total, len(blocks))
 
-            if progress_callback and count % 500 == 0:
-                progress_callback(f"Exporting… {count}/{total} frames")
+        out = _ExportFile(output_path, self._table_to_frame(self._aoi_table(np.empty(0, dtype=np.int64), profile)))
+        try:
+            for stop, ((n_block, payload),) in self._export_payloads(
+                    blocks, kp_conf_thresh, overrides, (parquet,), workers):
+                if self._cancel_flag:
+                    raise InterruptedError("Export cancelled by user.")
+                out.write(n_block, payload)
 
-        pd.DataFrame(rows).to_csv(output_path, index=False)
+                if progress_callback:
+                    progress_callback(f"Exporting… {out.rows} rows written ({stop}/{total} frames)")
+            out.close()
+        finally:
+            out.discard()
 
         if progress_callback:
-            progress_callback(f"Export complete: {len(rows)} rows.")
+            progress_callback(f"Export complete: {out.rows} rows.")
+
+        return out.rows
+
+    def export_profiles(self, outputs, kp_conf_thresh=0.3, progress_callback=None, workers=None):
+        """
+        Export several AOI profiles in a single pass over the pose data.
+
+        Each block of frames gathers its detections once; every profile is
+        then evaluated on them. Rules with the same keypoints (within or
+        across profiles) share their validity masks and base extents, a rule
+        identical in several profiles is computed and formatted once, and
+        the Frame/Timestamp/TrackID text is formatted once per block. Files
+        are streamed like export_csv, in a process pool for long sessions,
+        and carry a trailing 'Profile' column. Manual overrides apply to
+        every profile; TOI rule overrides do not.
+
+        Parameters
+        ----------
+        outputs : list[tuple[str, dict]]
+            (output_path, profile) pairs; ``.parquet`` paths write Parquet.
+        kp_conf_thresh : float
+        progress_callback : callable(str) | None
+        workers : int | None
+            As in export_csv.
+
+        Returns
+        -------
+        dict[str, int]
+            Rows written per output path.
+        """
+        self._cancel_flag = False
+        outputs = list(outputs)
+        if not outputs:
+            raise ValueError("Cannot export: no AOI profiles selected.")
+        for path, profile in outputs:
+            if not profile or 'roles' not in profile:
+                raise ValueError(f"Cannot export {os.path.basename(path)}: not a valid AOI profile.")
+            if path.lower().endswith(".parquet") and pq is None:
+                raise ValueError("Parquet export needs the 'pyarrow' package (pip install pyarrow).")
+
+        with self.lock:
+            total = len(self.pose_frames)
+            overrides = self.manual_overrides.copy()
+
+        named = tuple((str(profile.get('name') or os.path.splitext(os.path.basename(path))[0]), profile)
+                      for path, profile in outputs)
+        blocks = [(int(rows[0]), int(rows[-1]) + 1, named) for rows, _prof in self._export_blocks(named[0][1])]
+        workers = self._export_workers(workers, total, len(blocks))
+
+        files = []
+        try:
+            for (path, profile), (name, _p) in zip(outputs, named):
+                empty = self._table_to_frame(self._aoi_table(np.empty(0, dtype=np.int64), profile))
+                empty["Profile"] = pd.Series(dtype=object)
+                files.append(_ExportFile(path, empty))
+
+            formats = tuple(out.parquet for out in files)
+            for stop, payloads in self._export_payloads(blocks, kp_conf_thresh, overrides, formats, workers):
+                if self._cancel_flag:
+                    raise InterruptedError("Export cancelled by user.")
+                for out, (n_block, payload) in zip(files, payloads):
+                    out.write(n_block, payload)
+
+                if progress_callback:
+                    progress_callback(f"Exporting {len(files)} profiles… "
+                                      f"{sum(f.rows for f in files)} rows written ({stop}/{total} frames)")
+            for out in files:
+                out.close()
+        finally:
+            for out in files:
+                out.discard()
+
+        if progress_callback:
+            progress_callback(f"Export complete: {len(files)} profiles.")
+
+        return {out.path: out.rows for out in files}
+
+    def _export_workers(self, workers, total, n_blocks):
+        """Worker processes for an export of ``total`` rows in ``n_blocks`` blocks."""
+        if workers is None:
+            workers = min(os.cpu_count() or 1, self.EXPORT_MAX_WORKERS)
+        if total < self.EXPORT_POOL_MIN_FRAMES:
+            workers = 1
+        return max(1, min(int(workers), n_blocks))
+
+    def _export_block(self, rows, profiles, kp_conf_thresh, overrides, formats):
+        """
+        AOI rows of one export block, for each output.
+
+        Parameters
+        ----------
+        profiles : sequence of (str | None, dict)
+            Per output: value of the 'Profile' column (None: no such column)
+            and the profile. Outputs share the block's detections.
+        formats : sequence of bool
+            Per output: True for Parquet.
+
+        Returns
+        -------
+        list[(int, DataFrame | str | None)]
+            Per output, row count and the rows: a DataFrame for Parquet, CSV
+            text without header otherwise.
+        """
+        shared = {}
+        payloads = []
+        for (name, profile), parquet in zip(profiles, formats):
+            table = self._aoi_table(rows, profile, kp_conf_thresh, overrides, shared)
+            if not len(table["frame"]):
+                payloads.append((0, None))
+                continue
+            if not parquet:
+                payloads.append((len(table["frame"]), self._table_to_csv(table, shared, name)))
+                continue
+            df = self._table_to_frame(table)
+            if name is not None:
+                df["Profile"] = name
+            payloads.append((len(df), df))
+        return payloads
+
+    def _export_payloads(self, blocks, kp_conf_thresh, overrides, formats, workers):
+        """
+        Compute the export blocks, in this process or in a process pool.
+
+        Yields
+        ------
+        (int, list)
+            End row of the block and its _export_block payloads, always in
+            frame order.
+        """
+        if workers <= 1:
+            for start, stop, profs in blocks:
+                yield stop, self._export_block(np.arange(start, stop), profs, kp_conf_thresh, overrides, formats)
+            return
+
+        # Distinct profile sets travel once, as plain dicts; blocks refer to them by index.
+        profiles, specs = [], []
+        for start, stop, profs in blocks:
+            k = next((i for i, p in enumerate(profiles) if p is profs or p == profs), len(profiles))
+            if k == len(profiles):
+                profiles.append(profs)
+            specs.append((start, stop, k))
+        profiles = [self._plain_profile(p) for p in profiles]
+
+        # Pose tensors are handed over as memory-mapped .npy files, not pickled per task.
+        tmp_dir = tempfile.mkdtemp(prefix="hermes_aoi_export_")
+        try:
+            paths = {}
+            with self.lock:
+                for name in ("pose_frames", "pose_count", "pose_tids", "pose_kps"):
+                    paths[name] = os.path.join(tmp_dir, f"{name}.npy")
+                    np.save(paths[name], getattr(self, name))
+                identity_map = dict(self.identity_map)
+
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_export_worker_init,
+                initargs=(paths, identity_map, overrides, profiles, kp_conf_thresh, self.fps, formats),
+            ) as pool:
+                todo = iter(specs)
+                pending = deque()
+                try:
+                    for spec in todo:
+                        pending.append((spec[1], pool.submit(_export_worker_block, *spec)))
+                        if len(pending) >= 2 * workers:
+                            break
+                    while pending:
+                        stop, future = pending.popleft()
+                        spec = next(todo, None)
+                        if spec is not None:
+                            pending.append((spec[1], pool.submit(_export_worker_block, *spec)))
+                        yield stop, future.result()
+                except BaseException:
+                    # Cancelled (or failed): drop the queued blocks, let running ones finish.
+                    for _stop, future in pending:
+                        future.cancel()
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @classmethod
+    def _plain_profile(cls, obj):
+        """Plain dict / list copy of a (possibly read-only) profile."""
+        if isinstance(obj, (dict, MappingProxyType)):
+            return {k: cls._plain_profile(v) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return [cls._plain_profile(v) for v in obj]
+        return obj
+
+    def _export_blocks(self, profile, profile_for_frame_fn=None):
+        """
+        Split the pose rows into blocks sharing one profile.
+
+        Yields
+        ------
+        (ndarray[int64], dict)
+            Consecutive rows (at most EXPORT_CHUNK_FRAMES) and their profile.
+        """
+        with self.lock:
+            frames = self.pose_frames.tolist()
+        start, block_prof = 0, None
+        for r, f_idx in enumerate(frames):
+            prof = profile_for_frame_fn(f_idx, profile) if profile_for_frame_fn else profile
+            if r > start and ((prof is not block_prof and prof != block_prof)
+                              or r - start >= self.EXPORT_CHUNK_FRAMES):
+                yield np.arange(start, r), block_prof
+                start = r
+            if r == start:
+                block_prof = prof
+        if start < len(frames):
+            yield np.arange(start, len(frames)), block_prof
+
+    @staticmethod
+    def _csv_field(value):
+        """One text field as pandas / csv QUOTE_MINIMAL writes it."""
+        text = str(value)
+        if ',' in text or '"' in text or '\n' in text or '\r' in text:
+            return '"' + text.replace('"', '""') + '"'
+        return text
+
+    def _table_to_csv(self, table, shared, profile_name=None):
+        """
+        AOI table -> CSV text without header, byte for byte what
+        ``_table_to_frame(table).to_csv(index=False, header=False)`` writes,
+        plus a trailing Profile column when profile_name is given.
+
+        ``shared`` is the _aoi_table scratch dict of the block: the
+        Frame/Timestamp/TrackID text of each detection is formatted once per
+        block, and the lines of a rule are reused by every profile that has
+        the same rule.
+        """
+        n = len(table["frame"])
+        if not n:
+            return ""
+        if "csv_prefix" not in shared:
+            frames, tids, _by_role = shared["dets"]
+            uniq, inv = np.unique(frames, return_inverse=True)
+            stamps = {f: repr(round(f / self.fps, 4)) for f in uniq.tolist()}
+            shared["csv_prefix"] = np.array(
+                [f"{f},{stamps[f]},{t}," for f, t in zip(frames.tolist(), tids.tolist())], dtype=object)
+        prefix = shared["csv_prefix"]
+        lines_cache = shared.setdefault("csv_lines", {})
+        labels = shared.setdefault("csv_labels", {})
+        fmt = self._csv_field
+        nums = np.column_stack((table["cx"], table["cy"], table["radius"], table["rx"], table["ry"], table["angle"],
+                                table["box"], table["corrected"].astype(np.int64)))
+        template = "%s%s,%s,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d"
+
+        lines = np.empty(n, dtype=object)
+        for key, sl in table["parts"]:
+            cached = lines_cache.get(key)
+            if cached is None or len(cached) != len(sl):
+                out = []
+                for pre, role, aoi, shape, pts, row in zip(
+                        prefix[table["det"][sl]].tolist(), table["role"][sl].tolist(), table["aoi"][sl].tolist(),
+                        table["shape_type"][sl].tolist(), table["points"][sl].tolist(), nums[sl].tolist()):
+                    label = labels.get((role, aoi, shape))
+                    if label is None:
+                        label = labels[(role, aoi, shape)] = f"{fmt(role)},{fmt(aoi)},{fmt(shape)}"
+                    points = fmt(json.dumps(pts)) if shape == "polygon" else ""
+                    out.append(template % (pre, label, points, *row))
+                cached = lines_cache[key] = np.array(out, dtype=object)
+            lines[sl] = cached
+
+        end = os.linesep if profile_name is None else f",{fmt(profile_name)}{os.linesep}"
+        return end.join(lines.tolist()) + end
+
+    def _table_to_frame(self, table, json_points=True):
+        """AOI table -> export DataFrame (CSV column layout); polygon points as JSON text or lists."""
+        frames = table["frame"]
+        uniq, inv = np.unique(frames, return_inverse=True)
+        stamps = np.array([round(f / self.fps, 4) for f in uniq.tolist()], dtype=np.float64)
+        polygon = table["shape_type"] == "polygon"
+        shape_points = np.full(len(frames), "", dtype=object)
+        if json_points:
+            shape_points[polygon] = [json.dumps(p) for p in table["points"][polygon]]
+        else:
+            shape_points[polygon] = table["points"][polygon]
+        box = table["box"]
+        return pd.DataFrame({
+            "Frame": frames,
+            "Timestamp": stamps[inv] if len(frames) else stamps,
+            "TrackID": table["track_id"],
+            "Role": table["role"],
+            "AOI": table["aoi"],
+            "ShapeType": table["shape_type"],
+            "ShapePoints": shape_points,
+            "CenterX": table["cx"],
+            "CenterY": table["cy"],
+            "Radius": table["radius"],
+            "RadiusX": table["rx"],
+            "RadiusY": table["ry"],
+            "Angle": table["angle"],
+            "x1": box[:, 0], "y1": box[:, 1],
+            "x2": box[:, 2], "y2": box[:, 3],
+            "Corrected": table["corrected"].astype(np.int64),
+        })
+
+
+# ═══════════════════════════════════════════════════════════════════
+# EXPORT WORKERS — process-pool side of RegionLogic.export_csv
+# ═══════════════════════════════════════════════════════════════════
+
+_EXPORT_WORKER = {}
+
+
+def _export_worker_init(paths, identity_map, overrides, profiles, kp_conf_thresh, fps, formats):
+    """Build the worker's RegionLogic over the memory-mapped pose tensors."""
+    logic = RegionLogic()
+    for name, path in paths.items():
+        setattr(logic, name, np.load(path, mmap_mode="r"))
+    logic.identity_map = identity_map
+    logic.fps = fps
+    _EXPORT_WORKER.update(logic=logic, overrides=overrides, profiles=profiles,
+                          kp_conf_thresh=kp_conf_thresh, formats=formats)
+
+
+def _export_worker_block(start, stop, profile_idx):
+    w = _EXPORT_WORKER
+    return w["logic"]._export_block(np.arange(start, stop), w["profiles"][profile_idx],
+                                    w["kp_conf_thresh"], w["overrides"], w["formats"])
+
+
+# ═══════════════════════════════════════════════════════════════════
+# EXPORT FILES — streamed output of RegionLogic exports
+# ═══════════════════════════════════════════════════════════════════
+
+class _ExportFile:
+    """
+    One AOI export being streamed to ``<path>.part``.
+
+    close() finishes the file and moves it into place; discard() removes
+    whatever is left, so a failed or cancelled export never leaves a
+    truncated file at ``path``.
+    """
+
+    def __init__(self, path, empty):
+        self.path = path
+        self.tmp_path = path + ".part"
+        self.parquet = path.lower().endswith(".parquet")
+        self.empty = empty      # zero-row DataFrame: CSV header / Parquet schema
+        self.rows = 0
+        self._writer = None
+        self._fh = open(self.tmp_path, "wb")
+
+    def write(self, n_rows, payload):
+        """Append rows: a DataFrame for Parquet, CSV text without header otherwise."""
+        if not n_rows:
+            return
+        if self.parquet:
+            self._write_parquet_block(payload)
+        else:
+            if not self.rows:
+                self._fh.write(self.empty.to_csv(index=False).encode("utf-8"))
+            self._fh.write(payload.encode("utf-8"))
+        self.rows += n_rows
+
+    def _write_parquet_block(self, df):
+        """Append one block as a Parquet row group, opening the writer on the first call."""
+        schema = self._writer.schema if self._writer is not None else None
+        block = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._fh, block.schema)
+        self._writer.write_table(block)
+
+    def close(self):
+        if self.parquet:
+            if self._writer is None:
+                self._write_parquet_block(self.empty)
+            self._writer.close()
+        elif not self.rows:
+            pd.DataFrame([]).to_csv(self._fh, index=False)
+        self._fh.close()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        self._fh.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+# ═══════════════════════════════════════════════════════════════════
+# COMPILED PROFILES — effective AOI profile of every TOI
+# ═══════════════════════════════════════════════════════════════════
+
+class CompiledTOIProfiles:
+    """
+    Effective AOI profiles of a session, compiled once per TOI.
+
+    The base profile and the rule overrides of each TOI are merged up front
+    into read-only rule tables (mapping proxies and tuples) shared by every
+    frame of the TOI, and frames are resolved to their TOI through a
+    precomputed array. Build a new instance whenever the profile, the TOI
+    rule overrides, the TOI list or the video timing change.
+    """
+
+    def __init__(self, profile, toi_records, toi_rule_overrides, fps, total_frames):
+        self.fps = max(1e-6, fps)
+        self._intervals = []   # (toi_idx, start_sec, end_sec) of the well-formed TOIs
+        for idx, row in enumerate(toi_records):
+            try:
+                s = float(row.get("Start", -1))
+                e = float(row.get("End", -1))
+            except Exception:
+                continue
+            self._intervals.append((idx, s, e))
+
+        sec = np.arange(max(0, int(total_frames))) / self.fps
+        self.toi_of_frame = np.full(len(sec), -1, dtype=np.int64)
+        for idx, s, e in self._intervals:
+            self.toi_of_frame[(s <= sec) & (sec <= e)] = idx  # last match wins
+
+        self._profiles = {None: self._freeze(profile)}
+        self._signatures = {None: self._signature(profile)}
+        for idx, _s, _e in self._intervals:
+            toi_map = toi_rule_overrides.get(str(idx), {})
+            if toi_map:
+                merged = self._merge(profile, toi_map)
+                self._profiles[idx] = self._freeze(merged)
+                self._signatures[idx] = self._signature(merged)
+
+    @staticmethod
+    def _merge(profile, toi_map):
+        prof = copy.deepcopy(profile)
+        roles = prof.get("roles", {})
+        for role_name, idx_map in toi_map.items():
+            role_rules = roles.get(role_name)
+            if not isinstance(role_rules, list):
+                continue
+            for idx_key, changes in idx_map.items():
+                try:
+                    ridx = int(idx_key)
+                except Exception:
+                    continue
+                if 0 <= ridx < len(role_rules):
+                    role_rules[ridx].update(changes)
+        return prof
+
+    @classmethod
+    def _freeze(cls, obj):
+        if isinstance(obj, dict):
+            return MappingProxyType({k: cls._freeze(v) for k, v in obj.items()})
+        if isinstance(obj, list):
+            return tuple(cls._freeze(v) for v in obj)
+        return obj
+
+    @staticmethod
+    def _signature(profile):
+        blob = json.dumps(profile, sort_keys=True, default=str)
+        return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+    def toi_index(self, frame_idx):
+        """Index of the TOI active at a frame (last match wins), or None."""
+        frame_idx = int(frame_idx)
+        if 0 <= frame_idx < len(self.toi_of_frame):
+            idx = int(self.toi_of_frame[frame_idx])
+            return idx if idx >= 0 else None
+        sec = frame_idx / self.fps
+        match = None
+        for idx, s, e in self._intervals:
+            if s <= sec <= e:
+                match = idx
+        return match
+
+    def profile_for_toi(self, toi_idx):
+        return self._profiles.get(toi_idx, self._profiles[None])
+
+    def signature_for_toi(self, toi_idx):
+        """Content digest of the effective profile of a TOI."""
+        return self._signatures.get(toi_idx, self._signatures[None])
+
+    def profile_for_frame(self, frame_idx):
+        return self.profile_for_toi(self.toi_index(frame_idx))
+
+
+# ═══════════════════════════════════════════════════════════════════
+# AOI FRAME CACHE — LRU of per-frame render items
+# ═══════════════════════════════════════════════════════════════════
+
+class AOIFrameCache:
+    """
+    Thread-safe LRU cache of the render items of single frames.
+
+    Keys carry everything the AOIs of a frame depend on (frame, effective
+    profile signature, keypoint threshold, override revision of the frame,
+    pose / identity data version). An edit therefore never needs to walk
+    the cache: entries it makes stale stop matching and age out.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            items = self._items.get(key)
+            if items is not None:
+                self._items.move_to_end(key)
+            return items
+
+    def put(self, key, items):
+        with self._lock:
+            self._items[key] = items
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
 
-        return len(rows)
 
 class TOITimelineWidget(tk.Canvas):
-    """Timeline with TOI epochs and playhead."""
+    """Timeline with TOI epochs, optional AOI coverage strip and playhead."""
+
+    # Coverage strip colours: covered, then one per RegionLogic.COVERAGE_CAUSES key
+    COVERAGE_COLORS = ("#2e7d32", "#9e9e9e", "#f9a825", "#c62828")
+    COVERAGE_HEIGHT = 5
 
     def __init__(self, parent, command_seek, **kwargs):
         super().__init__(parent, **kwargs)
         self.command_seek = command_seek
         self.duration = 0.0
         self.tois = []
+        self.coverage = None      # ndarray[int8] per frame (see get_coverage_report)
+        self._coverage_cols = (0, [])
         self.cursor_x = 0
         self.bind("<Button-1>", self.on_click)
         self.bind("<Configure>", lambda _e: self.redraw())
@@ -688,18 +1935,43 @@ class TOITimelineWidget(tk.Canvas):
                 })
         self.redraw()
 
+    def set_coverage(self, status):
+        """Show a per-frame coverage status array under the TOIs (None hides it)."""
+        self.coverage = None if status is None or not len(status) else np.asarray(status)
+        self._coverage_cols = (0, [])
+        self.redraw()
+
+    def _coverage_runs(self, w):
+        """(x1, x2, colour) runs of the coverage strip, binned per pixel column and cached per width."""
+        if self._coverage_cols[0] == w:
+            return self._coverage_cols[1]
+        # Worst status of the column wins so short gaps stay visible at any width
+        col = np.maximum.reduceat(self.coverage, (np.arange(w) * len(self.coverage)) // w)
+        change = np.flatnonzero(np.diff(col)) + 1
+        starts = np.concatenate(([0], change))
+        ends = np.concatenate((change, [w]))
+        runs = [(int(a), int(b), self.COVERAGE_COLORS[int(col[a])]) for a, b in zip(starts, ends)]
+        self._coverage_cols = (w, runs)
+        return runs
+
     def redraw(self):
         self.delete("all")
         w, h = self.winfo_width(), self.winfo_height()
         if self.duration <= 0 or w <= 2 or h <= 2:
             return
 
+        bottom = h - 2
+        if self.coverage is not None:
+            bottom = h - 2 - self.COVERAGE_HEIGHT
+            for x1, x2, color in self._coverage_runs(w):
+                self.create_rectangle(x1, bottom, x2, h, fill=color, outline="")
+
         for t in self.tois:
             x1 = int(max(0, min(w, (t['s'] / self.duration) * w)))
             x2 = int(max(0, min(w, (t['e'] / self.duration) * w)))
             if x2 <= x1:
                 x2 = min(w, x1 + 1)
-            self.create_rectangle(x1, 2, x2, h - 2, fill=t['c'], outline="gray")
+            self.create_rectangle(x1, 2, x2, bottom, fill=t['c'], outline="gray")
 
         self.create_line(self.cursor_x, 0, self.cursor_x, h, fill="#d32f2f", width=2)
 
@@ -722,6 +1994,13 @@ class TOITimelineWidget(tk.Canvas):
 # ═══════════════════════════════════════════════════════════════════
 
 class RegionView:
+    # Frames pre-filled in the AOI cache around the playhead
+    PREFILL_BEHIND = 30
+    PREFILL_AHEAD = 120
+    PREFILL_BLOCK = 32
+    # Autosave coalesces the edits of this window into one background write
+    AUTOSAVE_DEBOUNCE_MS = 1500
+
     def __init__(self, parent, context):
         self.parent = parent
         self.context = context
@@ -777,6 +2056,18 @@ class RegionView:
         self.last_manual_save_ts = None
         self.session_state_path = None
         self.current_toi_idx = None
+        self.aoi_cache = AOIFrameCache()
+        self._prefill_jobs = None
+        self._prefill_wakeup = threading.Event()
+        self._prefill_thread = None
+        self._prefill_stamp = None
+        self._compiled = None
+        self._autosave_after_id = None
+        self._autosave_job = None
+        self._autosave_lock = threading.Lock()
+        self._autosave_write_lock = threading.Lock()   # held while a session file is written
+        self._autosave_wakeup = threading.Event()
+        self._autosave_thread = None
 
         # Load first available profile
         profs = self.pm.list_profiles()
@@ -799,6 +2090,22 @@ class RegionView:
         self._init_session_state_path()
         self._try_restore_newer_autosave()
 
+        # Pending autosaves are written before the view goes away (module switch, app close)
+        self.parent.bind("<Destroy>", self._on_destroy, add="+")
+        self._toplevel = self.parent.winfo_toplevel()
+        self._toplevel.protocol("WM_DELETE_WINDOW", self._on_close)
+
+    def _on_destroy(self, event):
+        if event.widget == self.parent:
+            self._finish_autosave()
+
+    def _on_close(self):
+        self._finish_autosave()
+        try:
+            self._toplevel.destroy()
+        except (tk.TclError, AttributeError):
+            pass
+
     # ── UI Construction ─────────────────────────────────────────
 
     def _setup_ui(self):
@@ -843,6 +2150,8 @@ class RegionView:
 
         tk.Button(btns, text="🔍 FRAME DIAGNOSTICS", bg="red", fg="white",
                   font=("Bold", 10), command=self.run_diagnostics).pack(side=tk.RIGHT, padx=20)
+        tk.Button(btns, text="📊 COVERAGE", bg="#455a64", fg="white",
+                  font=("Bold", 10), command=self.run_coverage).pack(side=tk.RIGHT, padx=5)
 
         transport = tk.Frame(ctrl)
         transport.pack(fill=tk.X, pady=(2, 4))
@@ -933,9 +2242,11 @@ class RegionView:
         self.refresh_editors()
         self._build_frame_correction_editor(right)
 
+        tk.Button(right, text="Export several profiles…", command=self.export_profiles_dialog
+                  ).pack(side=tk.BOTTOM, fill=tk.X, pady=(0, 10))
         tk.Button(right, text="GENERATE & EXPORT AOI CSV", bg="#4CAF50", fg="white",
                   font=("Bold", 12), height=2, command=self.export_data
-                  ).pack(side=tk.BOTTOM, fill=tk.X, pady=20)
+                  ).pack(side=tk.BOTTOM, fill=tk.X, pady=(20, 5))
 
         self._update_history_buttons()
 
@@ -1007,6 +2318,7 @@ class RegionView:
             return None
 
     def _init_session_state_path(self):
+        self._finish_autosave()  # the previous session's last edits go to its own file
         out_dir = self.context.paths.get("output", "")
         if out_dir and os.path.exists(out_dir):
             self.session_state_path = os.path.join(out_dir, "_aoi_edit_session.json")
@@ -1014,16 +2326,20 @@ class RegionView:
             self.session_state_path = os.path.join(os.getcwd(), "_aoi_edit_session.json")
 
     def _snapshot_edit_state(self):
+        # Structural sharing, no deep copies: the override store copies only
+        # its key table, and the profile / TOI rule maps are path-copied by
+        # every edit (update_rule_val) instead of being mutated.
         return {
-            "manual_overrides": copy.deepcopy(self.logic.manual_overrides),
-            "toi_rule_overrides": copy.deepcopy(self.toi_rule_overrides),
-            "current_profile": copy.deepcopy(self.current_profile),
+            "manual_overrides": self.logic.manual_overrides.copy(),
+            "toi_rule_overrides": self.toi_rule_overrides,
+            "current_profile": self.current_profile,
         }
 
     def _restore_edit_state(self, state):
-        self.logic.manual_overrides = copy.deepcopy(state.get("manual_overrides", {}))
-        self.toi_rule_overrides = copy.deepcopy(state.get("toi_rule_overrides", {}))
-        self.current_profile = copy.deepcopy(state.get("current_profile", {}))
+        self.logic.replace_manual_overrides(state.get("manual_overrides", OverrideStore()).copy())
+        self.toi_rule_overrides = state.get("toi_rule_overrides", {})
+        self.current_profile = state.get("current_profile", {})
+        self._invalidate_profiles()
         self.refresh_editors()
         self.show_frame()
 
@@ -1063,55 +2379,143 @@ class RegionView:
         self._update_history_buttons()
 
     def _serialize_session_state(self):
-        payload = {
+        return self._session_payload(self._session_snapshot())
+
+    def _session_snapshot(self):
+        """Cheap, immutable view of the session (structural sharing, see _snapshot_edit_state)."""
+        return {
             "updated_at": datetime.now().isoformat(),
             "manual_save_ts": self.last_manual_save_ts,
-            "manual_overrides": [],
+            "manual_overrides": self.logic.manual_overrides.copy(),
             "toi_rule_overrides": self.toi_rule_overrides,
             "current_profile": self.current_profile,
         }
-        for (f_idx, tid, role, aoi), box in self.logic.manual_overrides.items():
+
+    @staticmethod
+    def _session_payload(snapshot):
+        """JSON payload of a session snapshot; safe off the UI thread."""
+        payload = dict(snapshot, manual_overrides=[])
+        for tid, role, aoi, first, last, box in snapshot["manual_overrides"].spans():
             payload["manual_overrides"].append({
-                "frame": int(f_idx),
-                "track_id": int(tid),
-                "role": str(role),
-                "aoi": str(aoi),
+                "first": first,
+                "last": last,
+                "track_id": tid,
+                "role": role,
+                "aoi": aoi,
                 "box": [int(v) for v in box],
             })
         return payload
 
     def _deserialize_session_state(self, payload):
+        self._finish_autosave()
         self.last_manual_save_ts = payload.get("manual_save_ts")
         self.toi_rule_overrides = payload.get("toi_rule_overrides", {}) or {}
         self.current_profile = payload.get("current_profile", self.current_profile)
-        self.logic.manual_overrides = {}
+        self._invalidate_profiles()
+        overrides = OverrideStore()
         for row in payload.get("manual_overrides", []):
-            key = (
-                int(row.get("frame", 0)),
-                int(row.get("track_id", -1)),
-                str(row.get("role", "")),
-                str(row.get("aoi", "")),
-            )
+            # Older sessions store one entry per frame ("frame"), newer ones intervals.
+            first = int(row.get("first", row.get("frame", 0)))
+            last = int(row.get("last", first))
             box = row.get("box", [0, 0, 1, 1])
-            self.logic.manual_overrides[key] = self.logic._sanitize_box(tuple(box))
+            overrides.set_range(first, last, row.get("track_id", -1), row.get("role", ""),
+                                row.get("aoi", ""), self.logic._sanitize_box(tuple(box)))
+        self.logic.replace_manual_overrides(overrides)
         self.undo_stack.clear()
         self.redo_stack.clear()
         self._update_history_buttons()
         self.refresh_editors()
 
     def _autosave_session_state(self):
+        """Schedule a write at most AUTOSAVE_DEBOUNCE_MS after the first unsaved edit."""
+        if not self.session_state_path or self._autosave_after_id is not None:
+            return
+        self._autosave_after_id = self.parent.after(self.AUTOSAVE_DEBOUNCE_MS, self._flush_autosave)
+
+    def _cancel_autosave_timer(self):
+        """Drop the debounce timer; True if an autosave was pending."""
+        if self._autosave_after_id is None:
+            return False
+        try:
+            self.parent.after_cancel(self._autosave_after_id)
+        except Exception:
+            pass
+        self._autosave_after_id = None
+        return True
+
+    def _flush_autosave(self):
+        """Hand the current state to the background writer (UI thread, no I/O)."""
+        self._cancel_autosave_timer()
         if not self.session_state_path:
             return
+        job = (self.session_state_path, self._session_snapshot())
+        with self._autosave_lock:
+            self._autosave_job = job  # a newer state supersedes one not yet written
+        self._autosave_wakeup.set()
+        if self._autosave_thread is None:
+            self._autosave_thread = threading.Thread(target=self._autosave_loop, daemon=True)
+            self._autosave_thread.start()
+
+    def _autosave_loop(self):
+        while True:
+            self._autosave_wakeup.wait()
+            self._autosave_wakeup.clear()
+            with self._autosave_write_lock:
+                with self._autosave_lock:
+                    job, self._autosave_job = self._autosave_job, None
+                if job is not None:
+                    self._write_session_file(*job)
+
+    def _write_session_now(self):
+        """
+        Write the current state synchronously, superseding any queued autosave.
+
+        Returns
+        -------
+        str | None
+            Error message, None on success.
+        """
+        self._cancel_autosave_timer()
+        if not self.session_state_path:
+            return "No session file path."
+        job = (self.session_state_path, self._session_snapshot())
+        # The write lock waits for a write in progress and keeps the writer from
+        # overwriting this state with an older queued one afterwards.
+        with self._autosave_write_lock:
+            with self._autosave_lock:
+                self._autosave_job = None
+            return self._write_session_file(*job)
+
+    def _finish_autosave(self):
+        """Write unsaved edits now (pending timer or queued job), else wait for a write in progress."""
+        with self._autosave_lock:
+            queued = self._autosave_job is not None
+        if self._cancel_autosave_timer() or queued:
+            self._write_session_now()
+        else:
+            with self._autosave_write_lock:
+                pass
+
+    @classmethod
+    def _write_session_file(cls, path, snapshot):
+        """Write the session JSON atomically (temp file + rename), compact encoding; returns the error or None."""
+        tmp_path = path + ".tmp"
         try:
-            with open(self.session_state_path, "w", encoding="utf-8") as f:
-                json.dump(self._serialize_session_state(), f, indent=2)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cls._session_payload(snapshot), f, separators=(",", ":"))
+            os.replace(tmp_path, path)
         except Exception as exc:
             print(f"Autosave session failed: {exc}")
+            return str(exc)
+        return None
 
     def save_session_now(self):
         self.last_manual_save_ts = datetime.now().isoformat()
-        self._autosave_session_state()
-        messagebox.showinfo("Saved", "AOI session state saved.")
+        err = self._write_session_now()
+        if err:
+            messagebox.showerror("Save Error", f"AOI session state NOT saved:\n{err}")
+        else:
+            messagebox.showinfo("Saved", "AOI session state saved.")
 
     def load_session_dialog(self):
         path = filedialog.askopenfilename(filetypes=[("Session JSON", "*.json")])
@@ -1128,8 +2532,9 @@ class RegionView:
 
     def reset_session_dialog(self):
         if messagebox.askyesno("Reset Session", "Clear all manual edits and overrides?"):
-            self.logic.manual_overrides = {}
+            self.logic.replace_manual_overrides(OverrideStore())
             self.toi_rule_overrides = {}
+            self._invalidate_profiles()
             self.undo_stack.clear()
             self.redo_stack.clear()
             self._update_history_buttons()
@@ -1158,8 +2563,8 @@ class RegionView:
         if not self.manual_mode:
             self.manual_mode = True
             self.manual_mode_snapshot = self._snapshot_edit_state()
-            self.manual_mode_undo_snapshot = copy.deepcopy(self.undo_stack)
-            self.manual_mode_redo_snapshot = copy.deepcopy(self.redo_stack)
+            self.manual_mode_undo_snapshot = list(self.undo_stack)
+            self.manual_mode_redo_snapshot = list(self.redo_stack)
             self._manual_prev_scope = self.edit_scope_var.get()
             self.edit_scope_var.set("Frame")
             self.is_playing = False
@@ -1181,8 +2586,8 @@ class RegionView:
         )
         if not keep:
             self._restore_edit_state(self.manual_mode_snapshot)
-            self.undo_stack = copy.deepcopy(self.manual_mode_undo_snapshot)
-            self.redo_stack = copy.deepcopy(self.manual_mode_redo_snapshot)
+            self.undo_stack = list(self.manual_mode_undo_snapshot)
+            self.redo_stack = list(self.manual_mode_redo_snapshot)
             self._update_history_buttons()
 
         self.manual_mode = False
@@ -1212,6 +2617,7 @@ class RegionView:
                 raise ValueError("TOI file must contain Start and End columns.")
             self.toi_df = df.sort_values(by=["Start", "End"]).reset_index(drop=True)
             self.toi_records = self.toi_df.to_dict("records")
+            self._invalidate_profiles()
             self.timeline.set_data(self.total_frames / max(1e-6, self.fps), self.toi_df)
             self.show_frame()
         except Exception as exc:
@@ -1225,22 +2631,23 @@ class RegionView:
         self.slider.set(self.current_frame)
         self.show_frame()
 
+    def _compiled_profiles(self):
+        """Effective profiles of every TOI, rebuilt after _invalidate_profiles."""
+        if self._compiled is None:
+            self._compiled = CompiledTOIProfiles(
+                self.current_profile, self.toi_records, self.toi_rule_overrides,
+                self.fps, self.total_frames,
+            )
+        return self._compiled
+
+    def _invalidate_profiles(self):
+        self._compiled = None
+
     def _active_toi_for_frame(self, frame_idx):
         if not self.toi_records:
             return None, None
-        sec = frame_idx / max(1e-6, self.fps)
-        match = None
-        match_idx = None
-        for idx, row in enumerate(self.toi_records):
-            try:
-                s = float(row.get("Start", -1))
-                e = float(row.get("End", -1))
-            except Exception:
-                continue
-            if s <= sec <= e:
-                match = row
-                match_idx = idx  # last match wins
-        return match, match_idx
+        idx = self._compiled_profiles().toi_index(frame_idx)
+        return (self.toi_records[idx], idx) if idx is not None else (None, None)
 
     def _toi_frame_range(self, toi_row):
         if not toi_row:
@@ -1273,26 +2680,11 @@ class RegionView:
         self.show_frame()
 
     def _effective_profile_for_frame(self, frame_idx):
-        prof = copy.deepcopy(self.current_profile)
-        _row, toi_idx = self._active_toi_for_frame(frame_idx)
-        if toi_idx is None:
-            return prof
-        toi_map = self.toi_rule_overrides.get(str(toi_idx), {})
-        if not toi_map:
-            return prof
-        roles = prof.get("roles", {})
-        for role_name, idx_map in toi_map.items():
-            role_rules = roles.get(role_name)
-            if not isinstance(role_rules, list):
-                continue
-            for idx_key, changes in idx_map.items():
-                try:
-                    ridx = int(idx_key)
-                except Exception:
-                    continue
-                if 0 <= ridx < len(role_rules):
-                    role_rules[ridx].update(changes)
-        return prof
+        """Read-only effective profile of a frame (shared, never copy-on-read)."""
+        return self._compiled_profiles().profile_for_frame(frame_idx)
+
+    def _effective_profile_for_toi(self, toi_idx):
+        return self._compiled_profiles().profile_for_toi(toi_idx)
 
     def _update_toi_labels(self):
         sec = self.current_frame / max(1e-6, self.fps) if self.fps > 0 else 0.0
@@ -1307,25 +2699,23 @@ class RegionView:
         else:
             self.lbl_toi.config(text="TOI: n/a")
 
-    def _apply_manual_box_with_scope(self, item, box):
+    def _edit_scope_range(self):
+        """Frames (first, last) covered by the current edit scope."""
         scope = self.edit_scope_var.get()
-        box = self.logic._sanitize_box(box)
-        targets = []
-
-        if scope == "Whole Video":
-            targets = list(range(self.total_frames))
-        elif scope == "Current TOI":
+        if scope == "Whole Video" and self.total_frames > 0:
+            return 0, self.total_frames - 1
+        if scope == "Current TOI":
             row, _idx = self._active_toi_for_frame(self.current_frame)
             rng = self._toi_frame_range(row)
             if rng:
-                targets = list(range(rng[0], rng[1] + 1))
-        if not targets:
-            targets = [self.current_frame]
+                return rng
+        return self.current_frame, self.current_frame
 
-        for f_idx in targets:
-            self.logic.set_manual_override(
-                f_idx, item["track_id"], item["role"], item["aoi"], box
-            )
+    def _apply_manual_box_with_scope(self, item, box):
+        first, last = self._edit_scope_range()
+        self.logic.set_manual_override_range(
+            first, last, item["track_id"], item["role"], item["aoi"], self.logic._sanitize_box(box)
+        )
 
     # ── Profile Wizard ──────────────────────────────────────────
 
@@ -1857,20 +3247,8 @@ class RegionView:
             return
 
         before = self._snapshot_edit_state()
-        scope = self.edit_scope_var.get()
-        if scope == "Whole Video":
-            for f_idx in range(self.total_frames):
-                self.logic.clear_manual_override(f_idx, item["track_id"], item["role"], item["aoi"])
-        elif scope == "Current TOI":
-            row, _idx = self._active_toi_for_frame(self.current_frame)
-            rng = self._toi_frame_range(row)
-            if rng:
-                for f_idx in range(rng[0], rng[1] + 1):
-                    self.logic.clear_manual_override(f_idx, item["track_id"], item["role"], item["aoi"])
-            else:
-                self.logic.clear_manual_override(self.current_frame, item["track_id"], item["role"], item["aoi"])
-        else:
-            self.logic.clear_manual_override(self.current_frame, item["track_id"], item["role"], item["aoi"])
+        first, last = self._edit_scope_range()
+        self.logic.clear_manual_override_range(first, last, item["track_id"], item["role"], item["aoi"])
         self.show_frame()
         self._commit_action("Clear selected override", before)
 
@@ -1879,19 +3257,10 @@ class RegionView:
             messagebox.showinfo("Manual Mode", "Enable Manual Correction mode to clear overrides.")
             return
         before = self._snapshot_edit_state()
-        scope = self.edit_scope_var.get()
-        if scope == "Whole Video":
-            self.logic.manual_overrides = {}
-        elif scope == "Current TOI":
-            row, _idx = self._active_toi_for_frame(self.current_frame)
-            rng = self._toi_frame_range(row)
-            if rng:
-                for f_idx in range(rng[0], rng[1] + 1):
-                    self.logic.clear_overrides_for_frame(f_idx)
-            else:
-                self.logic.clear_overrides_for_frame(self.current_frame)
+        if self.edit_scope_var.get() == "Whole Video":
+            self.logic.replace_manual_overrides(OverrideStore())
         else:
-            self.logic.clear_overrides_for_frame(self.current_frame)
+            self.logic.clear_overrides_range(*self._edit_scope_range())
         self.show_frame()
         self._commit_action("Clear overrides by scope", before)
 
@@ -1980,18 +3349,28 @@ class RegionView:
             if toi_idx is None:
                 messagebox.showwarning("No TOI", "No active TOI at current frame. Switch scope to Whole Video.")
                 return
-            toi_map = self.toi_rule_overrides.setdefault(str(toi_idx), {})
-            role_map = toi_map.setdefault(role, {})
-            idx_map = role_map.setdefault(str(idx), {})
-            idx_map[key] = val
+            # Path-copy: history snapshots keep sharing the old maps.
+            toi_map = dict(self.toi_rule_overrides.get(str(toi_idx), {}))
+            role_map = dict(toi_map.get(role, {}))
+            role_map[str(idx)] = {**role_map.get(str(idx), {}), key: val}
+            toi_map[role] = role_map
+            self.toi_rule_overrides = {**self.toi_rule_overrides, str(toi_idx): toi_map}
         else:
-            self.current_profile["roles"][role][idx][key] = val
+            roles = dict(self.current_profile["roles"])
+            rules = list(roles[role])
+            rules[idx] = {**rules[idx], key: val}
+            roles[role] = rules
+            self.current_profile = {**self.current_profile, "roles": roles}
             # Reset any TOI-specific override for this exact key so whole-video stays authoritative.
-            for toi_map in self.toi_rule_overrides.values():
-                role_map = toi_map.get(role, {})
-                idx_map = role_map.get(str(idx), {})
+            toi_overrides = {}
+            for toi_key, toi_map in self.toi_rule_overrides.items():
+                idx_map = toi_map.get(role, {}).get(str(idx), {})
                 if key in idx_map:
-                    del idx_map[key]
+                    idx_map = {k: v for k, v in idx_map.items() if k != key}
+                    toi_map = {**toi_map, role: {**toi_map[role], str(idx): idx_map}}
+                toi_overrides[toi_key] = toi_map
+            self.toi_rule_overrides = toi_overrides
+        self._invalidate_profiles()
         self.show_frame()
         self._commit_action(f"Update rule {role}[{idx}] {key}", before)
 
@@ -1999,7 +3378,8 @@ class RegionView:
         before = self._snapshot_edit_state()
         self.current_profile = self.pm.load_profile(self.cb_profile.get())
         self.toi_rule_overrides = {}
-        self.logic.manual_overrides = {}
+        self.logic.replace_manual_overrides(OverrideStore())
+        self._invalidate_profiles()
         self.undo_stack.clear()
         self.redo_stack.clear()
         self._update_history_buttons()
@@ -2016,6 +3396,72 @@ class RegionView:
         )
         print("\n" + report + "\n")
 
+    def run_coverage(self):
+        if not self.logic.has_pose_data():
+            messagebox.showwarning("No Data", "Load pose data first.")
+            return
+        compiled = self._compiled_profiles()
+        thresh = self.kp_conf_thresh.get()
+
+        def _worker():
+            try:
+                report = self.logic.get_coverage_report(
+                    compiled.profile_for_toi(None), thresh,
+                    profile_for_frame_fn=lambda f_idx, _p: compiled.profile_for_frame(f_idx),
+                )
+                self.parent.after(0, lambda: self._show_coverage(report))
+            except Exception as exc:
+                err_msg = str(exc)
+                self.parent.after(0, lambda: messagebox.showerror("Coverage Error", err_msg))
+
+        threading.Thread(target=_worker, daemon=True).start()
+
+    def _show_coverage(self, report):
+        print("\n" + self.logic.format_coverage_report(report) + "\n")
+        items = sorted(report["items"], key=lambda it: (it["coverage"], it["role"], it["aoi"]))
+        if not items:
+            messagebox.showinfo("Coverage", "No AOI rules for the mapped roles.")
+            return
+
+        win = tk.Toplevel(self.parent)
+        win.title(f"AOI Coverage ({report['frames']} frames)")
+        win.geometry("520x420")
+        tk.Label(win, text="Select an AOI to show its coverage on the timeline; "
+                           "double-click a gap to jump to it.", fg="gray").pack(pady=4)
+        panes = tk.PanedWindow(win, orient=tk.VERTICAL)
+        panes.pack(fill=tk.BOTH, expand=True, padx=6, pady=4)
+        lb_items = tk.Listbox(panes, font=("Consolas", 10), exportselection=False)
+        lb_runs = tk.Listbox(panes, font=("Consolas", 10), exportselection=False)
+        panes.add(lb_items, height=180)
+        panes.add(lb_runs)
+        for it in items:
+            lb_items.insert(tk.END, f"{it['coverage']:6.1f}%  {it['role']}:{it['aoi']}  ({len(it['runs'])} gaps)")
+
+        fps = max(1e-6, self.fps)
+        shown = []
+
+        def _select(_e=None):
+            sel = lb_items.curselection()
+            if not sel:
+                return
+            it = items[sel[0]]
+            self.timeline.set_coverage(it["status"])
+            shown[:] = sorted(it["runs"], key=lambda run: run[0] - run[1])
+            lb_runs.delete(0, tk.END)
+            for first, last, cause in shown:
+                lb_runs.insert(tk.END, f"{first / fps:9.2f}s  {last - first + 1:6d} fr  {cause}")
+
+        def _jump(_e=None):
+            sel = lb_runs.curselection()
+            if sel:
+                self.seek_relative(shown[sel[0]][0] - self.current_frame)
+
+        lb_items.bind("<<ListboxSelect>>", _select)
+        lb_runs.bind("<Double-Button-1>", _jump)
+        win.protocol("WM_DELETE_WINDOW", lambda: (self.timeline.set_coverage(None), win.destroy()))
+        lb_items.selection_set(0)
+        _select()
+
     # ── Data Loading (thin wrappers) ────────────────────────────
 
     def browse_video(self):
@@ -2033,6 +3479,7 @@ class RegionView:
         self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
         self.logic.fps = self.fps
         self.logic.total_frames = self.total_frames
+        self._invalidate_profiles()
         self.slider.config(to=self.total_frames - 1)
         self.timeline.set_data(self.total_frames / max(1e-6, self.fps), self.toi_df)
         self.show_frame()
@@ -2198,11 +3645,8 @@ class RegionView:
             return
         self._orig_h, self._orig_w = frame.shape[:2]
 
-        # Delegate all geometry to Logic
-        prof = self._effective_profile_for_frame(self.current_frame)
-        items = self.logic.get_render_data(
-            self.current_frame, prof, self.kp_conf_thresh.get()
-        )
+        # Delegate all geometry to Logic (through the per-frame cache)
+        items = self._cached_render_data(self.current_frame)
         for item in items:
             x1, y1, x2, y2 = item["box"]
             c = item["color"]
@@ -2246,6 +3690,82 @@ class RegionView:
             text=f"Frame {self.current_frame}/{max(0, self.total_frames - 1)} | {sec:.3f}s | FPS {self.fps:.2f} | Manual {'ON' if self.manual_mode else 'OFF'}"
         )
 
+    # ── AOI Cache ───────────────────────────────────────────────
+
+    def _profile_signature(self, toi_idx):
+        """Digest of the effective profile of a TOI (None = no TOI)."""
+        return self._compiled_profiles().signature_for_toi(toi_idx)
+
+    def _aoi_cache_key(self, frame_idx, signature, thresh):
+        return (int(frame_idx), signature, thresh,
+                self.logic.override_revision(frame_idx), self.logic.data_version)
+
+    def _cached_render_data(self, frame_idx):
+        _row, toi_idx = self._active_toi_for_frame(frame_idx)
+        thresh = float(self.kp_conf_thresh.get())
+        key = self._aoi_cache_key(frame_idx, self._profile_signature(toi_idx), thresh)
+        items = self.aoi_cache.get(key)
+        if items is None:
+            prof = self._effective_profile_for_toi(toi_idx)
+            items = self.logic.get_render_data(frame_idx, prof, thresh)
+            self.aoi_cache.put(key, items)
+        self._schedule_prefill(key)
+        return items
+
+    def _schedule_prefill(self, current_key):
+        """Queue the uncached frames around the playhead for the prefill thread."""
+        if not self.logic.has_pose_data():
+            return
+        # Re-scan the window only after an edit or once the playhead has moved on.
+        stamp = current_key[1:] + (self.logic._rev_counter,)
+        if (self._prefill_stamp is not None and self._prefill_stamp[1:] == stamp
+                and abs(self.current_frame - self._prefill_stamp[0]) < self.PREFILL_AHEAD // 4):
+            return
+        self._prefill_stamp = (self.current_frame,) + stamp
+        last = self.total_frames - 1 if self.total_frames > 0 else self.current_frame + self.PREFILL_AHEAD
+        ahead = range(self.current_frame + 1, min(last, self.current_frame + self.PREFILL_AHEAD) + 1)
+        behind = range(self.current_frame - 1, max(0, self.current_frame - self.PREFILL_BEHIND) - 1, -1)
+        thresh = float(self.kp_conf_thresh.get())
+
+        signatures, groups = {}, {}
+        for f in list(ahead) + list(behind):
+            _row, toi_idx = self._active_toi_for_frame(f)
+            if toi_idx not in signatures:
+                signatures[toi_idx] = self._profile_signature(toi_idx)
+            key = self._aoi_cache_key(f, signatures[toi_idx], thresh)
+            if key not in self.aoi_cache:
+                groups.setdefault(toi_idx, []).append(key)
+        if not groups:
+            return
+
+        # Compiled profiles are read-only, so the worker can share them.
+        self._prefill_jobs = [(self._effective_profile_for_toi(t), keys) for t, keys in groups.items()]
+        self._prefill_wakeup.set()
+        if self._prefill_thread is None:
+            self._prefill_thread = threading.Thread(target=self._prefill_loop, daemon=True)
+            self._prefill_thread.start()
+
+    def _prefill_loop(self):
+        while True:
+            self._prefill_wakeup.wait()
+            self._prefill_wakeup.clear()
+            jobs, self._prefill_jobs = self._prefill_jobs, None
+            for prof, keys in jobs or []:
+                for start in range(0, len(keys), self.PREFILL_BLOCK):
+                    if self._prefill_wakeup.is_set():
+                        break  # the playhead moved: serve the newer request first
+                    block = keys[start:start + self.PREFILL_BLOCK]
+                    try:
+                        items = self.logic.get_frames_render_data([k[0] for k in block], prof, block[0][2])
+                    except Exception as exc:
+                        print(f"AOI prefill failed: {exc}")
+                        break
+                    for key in block:
+                        self.aoi_cache.put(key, items[key[0]])
+                else:
+                    continue
+                break
+
     # ── Playback ────────────────────────────────────────────────
 
     def on_seek(self, v):
@@ -2277,20 +3797,26 @@ class RegionView:
     # ── Export (threaded) ───────────────────────────────────────
 
     def export_data(self):
-        if not self.logic.pose_data:
+        if not self.logic.has_pose_data():
             messagebox.showwarning("No Data", "Load pose data first.")
             return
-        out = filedialog.asksaveasfilename(defaultextension=".csv")
+        filetypes = [("CSV", "*.csv")]
+        if pq is not None:
+            filetypes.append(("Parquet", "*.parquet"))
+        out = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=filetypes)
         if not out:
             return
         self.context.export_path = out
 
+        # Snapshot on the UI thread: later edits do not leak into a running export.
+        compiled = self._compiled_profiles()
+
         def _worker():
             try:
                 count = self.logic.export_csv(
-                    out, self.current_profile, self.kp_conf_thresh.get(),
+                    out, compiled.profile_for_toi(None), self.kp_conf_thresh.get(),
                     progress_callback=lambda m: print(m),
-                    profile_for_frame_fn=lambda f_idx, _p: self._effective_profile_for_frame(f_idx),
+                    profile_for_frame_fn=lambda f_idx, _p: compiled.profile_for_frame(f_idx),
                 )
                 self.parent.after(0, lambda: self._on_export_done(out, count))
             except Exception as exc:
@@ -2299,6 +3825,58 @@ class RegionView:
 
         threading.Thread(target=_worker, daemon=True).start()
 
+    def export_profiles_dialog(self):
+        if not self.logic.has_pose_data():
+            messagebox.showwarning("No Data", "Load pose data first.")
+            return
+        names = self.pm.list_profiles()
+        if not names:
+            messagebox.showwarning("No Profiles", "No saved AOI profiles to export.")
+            return
+
+        win = tk.Toplevel(self.parent)
+        win.title("Export Several Profiles")
+        win.geometry("420x420")
+        tk.Label(win, text="Profiles to export (one file each, single pass):").pack(pady=(10, 4))
+        lb = tk.Listbox(win, selectmode=tk.MULTIPLE, exportselection=False)
+        lb.pack(fill=tk.BOTH, expand=True, padx=10)
+        for name in names:
+            lb.insert(tk.END, name)
+
+        def _go():
+            chosen = [names[i] for i in lb.curselection()]
+            if not chosen:
+                messagebox.showwarning("Nothing Selected", "Select at least one profile.", parent=win)
+                return
+            filetypes = [("CSV", "*.csv")]
+            if pq is not None:
+                filetypes.append(("Parquet", "*.parquet"))
+            base = filedialog.asksaveasfilename(parent=win, defaultextension=".csv", filetypes=filetypes,
+                                                title="Base name (the profile name is appended)")
+            if not base:
+                return
+            stem, ext = os.path.splitext(base)
+            outputs = [(f"{stem}_{os.path.splitext(name)[0]}{ext or '.csv'}", self.pm.load_profile(name))
+                       for name in chosen]
+            win.destroy()
+            self._run_profiles_export(outputs)
+
+        tk.Button(win, text="EXPORT", bg="#4CAF50", fg="white", command=_go).pack(fill=tk.X, padx=10, pady=10)
+
+    def _run_profiles_export(self, outputs):
+        thresh = self.kp_conf_thresh.get()
+
+        def _worker():
+            try:
+                counts = self.logic.export_profiles(outputs, thresh, progress_callback=lambda m: print(m))
+                summary = "\n".join(f"{os.path.basename(p)}: {n} rows" for p, n in counts.items())
+                self.parent.after(0, lambda: messagebox.showinfo("OK", f"Export complete:\n{summary}"))
+            except Exception as exc:
+                err_msg = str(exc)
+                self.parent.after(0, lambda: messagebox.showerror("Export Error", err_msg))
+
+        threading.Thread(target=_worker, daemon=True).start()
+
     def _on_export_done(self, path, count):
         self.context.aoi_csv_path = path
         messagebox.showinfo("OK", f"Export complete: {count} rows.")
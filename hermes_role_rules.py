@@ -0,0 +1,272 @@
+"""
+Rule language for bulk role assignment in Entity.
+
+A rule set is plain text, one rule per line::
+
+    # comment
+    Noise:  dur < 0.5
+    Ignore: inside(1210, 80, 1900, 620)
+    Target: cx < W / 2 and during(0, 600)
+
+Each rule is ``<role>: <condition>``. Rules are tried in order and the first
+one whose condition holds gives the track its role; tracks matching no rule
+are left alone.
+
+Conditions are evaluated once over the per-track summary arrays of the whole
+session (``IdentityLogic.get_track_summary``), never per track. They use a
+small, safe subset of Python expression syntax: numbers, strings, the fields
+below, ``+ - * /``, comparisons (chains such as ``0.2 < cx / W < 0.5``
+included), ``and`` / ``or`` / ``not``, parentheses and the region / time
+functions below. Every rule, and every operand of ``and`` / ``or`` / ``not``,
+must be a comparison or a function call; ``role`` only compares to strings
+with ``==`` / ``!=``. Anything else is rejected when the rules are parsed.
+
+Fields (pixels and seconds)
+---------------------------
+cx, cy      centre of the mean box
+w, h, area  mean box width, height and area
+x1, y1, x2, y2
+            extent of every box of the track
+start, end, dur
+            first / last detection time and duration
+n           number of detections
+merged      number of original tracker IDs in the track
+role        current role (string)
+W, H        video frame size (0 when unknown)
+
+Functions
+---------
+center_in(x1, y1, x2, y2)   the mean box centre is inside the rectangle
+inside(x1, y1, x2, y2)      every box of the track is inside the rectangle
+overlaps(x1, y1, x2, y2)    the track extent touches the rectangle
+during(t0, t1)              the track lies entirely within [t0, t1] s
+active(t0, t1)              the track is visible at some point of [t0, t1] s
+"""
+
+import ast
+import functools
+import operator
+
+import numpy as np
+
+
+# ═══════════════════════════════════════════════════════════════════
+# CONSTANTS
+# ═══════════════════════════════════════════════════════════════════
+
+FIELDS = ("cx", "cy", "w", "h", "area", "x1", "y1", "x2", "y2",
+          "start", "end", "dur", "n", "merged", "role", "W", "H")
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+_COMPARE = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+
+def _center_in(f, x1, y1, x2, y2):
+    return (f["cx"] >= x1) & (f["cx"] <= x2) & (f["cy"] >= y1) & (f["cy"] <= y2)
+
+
+def _inside(f, x1, y1, x2, y2):
+    return (f["x1"] >= x1) & (f["y1"] >= y1) & (f["x2"] <= x2) & (f["y2"] <= y2)
+
+
+def _overlaps(f, x1, y1, x2, y2):
+    return (f["x2"] >= x1) & (f["x1"] <= x2) & (f["y2"] >= y1) & (f["y1"] <= y2)
+
+
+def _during(f, t0, t1):
+    return (f["start"] >= t0) & (f["end"] <= t1)
+
+
+def _active(f, t0, t1):
+    return (f["end"] >= t0) & (f["start"] <= t1)
+
+
+_FUNCTIONS = {
+    "center_in": (_center_in, 4),
+    "inside": (_inside, 4),
+    "overlaps": (_overlaps, 4),
+    "during": (_during, 2),
+    "active": (_active, 2),
+}
+
+
+# ═══════════════════════════════════════════════════════════════════
+# PARSING
+# ═══════════════════════════════════════════════════════════════════
+
+def _kind(node, line_no):
+    """Type of a condition sub-expression: 'bool', 'num' or 'str'."""
+    def fail(msg):
+        raise ValueError(f"Line {line_no}: {msg}")
+
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, str):
+            return "str"
+        if isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return "num"
+        fail(f"unsupported constant {node.value!r}")
+    if isinstance(node, ast.Name):
+        if node.id in _FUNCTIONS:
+            fail(f"{node.id}() is a function, call it with arguments")
+        if node.id not in FIELDS:
+            fail(f"unknown field '{node.id}'")
+        return "str" if node.id == "role" else "num"
+    if isinstance(node, ast.BoolOp):
+        for value in node.values:
+            _check_condition(value, line_no)
+        return "bool"
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        _check_condition(node.operand, line_no)
+        return "bool"
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        if _kind(node.operand, line_no) != "num":
+            fail("'-' needs a number")
+        return "num"
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        if _kind(node.left, line_no) != "num" or _kind(node.right, line_no) != "num":
+            fail("arithmetic needs numbers")
+        return "num"
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+        kinds = [_kind(v, line_no) for v in [node.left, *node.comparators]]
+        if "bool" in kinds:
+            fail("comparisons take numbers or strings, not conditions")
+        if "str" in kinds:
+            if any(k != "str" for k in kinds):
+                fail("cannot compare a string with a number")
+            if any(not isinstance(op, (ast.Eq, ast.NotEq)) for op in node.ops):
+                fail("strings only support == and !=")
+        return "bool"
+    if isinstance(node, ast.Call):
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if name not in _FUNCTIONS or node.keywords:
+            fail("unsupported function call")
+        if len(node.args) != _FUNCTIONS[name][1]:
+            fail(f"{name}() takes {_FUNCTIONS[name][1]} arguments")
+        if any(_kind(a, line_no) != "num" for a in node.args):
+            fail(f"{name}() takes numbers")
+        return "bool"
+    fail(f"unsupported syntax ({type(node).__name__})")
+
+
+def _check_condition(node, line_no):
+    """Reject anything that is not a boolean condition of the rule language."""
+    if _kind(node, line_no) != "bool":
+        raise ValueError(f"Line {line_no}: expected a condition (a comparison, "
+                         f"a function call, and / or / not), not a value")
+
+
+def parse_rules(text):
+    """
+    Parse a rule set.
+
+    Parameters
+    ----------
+    text : str
+        Rule text (see the module docstring).
+
+    Returns
+    -------
+    list[tuple[str, str, ast.Expression]]
+        (role, condition source, parsed condition) in rule order.
+
+    Raises
+    ------
+    ValueError
+        On the first malformed line.
+    """
+    rules = []
+    for line_no, raw in enumerate(text.splitlines(), start=1):
+        line = raw.split("#", 1)[0].strip()
+        if not line:
+            continue
+        role, sep, cond = line.partition(":")
+        role, cond = role.strip(), cond.strip()
+        if not sep or not role or not cond:
+            raise ValueError(f"Line {line_no}: expected '<role>: <condition>'")
+        try:
+            tree = ast.parse(cond, mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"Line {line_no}: {e.msg}") from None
+        _check_condition(tree.body, line_no)
+        rules.append((role, cond, tree))
+    return rules
+
+
+def uses_frame_size(rules):
+    """True if any rule of a ``parse_rules`` result refers to W or H."""
+    return any(isinstance(node, ast.Name) and node.id in ("W", "H")
+               for _, _, tree in rules for node in ast.walk(tree))
+
+
+# ═══════════════════════════════════════════════════════════════════
+# EVALUATION
+# ═══════════════════════════════════════════════════════════════════
+
+def _eval(node, f):
+    if isinstance(node, ast.Expression):
+        return _eval(node.body, f)
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        if node.id not in f:
+            raise ValueError(f"'{node.id}' is a function, call it with arguments")
+        return f[node.id]
+    if isinstance(node, ast.BoolOp):
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return functools.reduce(combine, [_eval(v, f) for v in node.values])
+    if isinstance(node, ast.UnaryOp):
+        value = _eval(node.operand, f)
+        return np.logical_not(value) if isinstance(node.op, ast.Not) else -value
+    if isinstance(node, ast.BinOp):
+        return _BINARY[type(node.op)](_eval(node.left, f), _eval(node.right, f))
+    if isinstance(node, ast.Compare):
+        left = _eval(node.left, f)
+        result = True
+        for op, comp in zip(node.ops, node.comparators):
+            right = _eval(comp, f)
+            result = np.logical_and(result, _COMPARE[type(op)](left, right))
+            left = right
+        return result
+    if isinstance(node, ast.Call):
+        func = _FUNCTIONS[node.func.id][0]
+        return func(f, *[_eval(a, f) for a in node.args])
+    raise ValueError(f"Unsupported syntax ({type(node).__name__})")
+
+
+def evaluate_rules(rules, fields, n):
+    """
+    Index of the first rule matching each track.
+
+    Parameters
+    ----------
+    rules : list
+        Output of ``parse_rules``.
+    fields : dict[str, ndarray | float]
+        One array of length ``n`` per track field, scalars for W / H.
+    n : int
+        Number of tracks.
+
+    Returns
+    -------
+    ndarray[int64] (n,)
+        Rule index, -1 where no rule matches.
+    """
+    choice = np.full(n, -1, dtype=np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for k in range(len(rules) - 1, -1, -1):
+            match = np.broadcast_to(np.asarray(_eval(rules[k][2], fields), dtype=bool), (n,))
+            choice[match] = k
+    return choice